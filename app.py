@@ -1,6 +1,6 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.responses import HTMLResponse, RedirectResponse
@@ -8,9 +8,21 @@ from uvicorn import run as app_run
 
 
 from heart_stroke.constant.application import APP_HOST, APP_PORT
+from heart_stroke.entity.config_entity import (ExecutorConfig,
+                                               MicroBatcherConfig,
+                                               ModelPusherConfig,
+                                               ModelReloaderConfig,
+                                               TrainingJobConfig)
+from heart_stroke.entity.model_registry import ModelRegistry
+from heart_stroke.logger import logging
+from heart_stroke.pipeline.micro_batcher import MicroBatcher
+from heart_stroke.pipeline.model_reloader import ModelReloader
 from heart_stroke.pipeline.prediction_pipeline import (HeartData,
                                                        HeartStrokeClassifier)
-from heart_stroke.pipeline.train_pipeline import TrainPipeline
+from heart_stroke.pipeline.training_jobs import (TrainingJobManager,
+                                                 TrainingJobRunningError)
+from heart_stroke.utils.bounded_executor import (BoundedExecutor,
+                                                 ExecutorSaturatedError)
 
 app = FastAPI()
 
@@ -18,6 +30,32 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 templates = Jinja2Templates(directory='templates')
 
+model_predictor = HeartStrokeClassifier()
+
+executor_config = ExecutorConfig()
+
+inference_executor = BoundedExecutor(max_workers=executor_config.inference_workers,
+                                     max_pending=executor_config.inference_max_pending,
+                                     name="inference")
+
+training_job_manager = TrainingJobManager(training_job_config=TrainingJobConfig())
+
+model_pusher_config = ModelPusherConfig()
+
+model_registry = ModelRegistry(bucket_name=model_pusher_config.bucket_name,
+                               registry_key=model_pusher_config.registry_key)
+
+micro_batcher_config = MicroBatcherConfig()
+
+micro_batcher = MicroBatcher(predict_fn=model_predictor.predict_labels,
+                             executor=inference_executor,
+                             micro_batcher_config=micro_batcher_config)
+
+model_reloader_config = ModelReloaderConfig()
+
+model_reloader = ModelReloader(model_cache=model_predictor.model_cache,
+                               model_reloader_config=model_reloader_config)
+
 origins = ["*"]
 
 app.add_middleware(
@@ -56,6 +94,31 @@ class DataForm:
         self.smoking_status = form.get("smoking_status")
         self.bmi = form.get("bmi")
 
+@app.on_event("startup")
+async def load_model():
+    try:
+        await inference_executor.run(model_predictor.get_model)
+    except Exception as e:
+        logging.info(f"Model could not be loaded at startup: {e}")
+    if micro_batcher_config.enabled:
+        await micro_batcher.start()
+    if model_reloader_config.enabled:
+        await model_reloader.start()
+
+
+@app.on_event("shutdown")
+async def stop_micro_batcher():
+    await model_reloader.stop()
+    await micro_batcher.stop()
+    inference_executor.shutdown(wait=False)
+    training_job_manager.shutdown()
+
+
+@app.get("/metrics")
+async def metricsRouteClient():
+    return {"micro_batcher": micro_batcher.metrics.snapshot(), "model_reloader": model_reloader.metrics.snapshot()}
+
+
 @app.get("/", tags=["authentication"])
 async def index(request: Request):
 
@@ -64,18 +127,79 @@ async def index(request: Request):
 
 
 @app.get("/train")
+@app.post("/train")
 async def trainRouteClient():
     try:
-        train_pipeline = TrainPipeline()
+        training_job = training_job_manager.submit()
 
-        train_pipeline.run_pipeline()
+        return JSONResponse(status_code=202, content={"status": True, "job_id": training_job.job_id})
 
-        return Response("Training successful !!")
+    except TrainingJobRunningError as e:
+        return JSONResponse(status_code=409, content={"status": False, "error": f"{e}"})
 
     except Exception as e:
         return Response(f"Error Occurred! {e}")
 
 
+@app.get("/train/jobs")
+async def trainingJobsRouteClient():
+    return {"jobs": [training_job.to_dict() for training_job in training_job_manager.list_jobs()]}
+
+
+@app.get("/train/{job_id}")
+async def trainingJobStatusRouteClient(job_id: str):
+    training_job = training_job_manager.get_job(job_id)
+    if training_job is None:
+        return JSONResponse(status_code=404, content={"status": False, "error": f"Unknown job id {job_id}"})
+    return training_job.to_dict()
+
+
+@app.get("/train/{job_id}/progress")
+async def trainingJobProgressRouteClient(job_id: str):
+    training_job = training_job_manager.get_job(job_id)
+    if training_job is None:
+        return JSONResponse(status_code=404, content={"status": False, "error": f"Unknown job id {job_id}"})
+    return training_job.progress()
+
+
+@app.get("/model/versions")
+async def modelVersionsRouteClient():
+    try:
+        current = await inference_executor.run(model_registry.get_current)
+        versions = await inference_executor.run(model_registry.list_versions)
+        return {"status": True, "current": current, "versions": versions}
+
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"status": False, "error": f"{e}"})
+
+
+def get_legacy_keys() -> dict:
+    if not model_pusher_config.update_legacy_key:
+        return {}
+    return {"legacy_s3_model_key": model_pusher_config.s3_model_key_path,
+            "legacy_s3_portable_model_key": model_pusher_config.s3_portable_model_key_path}
+
+
+@app.post("/model/promote/{version}")
+async def modelPromoteRouteClient(version: str):
+    try:
+        pointer = await inference_executor.run(model_registry.promote, version, **get_legacy_keys())
+        return {"status": True, "current": pointer}
+
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"status": False, "error": f"{e}"})
+
+
+@app.post("/model/rollback")
+async def modelRollbackRouteClient():
+    try:
+        pointer = await inference_executor.run(model_registry.rollback, **get_legacy_keys())
+        return {"status": True, "current": pointer}
+
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"status": False, "error": f"{e}"})
+
+
 @app.post("/")
 async def predictRouteClient(request: Request):
     try:
@@ -95,19 +219,40 @@ async def predictRouteClient(request: Request):
                                    )
         
         stroke_data_df = heart_stroke_data.get_heart_stroke_input_data_frame()
-        
-        model_predictor = HeartStrokeClassifier()
 
-        stroke_value = model_predictor.predict(dataframe=stroke_data_df)
+        if micro_batcher_config.enabled:
+            stroke_value = (await micro_batcher.predict(stroke_data_df))[0]
+        else:
+            stroke_value = await inference_executor.run(model_predictor.predict, dataframe=stroke_data_df)
 
         return templates.TemplateResponse(
             "index.html",
             {"request": request, "context": stroke_value},
         )
+
+    except ExecutorSaturatedError as e:
+        return JSONResponse(status_code=503, content={"status": False, "error": f"{e}"})
         
     except Exception as e:
         return {"status": False, "error": f"{e}"}
 
 
+@app.post("/predict/batch")
+async def batchPredictRouteClient(request: Request):
+    try:
+        payload = await request.json()
+        records = payload.get("records") if isinstance(payload, dict) else payload
+
+        predictions = await inference_executor.run(model_predictor.predict_batch, records=records)
+
+        return {"status": True, "predictions": predictions}
+
+    except ExecutorSaturatedError as e:
+        return JSONResponse(status_code=503, content={"status": False, "error": f"{e}"})
+
+    except Exception as e:
+        return {"status": False, "error": f"{e}"}
+
+
 if __name__ == "__main__":
     app_run(app, host=APP_HOST, port=APP_PORT)
@@ -0,0 +1,96 @@
+"""
+Compare the sklearn preprocessor of HeartStrokeModel with its compiled NumPy kernel: single row
+p50 / p99 latency, batch throughput and the largest absolute difference of the two outputs.
+
+usage: python benchmarks/inference_benchmark.py [--model-file artifact/<run>/model_trainer/trained_model/model.pkl
+                                                 --data-file artifact/<run>/data_ingestion/ingested/test.parquet]
+
+Without --model-file a preprocessor is fitted on synthetic rows shaped like the heart stroke data.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from heart_stroke.components.data_transformation import DataTransformation
+from heart_stroke.constant.training_pipeline import TARGET_COLUMN
+from heart_stroke.entity.compiled_preprocessor import compile_preprocessor
+from heart_stroke.entity.config_entity import DataTransformationConfig
+from heart_stroke.utils.main_utils import load_object, read_dataframe
+
+
+def make_dataframe(n_samples: int) -> pd.DataFrame:
+    random_state = np.random.RandomState(42)
+    dataframe = pd.DataFrame({
+        "gender": random_state.choice(["Male", "Female"], n_samples),
+        "age": random_state.randint(1, 90, n_samples),
+        "hypertension": random_state.randint(0, 2, n_samples),
+        "heart_disease": random_state.randint(0, 2, n_samples),
+        "ever_married": random_state.choice(["Yes", "No"], n_samples),
+        "work_type": random_state.choice(["Private", "Self-employed", "Govt_job", "children", "Never_worked"],
+                                         n_samples),
+        "Residence_type": random_state.choice(["Urban", "Rural"], n_samples),
+        "avg_glucose_level": random_state.lognormal(4.6, 0.35, n_samples),
+        "bmi": random_state.normal(28.0, 7.0, n_samples),
+        "smoking_status": random_state.choice(["formerly smoked", "never smoked", "smokes", "Unknown"],
+                                              n_samples),
+    })
+    dataframe.loc[random_state.rand(n_samples) < 0.04, "bmi"] = np.nan
+    return dataframe
+
+
+def load_preprocessor_and_data(args: argparse.Namespace):
+    if args.model_file is not None:
+        preprocessor = load_object(args.model_file).preprocessing_object
+        dataframe = read_dataframe(args.data_file).drop(columns=[TARGET_COLUMN], errors="ignore")
+        return preprocessor, dataframe
+    dataframe = make_dataframe(args.n_samples)
+    preprocessor = DataTransformation(data_ingestion_artifact=None,
+                                      data_transformation_config=DataTransformationConfig(),
+                                      data_validation_artifact=None).get_data_transformer_object()
+    return preprocessor.fit(dataframe), dataframe
+
+
+def to_dense(array) -> np.array:
+    return array.toarray() if hasattr(array, "toarray") else np.asarray(array)
+
+
+def time_single_rows(transform, records, n_rows: int) -> np.array:
+    latencies = []
+    for record in records[:n_rows]:
+        started_at = time.perf_counter()
+        transform(record)
+        latencies.append(time.perf_counter() - started_at)
+    return np.asarray(latencies) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-file", default=None, help="pickled HeartStrokeModel")
+    parser.add_argument("--data-file", default=None, help="raw rows to transform, required with --model-file")
+    parser.add_argument("--n-samples", type=int, default=20000, help="rows of the synthetic dataset")
+    parser.add_argument("--single-rows", type=int, default=1000, help="rows timed one by one")
+    args = parser.parse_args()
+
+    preprocessor, dataframe = load_preprocessor_and_data(args)
+    compiled_preprocessor = compile_preprocessor(preprocessor)
+    records = dataframe.to_dict(orient="records")
+
+    difference = np.abs(compiled_preprocessor.transform(dataframe) - to_dense(preprocessor.transform(dataframe)))
+    print(f"rows: {len(dataframe)}, max abs difference: {np.nanmax(difference):.3e}\n")
+    print(f"{'preprocessor':<14}{'p50 ms':>10}{'p99 ms':>10}{'batch ms':>10}{'rows/s':>12}")
+
+    for name, transform in (("sklearn", lambda record: preprocessor.transform(pd.DataFrame([record]))),
+                            ("compiled", compiled_preprocessor.transform)):
+        latencies = time_single_rows(transform, records, args.single_rows)
+        batch_transform = preprocessor.transform if name == "sklearn" else compiled_preprocessor.transform
+        started_at = time.perf_counter()
+        batch_transform(dataframe)
+        batch_ms = (time.perf_counter() - started_at) * 1000
+        print(f"{name:<14}{np.percentile(latencies, 50):>10.3f}{np.percentile(latencies, 99):>10.3f}"
+              f"{batch_ms:>10.1f}{len(dataframe) / batch_ms * 1000:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare the resampling strategies of DataTransformation: resampling runtime, peak memory
+of the resampling step and F1 of a model trained on the resampled rows, scored on an
+untouched held out split.
+
+usage: python benchmarks/resampling_benchmark.py [--train-file artifact/<run>/data_transformation/transformed/train.npy]
+
+Without --train-file a synthetic imbalanced dataset shaped like the transformed heart stroke data is used.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from catboost import CatBoostClassifier
+from sklearn.datasets import make_classification
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+
+from heart_stroke.utils.model_factory import get_class_weight_params
+from heart_stroke.utils.resampling import RESAMPLING_STRATEGIES, resample
+
+
+def load_data(args: argparse.Namespace):
+    if args.train_file is not None:
+        array = np.load(args.train_file)
+        return array[:, :-1], array[:, -1]
+    return make_classification(n_samples=args.n_samples, n_features=14, n_informative=8,
+                               weights=[0.95, 0.05], random_state=42)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--train-file", default=None, help="transformed train array, target in the last column")
+    parser.add_argument("--n-samples", type=int, default=50000, help="rows of the synthetic dataset")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="threads of the neighbour searches")
+    parser.add_argument("--strategies", nargs="+", default=[s for s in RESAMPLING_STRATEGIES if s != "none"])
+    args = parser.parse_args()
+
+    X, y = load_data(args)
+    x_train, x_test, y_train, y_test = train_test_split(X, y, test_size=0.3, stratify=y, random_state=42)
+    print(f"train rows: {len(x_train)}, positive rate: {y_train.mean():.3f}\n")
+    print(f"{'strategy':<20}{'rows':>10}{'resample s':>12}{'peak MB':>10}{'fit s':>8}{'F1':>8}")
+
+    for strategy in args.strategies:
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        x_resampled, y_resampled = resample(x_train, y_train, strategy=strategy, n_jobs=args.n_jobs,
+                                            random_state=42)
+        resample_seconds = time.perf_counter() - started_at
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+        params = {"iterations": 200, "verbose": False, "allow_writing_files": False, "random_seed": 42}
+        if strategy == "class_weight":
+            params.update(get_class_weight_params(CatBoostClassifier))
+        started_at = time.perf_counter()
+        model = CatBoostClassifier(**params).fit(x_resampled, y_resampled)
+        fit_seconds = time.perf_counter() - started_at
+        f1 = f1_score(y_test, model.predict(x_test))
+
+        print(f"{strategy:<20}{len(x_resampled):>10}{resample_seconds:>12.2f}{peak_mb:>10.1f}"
+              f"{fit_seconds:>8.2f}{f1:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
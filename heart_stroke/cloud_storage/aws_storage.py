@@ -1,37 +1,230 @@
+import base64
+import hashlib
+import json
+import math
 import os
 import pickle
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
 from io import StringIO
-from typing import List, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import boto3
 from botocore.exceptions import ClientError
 from heart_stroke.configuration.aws_connection import S3Client
+from heart_stroke.constant.s3_bucket import (S3_DOWNLOAD_DIR, S3_METADATA_CACHE_TTL, S3_TRANSFER_CHUNK_SIZE,
+                                             S3_TRANSFER_MAX_CONCURRENCY)
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.logger import logging
-from mypy_boto3_s3.service_resource import Bucket
+from heart_stroke.utils.model_disk_cache import file_lock
+from mypy_boto3_s3.service_resource import Bucket, Object
 from pandas import DataFrame, read_csv
 
 
+# s3 accepts at most 10000 parts per multipart upload
+MAX_MULTIPART_PARTS = 10000
+SHA256_METADATA_KEY = "sha256"
+
+
+class ObjectChangedError(Exception):
+    """
+    Raised when a conditional write finds that the object changed since its ETag was read
+    """
+
+
+@dataclass(frozen=True)
+class S3ObjectMetadata:
+    etag: str
+    size: int
+    last_modified: datetime
+    # sha256 of the whole object, set by multipart_upload
+    sha256: Optional[str] = None
+
+
+def get_file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for block in iter(lambda: file_obj.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_json_atomic(file_path: str, content: dict) -> None:
+    with open(f"{file_path}.tmp", "w") as file_obj:
+        json.dump(content, file_obj)
+    os.replace(f"{file_path}.tmp", file_path)
+
+
+def read_json(file_path: str) -> Optional[dict]:
+    try:
+        with open(file_path) as file_obj:
+            return json.load(file_obj)
+    except (OSError, ValueError):
+        return None
+
+
 class SimpleStorageService:
-    def __init__(self):
+    # (bucket_name, s3_key) -> (monotonic time of the HEAD request, metadata or None for a missing object),
+    # shared by all instances so that every caller of the process benefits from a recent HEAD request
+    _metadata_cache: Dict[Tuple[str, str], Tuple[float, Optional[S3ObjectMetadata]]] = {}
+    _metadata_lock = threading.Lock()
+
+    def __init__(self, metadata_cache_ttl: float = S3_METADATA_CACHE_TTL):
+        """
+        :param metadata_cache_ttl: Seconds a HEAD result of an object is reused, 0 disables the cache
+        """
         s3_client = S3Client()
         self.s3_resource = s3_client.s3_resource
         self.s3_client = s3_client.s3_client
+        self.metadata_cache_ttl = metadata_cache_ttl
 
     def s3_key_path_available(self, bucket_name, s3_key) -> bool:
+        """
+        True if exactly the s3_key object exists, a cached HEAD request, see object_exists
+        """
+        return self.object_exists(bucket_name, s3_key)
+
+    def get_object_metadata(self, bucket_name: str, s3_key: str,
+                            max_age: Optional[float] = None) -> Optional[S3ObjectMetadata]:
+        """
+        Method Name :   get_object_metadata
+        Description :   This method gets the ETag, size and last modified time of exactly the s3_key object with a
+                        single HEAD request, a result younger than max_age seconds (metadata_cache_ttl by default)
+                        is reused without any request
+
+        Output      :   Metadata of the object or None if the object does not exist
+        On Failure  :   Write an exception log and then raise an exception
+        """
         try:
-            bucket = self.get_bucket(bucket_name)
-            file_objects = [
-                file_object for file_object in bucket.objects.filter(Prefix=s3_key)
-            ]
-            if len(file_objects) > 0:
-                return True
-            else:
-                return False
+            max_age = self.metadata_cache_ttl if max_age is None else max_age
+            cache_key = (bucket_name, s3_key)
+            cached = SimpleStorageService._metadata_cache.get(cache_key)
+            if cached is not None and time.monotonic() - cached[0] < max_age:
+                return cached[1]
+
+            requested_at = time.monotonic()
+            try:
+                response = self.s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+                metadata = S3ObjectMetadata(etag=response["ETag"], size=response["ContentLength"],
+                                            last_modified=response["LastModified"],
+                                            sha256=response.get("Metadata", {}).get(SHA256_METADATA_KEY))
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                    raise
+                metadata = None
+
+            with SimpleStorageService._metadata_lock:
+                SimpleStorageService._metadata_cache[cache_key] = (requested_at, metadata)
+            return metadata
+
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
+    @staticmethod
+    def invalidate_object_metadata(bucket_name: str, s3_key: str) -> None:
+        with SimpleStorageService._metadata_lock:
+            SimpleStorageService._metadata_cache.pop((bucket_name, s3_key), None)
+
+    def object_exists(self, bucket_name: str, s3_key: str, max_age: Optional[float] = None) -> bool:
+        """
+        True if exactly the s3_key object exists, siblings sharing its prefix do not count
+        """
+        return self.get_object_metadata(bucket_name, s3_key, max_age=max_age) is not None
+
+    def get_object_etag(self, bucket_name: str, s3_key: str, max_age: Optional[float] = None) -> Optional[str]:
+        """
+        Method Name :   get_object_etag
+        Description :   This method gets the ETag of the s3_key object with a single HEAD request
+
+        Output      :   ETag of the object or None if the object does not exist
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        metadata = self.get_object_metadata(bucket_name, s3_key, max_age=max_age)
+        return None if metadata is None else metadata.etag
+
+    def put_json_object(self, content: dict, s3_key: str, bucket_name: str, if_match: Optional[str] = None,
+                        if_none_match: bool = False) -> str:
+        """
+        writes content as the json s3_key object with a single PUT, which replaces the object atomically.
+        With if_match the write only succeeds while the object still has that ETag, with if_none_match
+        only while the object does not exist, ObjectChangedError is raised otherwise
+        return: ETag of the written object
+        """
+        try:
+            conditions = {}
+            if if_match is not None:
+                conditions["IfMatch"] = if_match
+            if if_none_match:
+                conditions["IfNoneMatch"] = "*"
+            try:
+                response = self.s3_client.put_object(Bucket=bucket_name, Key=s3_key, ContentType="application/json",
+                                                     Body=json.dumps(content, indent=2, default=str).encode(),
+                                                     **conditions)
+            except ClientError as e:
+                # 412 for a failed condition, 409 for a concurrent conditional write of the same key
+                if e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict"):
+                    raise ObjectChangedError(f"Object {s3_key} changed since it was read") from e
+                raise
+            finally:
+                self.invalidate_object_metadata(bucket_name, s3_key)
+            return response["ETag"]
+        except ObjectChangedError:
+            raise
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def get_json_object_with_etag(self, s3_key: str, bucket_name: str) -> Tuple[Optional[dict], Optional[str]]:
+        """
+        content and ETag of the json s3_key object from a single GET, (None, None) if the object does not exist
+        """
+        try:
+            response = self.get_object(s3_key, bucket_name).get()
+            return json.loads(response["Body"].read()), response["ETag"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None, None
+            raise HeartStrokeException(e, sys) from e
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def get_json_object(self, s3_key: str, bucket_name: str) -> Optional[dict]:
+        """
+        content of the json s3_key object, None if the object does not exist
+        """
+        return self.get_json_object_with_etag(s3_key, bucket_name)[0]
+
+    def copy_object(self, from_s3_key: str, to_s3_key: str, bucket_name: str) -> None:
+        """
+        server side copy of from_s3_key to to_s3_key, the object metadata is copied along
+        """
+        try:
+            self.s3_resource.meta.client.copy({"Bucket": bucket_name, "Key": from_s3_key}, bucket_name, to_s3_key)
+            self.invalidate_object_metadata(bucket_name, to_s3_key)
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def list_prefixes(self, prefix: str, bucket_name: str) -> List[str]:
+        """
+        the "directories" directly below prefix, prefix should end with a /
+        """
+        try:
+            paginator = self.s3_client.get_paginator("list_objects_v2")
+            return [common_prefix["Prefix"]
+                    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter="/")
+                    for common_prefix in page.get("CommonPrefixes", [])]
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def get_object(self, s3_key: str, bucket_name: str) -> Object:
+        """
+        object of exactly the s3_key key, no request is made until it is read
+        """
+        return self.s3_resource.Object(bucket_name, s3_key)
+
     @staticmethod
     def read_object(
         object_name: str, decode: bool = True, make_readable: bool = False
@@ -75,31 +268,117 @@ class SimpleStorageService:
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
-    def get_file_object(
-        self, filename: str, bucket_name: str
-    ) -> Union[List[object], object]:
+    def get_file_object(self, filename: str, bucket_name: str) -> Object:
         """
         Method Name :   get_file_object
-        Description :   This method gets the file object from bucket_name bucket based on filename
+        Description :   This method gets the object of exactly the filename key from bucket_name bucket,
+                        checked with a cached HEAD request instead of listing the filename prefix
 
-        Output      :   list of objects or object is returned based on filename
+        Output      :   object of the filename key
         On Failure  :   Write an exception log and then raise an exception
         """
         logging.info("Entered the get_file_object method of S3Operations class")
 
         try:
-            bucket = self.get_bucket(bucket_name)
+            if not self.object_exists(bucket_name, filename):
+                raise Exception(f"Object {filename} does not exist in bucket {bucket_name}")
 
-            file_objects = [
-                file_object for file_object in bucket.objects.filter(Prefix=filename)
-            ]
+            file_obj = self.get_object(filename, bucket_name)
+            logging.info("Exited the get_file_object method of S3Operations class")
 
-            func = lambda x: x[0] if len(x) == 1 else x
+            return file_obj
 
-            file_objs = func(file_objects)
-            logging.info("Exited the get_file_object method of S3Operations class")
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
 
-            return file_objs
+    def _download_range(self, bucket_name: str, s3_key: str, etag: str, file_path: str,
+                        start: int, end: int) -> None:
+        """
+        streams bytes start..end of the object into the same range of the preallocated file_path,
+        IfMatch fails the request if the object was replaced since the download started
+        """
+        response = self.s3_client.get_object(Bucket=bucket_name, Key=s3_key, IfMatch=etag,
+                                             Range=f"bytes={start}-{end}")
+        with open(file_path, "r+b") as file_obj:
+            file_obj.seek(start)
+            for block in response["Body"].iter_chunks(1 << 20):
+                file_obj.write(block)
+
+    def download_file(self, s3_key: str, bucket_name: str, to_filename: str,
+                      chunk_size: int = S3_TRANSFER_CHUNK_SIZE,
+                      max_concurrency: int = S3_TRANSFER_MAX_CONCURRENCY,
+                      if_match: Optional[str] = None) -> str:
+        """
+        Method Name :   download_file
+        Description :   This method downloads the s3_key object with max_concurrency ranged GET requests of
+                        chunk_size bytes written straight into a preallocated to_filename.part file, so the object
+                        is never held in memory. The finished parts are recorded in a .part.json sidecar and an
+                        interrupted download of the same ETag resumes with the missing parts only. The file is
+                        checked against the sha256 of the object, or its md5 ETag for single part uploads,
+                        before it is renamed to to_filename. Concurrent downloads to the same to_filename are
+                        serialized with a file lock. With if_match the download fails unless the object still
+                        has that ETag
+
+        Output      :   to_filename
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info("Entered the download_file method of S3Operations class")
+
+        try:
+            metadata = self.get_object_metadata(bucket_name, s3_key, max_age=0)
+            if metadata is None:
+                raise Exception(f"Object {s3_key} does not exist in {bucket_name} bucket")
+            if if_match is not None and metadata.etag != if_match:
+                raise Exception(f"Object {s3_key} has ETag {metadata.etag} instead of {if_match}")
+
+            os.makedirs(os.path.dirname(os.path.abspath(to_filename)), exist_ok=True)
+            # the .part and .part.json files of to_filename are shared by every process of the host
+            with file_lock(f"{to_filename}.lock"):
+                part_file_path, state_file_path = f"{to_filename}.part", f"{to_filename}.part.json"
+                ranges = [(start, min(start + chunk_size, metadata.size) - 1)
+                          for start in range(0, metadata.size, chunk_size)]
+                state = {"etag": metadata.etag, "size": metadata.size, "chunk_size": chunk_size, "done": []}
+                previous_state = read_json(state_file_path)
+                if (previous_state is not None and os.path.exists(part_file_path)
+                        and all(previous_state.get(key) == state[key] for key in ("etag", "size", "chunk_size"))):
+                    state = previous_state
+                    logging.info(f"Resuming download of {s3_key} with {len(state['done'])}/{len(ranges)} parts done")
+                else:
+                    with open(part_file_path, "wb") as file_obj:
+                        file_obj.truncate(metadata.size)
+                    write_json_atomic(state_file_path, state)
+
+                state_lock = threading.Lock()
+
+                def download_part(index: int) -> None:
+                    start, end = ranges[index]
+                    self._download_range(bucket_name, s3_key, metadata.etag, part_file_path, start, end)
+                    with state_lock:
+                        state["done"].append(index)
+                        write_json_atomic(state_file_path, state)
+
+                done = set(state["done"])
+                pending = [index for index in range(len(ranges)) if index not in done]
+                with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+                    list(executor.map(download_part, pending))
+
+                if metadata.sha256 is not None:
+                    if get_file_sha256(part_file_path) != metadata.sha256:
+                        os.remove(state_file_path)
+                        raise Exception(f"sha256 of the downloaded {s3_key} does not match the object")
+                elif "-" not in metadata.etag:
+                    with open(part_file_path, "rb") as file_obj:
+                        md5 = hashlib.md5()
+                        for block in iter(lambda: file_obj.read(1 << 20), b""):
+                            md5.update(block)
+                    if md5.hexdigest() != metadata.etag.strip('"'):
+                        os.remove(state_file_path)
+                        raise Exception(f"md5 of the downloaded {s3_key} does not match its ETag")
+
+                os.replace(part_file_path, to_filename)
+                os.remove(state_file_path)
+                logging.info(f"Downloaded {s3_key} ({metadata.size} bytes, {len(pending)} parts) to {to_filename}")
+                return to_filename
 
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
@@ -123,9 +402,10 @@ class SimpleStorageService:
                 else model_dir + "/" + model_name
             )
             model_file = func()
-            file_object = self.get_file_object(model_file, bucket_name)
-            model_obj = self.read_object(file_object, decode=False)
-            model = pickle.loads(model_obj)
+            local_file_path = self.download_file(model_file, bucket_name,
+                                                 to_filename=os.path.join(S3_DOWNLOAD_DIR, bucket_name, model_file))
+            with open(local_file_path, "rb") as file_obj:
+                model = pickle.load(file_obj)
             logging.info("Exited the load_model method of S3Operations class")
             return model
 
@@ -153,6 +433,86 @@ class SimpleStorageService:
                 pass
             logging.info("Exited the create_folder method of S3Operations class")
 
+    def multipart_upload(self, from_filename: str, to_filename: str, bucket_name: str,
+                         chunk_size: int = S3_TRANSFER_CHUNK_SIZE,
+                         max_concurrency: int = S3_TRANSFER_MAX_CONCURRENCY) -> None:
+        """
+        Method Name :   multipart_upload
+        Description :   This method uploads from_filename in chunk_size parts, max_concurrency at a time, every part
+                        with a SHA256 checksum verified by s3 and the sha256 of the whole file as object metadata.
+                        The upload id is kept in a .upload.json sidecar, an interrupted upload of the unchanged
+                        file resumes with the parts s3 does not list yet. Files smaller than one part are put
+                        with a single request
+
+        Output      :   File is uploaded to bucket_name bucket
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            size = os.path.getsize(from_filename)
+            sha256 = get_file_sha256(from_filename)
+            if size <= chunk_size:
+                with open(from_filename, "rb") as file_obj:
+                    self.s3_client.put_object(Bucket=bucket_name, Key=to_filename, Body=file_obj,
+                                              Metadata={SHA256_METADATA_KEY: sha256}, ChecksumAlgorithm="SHA256")
+                self.invalidate_object_metadata(bucket_name, to_filename)
+                return
+
+            chunk_size = max(chunk_size, math.ceil(size / MAX_MULTIPART_PARTS))
+            n_parts = math.ceil(size / chunk_size)
+            state_file_path = f"{from_filename}.upload.json"
+            state = read_json(state_file_path)
+            uploaded_parts = {}
+            if state is not None and state.get("sha256") == sha256 and state.get("chunk_size") == chunk_size \
+                    and state.get("bucket_name") == bucket_name and state.get("key") == to_filename:
+                try:
+                    paginator = self.s3_client.get_paginator("list_parts")
+                    for page in paginator.paginate(Bucket=bucket_name, Key=to_filename, UploadId=state["upload_id"]):
+                        for part in page.get("Parts", []):
+                            uploaded_parts[part["PartNumber"]] = part
+                    logging.info(f"Resuming upload of {to_filename} with {len(uploaded_parts)}/{n_parts} parts done")
+                except ClientError:
+                    state = None
+            else:
+                state = None
+
+            if state is None:
+                response = self.s3_client.create_multipart_upload(Bucket=bucket_name, Key=to_filename,
+                                                                  Metadata={SHA256_METADATA_KEY: sha256},
+                                                                  ChecksumAlgorithm="SHA256")
+                state = {"upload_id": response["UploadId"], "bucket_name": bucket_name, "key": to_filename,
+                         "sha256": sha256, "chunk_size": chunk_size}
+                write_json_atomic(state_file_path, state)
+
+            def upload_part(part_number: int) -> dict:
+                with open(from_filename, "rb") as file_obj:
+                    file_obj.seek((part_number - 1) * chunk_size)
+                    body = file_obj.read(chunk_size)
+                checksum = base64.b64encode(hashlib.sha256(body).digest()).decode()
+                response = self.s3_client.upload_part(Bucket=bucket_name, Key=to_filename, Body=body,
+                                                      UploadId=state["upload_id"], PartNumber=part_number,
+                                                      ChecksumAlgorithm="SHA256", ChecksumSHA256=checksum)
+                return {"PartNumber": part_number, "ETag": response["ETag"], "ChecksumSHA256": checksum}
+
+            pending = [part_number for part_number in range(1, n_parts + 1) if part_number not in uploaded_parts]
+            with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+                for part in executor.map(upload_part, pending):
+                    uploaded_parts[part["PartNumber"]] = part
+
+            self.s3_client.complete_multipart_upload(
+                Bucket=bucket_name, Key=to_filename, UploadId=state["upload_id"],
+                MultipartUpload={"Parts": [
+                    {key: uploaded_parts[part_number][key] for key in ("PartNumber", "ETag", "ChecksumSHA256")
+                     if key in uploaded_parts[part_number]}
+                    for part_number in range(1, n_parts + 1)
+                ]},
+            )
+            os.remove(state_file_path)
+            self.invalidate_object_metadata(bucket_name, to_filename)
+            logging.info(f"Uploaded {from_filename} ({size} bytes) in {n_parts} parts, {len(pending)} this attempt")
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
     def upload_file(
         self,
         from_filename: str,
@@ -174,9 +534,7 @@ class SimpleStorageService:
                 f"Uploading {from_filename} file to {to_filename} file in {bucket_name} bucket"
             )
 
-            self.s3_resource.meta.client.upload_file(
-                from_filename, bucket_name, to_filename
-            )
+            self.multipart_upload(from_filename, to_filename=to_filename, bucket_name=bucket_name)
 
             logging.info(
                 f"Uploaded {from_filename} file to {to_filename} file in {bucket_name} bucket"
@@ -1,8 +1,10 @@
 from email import header
+import dataclasses
 import sys
 from typing import Tuple
 
 import numpy as np
+import pandas as pd
 from pandas import DataFrame
 from sklearn.model_selection import train_test_split
 
@@ -10,22 +12,31 @@ from heart_stroke.entity.config_entity import DataIngestionConfig
 from heart_stroke.entity.artifact_entity import DataIngestionArtifact
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.logger import logging
-from heart_stroke.utils.main_utils import read_yaml_file
+from heart_stroke.utils.artifact_store import ArtifactStore
+from heart_stroke.utils.main_utils import (read_dataframe, read_yaml_file, save_dataframe_chunks,
+                                           write_yaml_file)
+from heart_stroke.utils.stage_cache import StageCache
 from heart_stroke.data_access.heart_stroke_data import StrokeData
 from heart_stroke.constant.training_pipeline import SCHEMA_FILE_PATH
-from typing import List
+from typing import List, Optional
 import os
 
 from heart_stroke.logger import logging
 
 
 class DataIngestion:
-    def __init__(self, data_ingestion_config: DataIngestionConfig = DataIngestionConfig()):
+    def __init__(self, data_ingestion_config: DataIngestionConfig = DataIngestionConfig(),
+                 artifact_store: Optional[ArtifactStore] = None, stage_cache: Optional[StageCache] = None):
         """
         :param data_ingestion_config: Configuration for data ingestion
+        :param artifact_store: In memory artifacts of the current pipeline run
+        :param stage_cache: Cache of the train test split, keyed by the fingerprint of the exported data
         """
         try:
             self.data_ingestion_config = data_ingestion_config
+            self.artifact_store = ArtifactStore() if artifact_store is None else artifact_store
+            self.stage_cache = stage_cache
+            self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
         except Exception as e:
             raise HeartStrokeException(e, sys)
 
@@ -40,36 +51,119 @@ class DataIngestion:
         try:
             logging.info(f"Exporting data from mongodb")
             heart_stroke_data = StrokeData()
-            dataframe = heart_stroke_data.export_collection_as_dataframe(
-                collection_name=self.data_ingestion_config.collection_name
-            )
-            logging.info(f"Shape of dataframe: {dataframe.shape}")
             feature_store_file_path = self.data_ingestion_config.feature_store_file_path
-            dir_path = os.path.dirname(feature_store_file_path)
-            os.makedirs(dir_path, exist_ok=True)
             logging.info(
                 f"Saving exported data into feature store file path: {feature_store_file_path}"
             )
-            dataframe.to_csv(feature_store_file_path, index=False, header=True)
+            # the chunks are written as they arrive, the collection is only held once, as the file read back
+            rows = save_dataframe_chunks(feature_store_file_path, heart_stroke_data.iter_collection_chunks(
+                collection_name=self.data_ingestion_config.collection_name,
+                batch_size=self.data_ingestion_config.export_batch_size
+            ), schema_config=self._schema_config)
+            logging.info(f"Exported {rows} rows")
+            dataframe = read_dataframe(feature_store_file_path, schema_config=self._schema_config)
+            logging.info(f"Shape of dataframe: {dataframe.shape}")
             return dataframe
 
         except Exception as e:
             raise HeartStrokeException(e, sys)
 
-    def split_data_as_train_test(self, dataframe: DataFrame) -> None:
+    def read_watermark(self) -> Optional[dict]:
+        """
+        last exported _id, row count and size of the persistent feature store, None before the first run
+        """
+        if os.path.exists(self.data_ingestion_config.watermark_file_path) and \
+                os.path.exists(self.data_ingestion_config.persistent_feature_store_file_path):
+            return read_yaml_file(file_path=self.data_ingestion_config.watermark_file_path)
+        return None
+
+    def update_persistent_feature_store(self) -> DataFrame:
+        """
+        Method Name :   update_persistent_feature_store
+        Description :   This method appends only the documents inserted since the last run to the persistent
+                        feature store and moves the watermark forward, the watermark also records the feature
+                        store size so that rows appended by an interrupted run are truncated on the next run
+
+        Output      :   DataFrame of the whole persistent feature store
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            feature_store_file_path = self.data_ingestion_config.persistent_feature_store_file_path
+            watermark_file_path = self.data_ingestion_config.watermark_file_path
+            os.makedirs(os.path.dirname(feature_store_file_path), exist_ok=True)
+
+            watermark = self.read_watermark()
+            if watermark is not None:
+                if os.path.getsize(feature_store_file_path) > watermark["feature_store_size"]:
+                    logging.info("Truncating rows appended to the feature store after the last watermark")
+                    with open(feature_store_file_path, "r+b") as feature_store_file:
+                        feature_store_file.truncate(watermark["feature_store_size"])
+
+            columns = None
+            if watermark is not None:
+                columns = pd.read_csv(feature_store_file_path, nrows=0).columns
+            last_id = None if watermark is None else watermark["last_id"]
+            rows = 0 if watermark is None else watermark["rows"]
+            logging.info(f"Exporting documents after watermark {last_id} from mongodb")
+
+            heart_stroke_data = StrokeData()
+            new_rows = 0
+            for chunk, chunk_last_id in heart_stroke_data.iter_new_collection_chunks(
+                collection_name=self.data_ingestion_config.collection_name,
+                watermark=last_id,
+                batch_size=self.data_ingestion_config.export_batch_size
+            ):
+                if columns is not None:
+                    chunk = chunk.reindex(columns=columns)
+                chunk.to_csv(feature_store_file_path, index=False, header=columns is None,
+                             mode="w" if columns is None else "a")
+                columns = chunk.columns
+                new_rows += len(chunk)
+                write_yaml_file(file_path=watermark_file_path, content={
+                    "last_id": chunk_last_id,
+                    "rows": rows + new_rows,
+                    "feature_store_size": os.path.getsize(feature_store_file_path),
+                }, atomic=True)
+
+            logging.info(f"Appended {new_rows} new rows to feature store {feature_store_file_path}")
+            if columns is None:
+                # first run on an empty collection, nothing was written and there is no watermark yet
+                logging.info(f"Collection {self.data_ingestion_config.collection_name} is empty")
+                return pd.DataFrame()
+            return read_dataframe(feature_store_file_path, schema_config=self._schema_config)
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys)
+
+    def split_data_as_train_test(self, dataframe: DataFrame, new_rows_start: Optional[int] = None) -> Optional[str]:
         """
         Method Name :   split_data_as_train_test
-        Description :   This method splits the dataframe into train set and test set based on split ratio 
-        
-        Output      :   Folder is created in s3 bucket
+        Description :   This method splits the dataframe into train set and test set based on split ratio. A row is
+                        assigned by the hash of its id, so that it stays in the same split when rows are added and
+                        a train row of an earlier run never becomes a test row. With new_rows_start, the train rows
+                        from that position on, the ones appended since the previous watermark, are saved apart
+
+        Output      :   File path of the new train rows, None without new_rows_start or new train rows
         On Failure  :   Write an exception log and then raise an exception
         """
         logging.info("Entered split_data_as_train_test method of Data_Ingestion class")
 
         try:
-            train_set, test_set = train_test_split(
-                dataframe, test_size=self.data_ingestion_config.train_test_split_ratio
-            )
+            # the index is the position of the row in the feature store
+            dataframe = dataframe.reset_index(drop=True)
+            row_id_column = self.data_ingestion_config.row_id_column
+            if row_id_column in dataframe.columns:
+                row_hashes = pd.util.hash_pandas_object(dataframe[row_id_column], index=False).to_numpy()
+                is_test = row_hashes / 2.0 ** 64 < self.data_ingestion_config.train_test_split_ratio
+                train_set, test_set = dataframe[~is_test], dataframe[is_test]
+            else:
+                logging.info(f"Column {row_id_column} is missing, splitting with a fixed seed instead")
+                train_set, test_set = train_test_split(
+                    dataframe, test_size=self.data_ingestion_config.train_test_split_ratio,
+                    random_state=self.data_ingestion_config.split_random_state
+                )
+            train_set = train_set.drop(self._schema_config["Drop_columns"], axis=1)
+            test_set = test_set.drop(self._schema_config["Drop_columns"], axis=1)
             logging.info("Performed train test split on the dataframe")
             logging.info(
                 "Exited split_data_as_train_test method of Data_Ingestion class"
@@ -78,14 +172,23 @@ class DataIngestion:
             os.makedirs(dir_path, exist_ok=True)
 
             logging.info(f"Exporting train and test file path.")
-            train_set.to_csv(
-                self.data_ingestion_config.training_file_path, index=False, header=True
-            )
-            test_set.to_csv(
-                self.data_ingestion_config.testing_file_path, index=False, header=True
-            )
+            self.artifact_store.save_dataframe(self.data_ingestion_config.training_file_path, train_set,
+                                               schema_config=self._schema_config)
+            self.artifact_store.save_dataframe(self.data_ingestion_config.testing_file_path, test_set,
+                                               schema_config=self._schema_config)
 
             logging.info(f"Exported train and test file path.")
+
+            if new_rows_start is None:
+                return None
+            # the persistent feature store is append only, the new rows are the ones after the previous row count
+            new_train_set = train_set[train_set.index >= new_rows_start]
+            if len(new_train_set) == 0:
+                return None
+            self.artifact_store.save_dataframe(self.data_ingestion_config.new_training_file_path, new_train_set,
+                                               schema_config=self._schema_config)
+            logging.info(f"Exported {len(new_train_set)} new train rows")
+            return self.data_ingestion_config.new_training_file_path
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
@@ -100,14 +203,40 @@ class DataIngestion:
         logging.info("Entered initiate_data_ingestion method of Data_Ingestion class")
 
         try:
-            dataframe = self.export_data_into_feature_store()
-            _schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
-
-            dataframe = dataframe.drop(_schema_config["Drop_columns"], axis=1)
+            previous_watermark, watermark = None, None
+            if self.data_ingestion_config.incremental:
+                previous_watermark = self.read_watermark()
+                dataframe = self.update_persistent_feature_store()
+                watermark = self.read_watermark()
+            else:
+                dataframe = self.export_data_into_feature_store()
+            if len(dataframe) == 0:
+                raise Exception(f"Collection {self.data_ingestion_config.collection_name} has no data to train on")
 
             logging.info("Got the data from mongodb")
 
-            self.split_data_as_train_test(dataframe)
+            # the row ids are part of the fingerprint, they decide the split
+            data_fingerprint = StageCache.hash_dataframe(dataframe)
+            logging.info(f"Fingerprint of the exported data: {data_fingerprint}")
+            watermark_fields = {
+                "previous_watermark": None if previous_watermark is None else previous_watermark["last_id"],
+                "watermark": None if watermark is None else watermark["last_id"],
+            }
+            file_fields = {
+                "trained_file_path": self.data_ingestion_config.training_file_path,
+                "test_file_path": self.data_ingestion_config.testing_file_path,
+            }
+            cache_key = StageCache.get_key(data_fingerprint, SCHEMA_FILE_PATH, __file__,
+                                           self.data_ingestion_config.train_test_split_ratio)
+            if self.stage_cache is not None:
+                data_ingestion_artifact = self.stage_cache.restore("data_ingestion", cache_key, file_fields)
+                if data_ingestion_artifact is not None:
+                    # unchanged data of an append only feature store means nothing was appended by this run
+                    return dataclasses.replace(data_ingestion_artifact, new_trained_file_path=None,
+                                               **watermark_fields)
+
+            new_trained_file_path = self.split_data_as_train_test(
+                dataframe, new_rows_start=None if previous_watermark is None else previous_watermark["rows"])
 
             logging.info("Performed train test split on the dataset")
 
@@ -118,7 +247,12 @@ class DataIngestion:
             data_ingestion_artifact = DataIngestionArtifact(
                 trained_file_path=self.data_ingestion_config.training_file_path,
                 test_file_path=self.data_ingestion_config.testing_file_path,
+                data_fingerprint=data_fingerprint,
+                new_trained_file_path=new_trained_file_path,
+                **watermark_fields,
             )
+            if self.stage_cache is not None:
+                self.stage_cache.store("data_ingestion", cache_key, data_ingestion_artifact, file_fields)
 
             logging.info(f"Data ingestion artifact: {data_ingestion_artifact}")
             return data_ingestion_artifact
@@ -1,5 +1,7 @@
+import itertools
+import os
 import sys
-from typing import Union
+from typing import Iterable, List, Optional, Union
 
 import numpy as np
 import pandas as pd
@@ -7,11 +9,15 @@ from heart_stroke.constant.training_pipeline import TARGET_COLUMN, SCHEMA_FILE_P
 from heart_stroke.entity.artifact_entity import (DataIngestionArtifact,
                                                  DataTransformationArtifact, DataValidationArtifact)
 from heart_stroke.entity.config_entity import DataTransformationConfig
-from heart_stroke.utils.main_utils import read_yaml_file 
+from heart_stroke.entity.estimator import HeartStrokeModel
+from heart_stroke.utils.artifact_store import ArtifactStore
+from heart_stroke.utils.main_utils import (count_dataframe_rows, get_array_file_path,
+                                           iter_dataframe_chunks, load_object, read_yaml_file,
+                                           save_feature_chunks_and_target, save_object)
+from heart_stroke.utils.resampling import get_resampler, resample
+from heart_stroke.utils.streaming_stats import StreamingPreprocessorStats
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.logger import logging
-from heart_stroke.utils.main_utils import save_numpy_array_data, save_object
-from imblearn.combine import SMOTEENN
 from pandas import DataFrame
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
@@ -22,31 +28,37 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder, PowerTransforme
 class DataTransformation:
     def __init__(self, data_ingestion_artifact: DataIngestionArtifact,
                  data_transformation_config: DataTransformationConfig,
-                 data_validation_artifact: DataValidationArtifact):
+                 data_validation_artifact: DataValidationArtifact,
+                 artifact_store: Optional[ArtifactStore] = None,
+                 base_model: Optional[HeartStrokeModel] = None):
         """
 
         :param data_ingestion_artifact: Output reference of data ingestion artifact stage
         :param data_transformation_config: Configuration for data transformation
+        :param artifact_store: In memory artifacts of the current pipeline run
+        :param base_model: Production model to warm start from, its fitted preprocessor is reused when it covers the data
         """
         try:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_transformation_config = data_transformation_config
             self.data_validation_artifact = data_validation_artifact
+            self.artifact_store = ArtifactStore() if artifact_store is None else artifact_store
+            self.base_model = base_model
             self._schema_config =read_yaml_file(file_path=SCHEMA_FILE_PATH)
         except Exception as e:
             raise HeartStrokeException(e, sys)
 
-    @staticmethod
-    def read_data(file_path) -> pd.DataFrame:
+    def read_data(self, file_path, columns: Optional[List[str]] = None) -> pd.DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return self.artifact_store.read_dataframe(file_path, columns=columns, schema_config=self._schema_config)
         except Exception as e:
             raise HeartStrokeException(e, sys)
 
-    def get_data_transformer_object(self) -> Pipeline:
+    def get_data_transformer_object(self, categories: Optional[List[list]] = None) -> Pipeline:
         """
         Method Name :   get_data_transformer_object
-        Description :   This method creates and returns a data transformer object 
+        Description :   This method creates and returns a data transformer object,
+                        categories fixes the vocabulary of the one hot encoder when given
         
         Output      :   data transformer object is created and returned 
         On Failure  :   Write an exception log and then raise an exception
@@ -68,7 +80,7 @@ class DataTransformation:
             ])
 
             categorical_pipeline = Pipeline(steps=[
-                ('one_hot_encoder', OneHotEncoder()),
+                ('one_hot_encoder', OneHotEncoder(categories="auto" if categories is None else categories)),
                 ('scaler', StandardScaler(with_mean=False))
             ]
             )
@@ -83,7 +95,8 @@ class DataTransformation:
                     ("Numeric_Pipeline",numeric_pipeline,numerical_columns),
                     ("Categorical_Pipeline",categorical_pipeline, categorical_columns),
                     ("Power_Transformation", transform_pipe, transform_columns)
-            ]
+            ],
+                sparse_threshold=self.data_transformation_config.sparse_threshold
             )
 
             logging.info("Created preprocessor object from ColumnTransformer")
@@ -97,6 +110,155 @@ class DataTransformation:
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
+    def accumulate_streaming_stats(self, file_path: str) -> StreamingPreprocessorStats:
+        """
+        Method Name :   accumulate_streaming_stats
+        Description :   This method accumulates the preprocessing statistics of the file chunk by chunk. With
+                        incremental_stats, the statistics saved by the previous streaming run are reloaded when
+                        they cover exactly the rows ingested up to the previous watermark, and only the train rows
+                        ingested since then are added to them. Otherwise they are accumulated from scratch
+
+        Output      :   statistics of the train rows
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            numerical_columns = self._schema_config['Numerical_columns']
+            categorical_columns = self._schema_config['Categorical_columns']
+            transform_columns = self._schema_config['Transformation_columns']
+            persistent_stats_file_path = self.data_transformation_config.persistent_streaming_stats_file_path
+            previous_watermark = self.data_ingestion_artifact.previous_watermark
+
+            stats = None
+            if self.data_transformation_config.incremental_stats and os.path.exists(persistent_stats_file_path):
+                stats = load_object(persistent_stats_file_path)
+                if (stats.numerical_columns, stats.categorical_columns, stats.transformation_columns) != \
+                        (numerical_columns, categorical_columns, transform_columns):
+                    logging.info("Columns of the schema changed, accumulating preprocessing statistics from scratch")
+                    stats = None
+                elif previous_watermark is None or getattr(stats, "watermark", None) != previous_watermark:
+                    logging.info(f"Preprocessing statistics cover watermark {getattr(stats, 'watermark', None)}, "
+                                 f"not {previous_watermark}, accumulating them from scratch")
+                    stats = None
+                else:
+                    logging.info(f"Reloaded preprocessing statistics of {stats.n_rows} rows")
+                    file_path = self.data_ingestion_artifact.new_trained_file_path
+            if stats is None:
+                stats = StreamingPreprocessorStats(numerical_columns, categorical_columns, transform_columns,
+                                                   reservoir_size=self.data_transformation_config.reservoir_size)
+
+            new_rows = 0
+            if file_path is not None:
+                for chunk in iter_dataframe_chunks(file_path,
+                                                   chunk_size=self.data_transformation_config.fit_chunk_size,
+                                                   columns=stats.columns, schema_config=self._schema_config):
+                    stats.partial_fit(chunk)
+                    new_rows += len(chunk)
+            stats.watermark = self.data_ingestion_artifact.watermark
+            logging.info(f"Accumulated preprocessing statistics of {new_rows} new rows, {stats.n_rows} rows in total")
+            return stats
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def save_streaming_stats(self, stats: StreamingPreprocessorStats) -> None:
+        """
+        saves the statistics next to the preprocessor and as the persistent copy reloaded by the next run
+        """
+        try:
+            self.artifact_store.save_object(self.data_transformation_config.streaming_stats_file_path, stats)
+            if self.data_transformation_config.incremental_stats:
+                save_object(self.data_transformation_config.persistent_streaming_stats_file_path, stats)
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def fit_preprocessor_streaming(self, stats: StreamingPreprocessorStats) -> ColumnTransformer:
+        """
+        Method Name :   fit_preprocessor_streaming
+        Description :   This method fits the preprocessor from statistics accumulated over chunks of the train set,
+                        so that the train set never has to fit in memory. The pipelines are fitted on a reservoir
+                        sample, then the imputer medians, the scaler moments and the one hot scaler variances are
+                        replaced by the statistics of all the rows. The Yeo-Johnson lambdas come from the sample
+
+        Output      :   fitted preprocessor object
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            numerical_columns = stats.numerical_columns
+            transform_columns = stats.transformation_columns
+            logging.info(f"Fitting the preprocessor on a reservoir sample of {len(stats.reservoir.sample)} rows")
+
+            preprocessor = self.get_data_transformer_object(categories=stats.categories())
+            preprocessor.fit(stats.reservoir.sample)
+
+            numeric_pipeline = preprocessor.named_transformers_["Numeric_Pipeline"]
+            numeric_pipeline.named_steps["imputer"].statistics_ = np.array(
+                [stats.median(column) for column in numerical_columns])
+            mean, var = map(np.array, zip(*[stats.imputed_mean_var(column) for column in numerical_columns]))
+            numeric_scaler = numeric_pipeline.named_steps["scaler"]
+            numeric_scaler.mean_, numeric_scaler.var_ = mean, var
+            numeric_scaler.scale_ = np.where(var > 0, np.sqrt(var), 1.0)
+            numeric_scaler.n_samples_seen_ = stats.n_rows
+
+            categorical_scaler = preprocessor.named_transformers_["Categorical_Pipeline"].named_steps["scaler"]
+            var = stats.one_hot_variances()
+            categorical_scaler.var_ = var
+            categorical_scaler.scale_ = np.where(var > 0, np.sqrt(var), 1.0)
+            categorical_scaler.n_samples_seen_ = stats.n_rows
+
+            preprocessor.named_transformers_["Power_Transformation"].named_steps["imputer"].statistics_ = np.array(
+                [stats.median(column) for column in transform_columns])
+
+            return preprocessor
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def transform_train_streaming(self, preprocessor: ColumnTransformer, file_path: str,
+                                  transformed_file_path: str) -> np.memmap:
+        """
+        Method Name :   transform_train_streaming
+        Description :   This method transforms the train file chunk by chunk into the preallocated .npy array of
+                        transformed_file_path, the train set is never loaded as a whole
+
+        Output      :   read only memory map of the transformed train array, the target is its last column
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            columns = (self._schema_config['Numerical_columns'] + self._schema_config['Categorical_columns'] +
+                       self._schema_config['Transformation_columns'] + [TARGET_COLUMN])
+            chunks = ((preprocessor.transform(chunk.drop(columns=[TARGET_COLUMN])), chunk[TARGET_COLUMN])
+                      for chunk in iter_dataframe_chunks(file_path,
+                                                         chunk_size=self.data_transformation_config.fit_chunk_size,
+                                                         columns=columns, schema_config=self._schema_config))
+            return save_feature_chunks_and_target(transformed_file_path, chunks,
+                                                  n_rows=count_dataframe_rows(file_path),
+                                                  dtype=self.data_transformation_config.train_array_dtype)
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def can_reuse_preprocessor(self, preprocessor: ColumnTransformer, dataframes: Iterable[DataFrame]) -> bool:
+        """
+        Method Name :   can_reuse_preprocessor
+        Description :   This method checks that a fitted preprocessor knows every category present in the dataframes
+
+        Output      :   True if the preprocessor can transform the dataframes without refitting
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            categorical_columns = self._schema_config['Categorical_columns']
+            one_hot_encoder = preprocessor.named_transformers_["Categorical_Pipeline"].named_steps["one_hot_encoder"]
+            # one pass over the dataframes, which can be chunks streamed from a file
+            for dataframe in dataframes:
+                for column, categories in zip(categorical_columns, one_hot_encoder.categories_):
+                    unknown_categories = set(dataframe[column].dropna().unique()) - set(categories)
+                    if len(unknown_categories) > 0:
+                        logging.info(f"Production preprocessor does not know {unknown_categories} of {column}")
+                        return False
+            return True
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
     def initiate_data_transformation(self) -> DataTransformationArtifact:
         """
         Method Name :   initiate_data_transformation
@@ -111,13 +273,13 @@ class DataTransformation:
                 preprocessor = self.get_data_transformer_object()
                 logging.info("Got the preprocessor object")
 
-                train_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.trained_file_path)
-                test_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.test_file_path)
-
-                input_feature_train_df = train_df.drop(columns=[TARGET_COLUMN], axis=1)
-                target_feature_train_df = train_df[TARGET_COLUMN]
+                columns = (self._schema_config['Numerical_columns'] + self._schema_config['Categorical_columns'] +
+                           self._schema_config['Transformation_columns'] + [TARGET_COLUMN])
+                streaming = self.data_transformation_config.fit_mode == "streaming"
+                train_file_path = self.data_ingestion_artifact.trained_file_path
 
-                logging.info("Got train features and test features of Training dataset")
+                test_df = self.read_data(file_path=self.data_ingestion_artifact.test_file_path,
+                                         columns=columns)
 
                 input_feature_test_df = test_df.drop(columns=[TARGET_COLUMN], axis=1)
 
@@ -125,51 +287,111 @@ class DataTransformation:
 
                 logging.info("Got train features and test features of Testing dataset")
 
-                logging.info(
-                    "Applying preprocessing object on training dataframe and testing dataframe"
-                )
+                if streaming:
+                    # the train set is only read in chunks, never as a whole dataframe
+                    dataframes = itertools.chain([input_feature_test_df], iter_dataframe_chunks(
+                        train_file_path, chunk_size=self.data_transformation_config.fit_chunk_size,
+                        columns=self._schema_config['Categorical_columns'], schema_config=self._schema_config))
+                else:
+                    train_df = self.read_data(file_path=train_file_path, columns=columns)
+
+                    input_feature_train_df = train_df.drop(columns=[TARGET_COLUMN], axis=1)
+                    target_feature_train_df = train_df[TARGET_COLUMN]
 
-                input_feature_train_arr = preprocessor.fit_transform(input_feature_train_df)
+                    logging.info("Got train features and test features of Training dataset")
+                    dataframes = [input_feature_train_df, input_feature_test_df]
+
+                warm_started = self.base_model is not None and self.can_reuse_preprocessor(
+                    self.base_model.preprocessing_object, dataframes)
 
                 logging.info(
-                    "Used the preprocessor object to fit transform the train features"
+                    "Applying preprocessing object on training dataframe and testing dataframe"
                 )
 
+                resampling_strategy = self.data_transformation_config.resampling_strategy
+                resampling_n_jobs = self.data_transformation_config.resampling_n_jobs
+                needs_resampling = get_resampler(resampling_strategy) is not None
+
+                if warm_started:
+                    logging.info("Reusing the fitted preprocessor of the production model")
+                    preprocessor = self.base_model.preprocessing_object
+                elif streaming:
+                    stats = self.accumulate_streaming_stats(train_file_path)
+                    preprocessor = self.fit_preprocessor_streaming(stats)
+                    self.save_streaming_stats(stats)
+
+                if streaming:
+                    # written in place as the train array, only read back when it has to be resampled
+                    transformed_train_file_path = get_array_file_path(
+                        self.data_transformation_config.transformed_train_file_path, np.empty((0, 0)))
+                    chunked_train_file_path = (transformed_train_file_path.replace(".npy", ".chunked.npy")
+                                               if needs_resampling else transformed_train_file_path)
+                    train_arr = self.transform_train_streaming(preprocessor, train_file_path,
+                                                               chunked_train_file_path)
+                    input_feature_train_arr, target_feature_train_df = train_arr[:, :-1], train_arr[:, -1]
+                    logging.info("Used the preprocessor object to transform the train features in chunks")
+                elif warm_started:
+                    input_feature_train_arr = preprocessor.transform(input_feature_train_df)
+                else:
+                    input_feature_train_arr = preprocessor.fit_transform(input_feature_train_df)
+
+                    logging.info(
+                        "Used the preprocessor object to fit transform the train features"
+                    )
+
                 input_feature_test_arr = preprocessor.transform(input_feature_test_df)
 
                 logging.info("Used the preprocessor object to transform the test features")
 
-                logging.info("Applying SMOTEENN on Training dataset")
+                logging.info(f"Applying {resampling_strategy} resampling on Training dataset")
 
-                smt = SMOTEENN(sampling_strategy="minority")
+                if streaming and needs_resampling:
+                    logging.info(f"{resampling_strategy} resampling reads the whole transformed training dataset")
 
-                input_feature_train_final, target_feature_train_final = smt.fit_resample(
-                    input_feature_train_arr, target_feature_train_df
+                input_feature_train_final, target_feature_train_final = resample(
+                    input_feature_train_arr, target_feature_train_df,
+                    strategy=resampling_strategy, n_jobs=resampling_n_jobs
                 )
 
-                logging.info("Applied SMOTEENN on training dataset")
-
-                logging.info("Applying SMOTEENN on testing dataset")
-
-                input_feature_test_final, target_feature_test_final = smt.fit_resample(
-                    input_feature_test_arr, target_feature_test_df
+                logging.info(f"Applied {resampling_strategy} resampling on training dataset")
+
+                if self.data_transformation_config.resample_test_split:
+                    logging.info(f"Applying {resampling_strategy} resampling on testing dataset")
+
+                    input_feature_test_final, target_feature_test_final = resample(
+                        input_feature_test_arr, target_feature_test_df,
+                        strategy=resampling_strategy, n_jobs=resampling_n_jobs
+                    )
+
+                    logging.info(f"Applied {resampling_strategy} resampling on testing dataset")
+                else:
+                    logging.info("Keeping the original class distribution of the testing dataset")
+                    input_feature_test_final, target_feature_test_final = input_feature_test_arr, target_feature_test_df
+
+                if not streaming or needs_resampling:
+                    transformed_train_file_path = get_array_file_path(
+                        self.data_transformation_config.transformed_train_file_path, input_feature_train_final)
+                transformed_test_file_path = get_array_file_path(
+                    self.data_transformation_config.transformed_test_file_path, input_feature_test_final)
+                logging.info(f"Saving transformed arrays as {transformed_train_file_path} and "
+                             f"{transformed_test_file_path}")
+
+                self.artifact_store.save_object(self.data_transformation_config.transformed_object_file_path,
+                                                preprocessor)
+                if not streaming or needs_resampling:
+                    self.artifact_store.save_features_and_target(
+                        transformed_train_file_path, input_feature_train_final, target_feature_train_final,
+                        dtype=self.data_transformation_config.train_array_dtype
+                    )
+                if streaming and needs_resampling:
+                    del train_arr, input_feature_train_arr
+                    os.remove(chunked_train_file_path)
+                self.artifact_store.save_features_and_target(
+                    transformed_test_file_path, input_feature_test_final, target_feature_test_final,
+                    dtype=self.data_transformation_config.test_array_dtype
                 )
 
-                logging.info("Applied SMOTEENN on testing dataset")
-
-                logging.info("Created train array and test array")
-
-                train_arr = np.c_[
-                    input_feature_train_final, np.array(target_feature_train_final)
-                ]
-
-                test_arr = np.c_[
-                    input_feature_test_final, np.array(target_feature_test_final)
-                ]
-
-                save_object(self.data_transformation_config.transformed_object_file_path, preprocessor)
-                save_numpy_array_data(self.data_transformation_config.transformed_train_file_path, array=train_arr)
-                save_numpy_array_data(self.data_transformation_config.transformed_test_file_path, array=test_arr)
+                logging.info("Saved train array and test array")
 
                 logging.info("Saved the preprocessor object")
 
@@ -179,8 +401,10 @@ class DataTransformation:
 
                 data_transformation_artifact = DataTransformationArtifact(
                     transformed_object_file_path=self.data_transformation_config.transformed_object_file_path,
-                    transformed_train_file_path=self.data_transformation_config.transformed_train_file_path,
-                    transformed_test_file_path=self.data_transformation_config.transformed_test_file_path
+                    transformed_train_file_path=transformed_train_file_path,
+                    transformed_test_file_path=transformed_test_file_path,
+                    warm_started=warm_started,
+                    resampling_strategy=resampling_strategy
                 )
                 return data_transformation_artifact
             else:
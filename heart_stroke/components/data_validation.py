@@ -1,14 +1,14 @@
 import json
 import sys
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 
-import pandas as pd
 from evidently.model_profile import Profile
 from evidently.model_profile.sections import DataDriftProfileSection
 from pandas import DataFrame
 
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.logger import logging
+from heart_stroke.utils.artifact_store import ArtifactStore
 from heart_stroke.utils.main_utils import read_yaml_file, write_yaml_file
 from heart_stroke.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact
 from heart_stroke.entity.config_entity import DataValidationConfig
@@ -16,14 +16,17 @@ from heart_stroke.constant.training_pipeline import SCHEMA_FILE_PATH
 
 
 class DataValidation:
-    def __init__(self, data_ingestion_artifact: DataIngestionArtifact, data_validation_config: DataValidationConfig):
+    def __init__(self, data_ingestion_artifact: DataIngestionArtifact, data_validation_config: DataValidationConfig,
+                 artifact_store: Optional[ArtifactStore] = None):
         """
         :param data_ingestion_artifact: Output reference to the data_ingestion_artifact stage
         :param data_validation_config: Output reference of the data_validation_config
+        :param artifact_store: In memory artifacts of the current pipeline run
         """
         try:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_config = data_validation_config
+            self.artifact_store = ArtifactStore() if artifact_store is None else artifact_store
             self._schema_config =read_yaml_file(file_path=SCHEMA_FILE_PATH)
         except Exception as e:
             raise HeartStrokeException(e,sys)
@@ -89,10 +92,9 @@ class DataValidation:
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
-    @staticmethod
-    def read_data(file_path) -> DataFrame:
+    def read_data(self, file_path) -> DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return self.artifact_store.read_dataframe(file_path, schema_config=self._schema_config)
         except Exception as e:
             raise HeartStrokeException(e, sys)
 
@@ -134,8 +136,8 @@ class DataValidation:
         try:
             validation_error_msg = ""
             logging.info("Starting data validation")
-            train_df, test_df = (DataValidation.read_data(file_path=self.data_ingestion_artifact.trained_file_path),
-                                 DataValidation.read_data(file_path=self.data_ingestion_artifact.test_file_path))
+            train_df, test_df = (self.read_data(file_path=self.data_ingestion_artifact.trained_file_path),
+                                 self.read_data(file_path=self.data_ingestion_artifact.test_file_path))
 
             status = self.validate_number_of_columns(dataframe=train_df)
             logging.info(f"Total number of required columns present in training dataframe: {status}")
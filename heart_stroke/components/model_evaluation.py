@@ -1,13 +1,13 @@
 from heart_stroke.entity.config_entity import ModelEvaluationConfig
 from heart_stroke.entity.artifact_entity import ModelTrainerArtifact, DataIngestionArtifact, ModelEvaluationArtifact
-from heart_stroke.utils.main_utils import load_object
+from heart_stroke.utils.artifact_store import ArtifactStore
 from sklearn.metrics import f1_score
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.constant.training_pipeline import TARGET_COLUMN
 from heart_stroke.logger import logging
 import os, sys
-import pandas as pd
 from typing import Dict
+from heart_stroke.entity.model_registry import ModelRegistry
 from heart_stroke.entity.s3_estimator import StrokeEstimator
 from dataclasses import dataclass
 from heart_stroke.entity.estimator import HeartStrokeModel
@@ -23,29 +23,40 @@ class EvaluateModelResponse:
 
 class ModelEvaluation:
     def __init__(self, model_eval_config: ModelEvaluationConfig, data_ingestion_artifact: DataIngestionArtifact,
-                 model_trainer_artifact: ModelTrainerArtifact):
+                 model_trainer_artifact: ModelTrainerArtifact, artifact_store: Optional[ArtifactStore] = None):
         """
         :param model_evaluation_config: Output reference of data evaluation artifact stage
         :param data_ingestion_artifact: Output reference of data ingestion artifact stage
         :param model_trainer_artifact: Output reference of model_trainer_artifact stage
+        :param artifact_store: In memory artifacts of the current pipeline run
         """
         try:
             self.model_eval_config = model_eval_config
             self.data_ingestion_artifact = data_ingestion_artifact
             self.model_trainer_artifact = model_trainer_artifact
+            self.artifact_store = ArtifactStore() if artifact_store is None else artifact_store
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
     def get_best_model(self) -> Optional[StrokeEstimator]:
         """
         Method Name :   get_best_model
-        Description :   This function is used to get model in production
+        Description :   This function is used to get model in production, the model_version of the config
+                        selects any other version of the model registry. The single model key is used while
+                        the registry has no current version
         
         Output      :   Returns model object if available in s3 storage
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
             bucket_name = self.model_eval_config.bucket_name
+            model_registry = ModelRegistry(bucket_name=bucket_name, registry_key=self.model_eval_config.registry_key)
+            registry_estimator = model_registry.get_estimator(version=self.model_eval_config.model_version)
+            if registry_estimator is not None:
+                return registry_estimator
+            if self.model_eval_config.model_version is not None:
+                raise Exception(f"Model version {self.model_eval_config.model_version} is not registered")
+
             model_path=self.model_eval_config.s3_model_key_path
             heart_stroke_estimator = StrokeEstimator(bucket_name=bucket_name,
                                                model_path=model_path)
@@ -66,9 +77,9 @@ class ModelEvaluation:
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            test_df = self.artifact_store.read_dataframe(self.data_ingestion_artifact.test_file_path)
             x, y = test_df.drop(TARGET_COLUMN, axis=1), test_df[TARGET_COLUMN]
-            trained_model = load_object(file_path=self.model_trainer_artifact.trained_model_file_path)
+            trained_model = self.artifact_store.load_object(file_path=self.model_trainer_artifact.trained_model_file_path)
             trained_model_f1_score = self.model_trainer_artifact.metric_artifact.f1_score
             
             best_model_f1_score=None
@@ -1,23 +1,104 @@
+import dataclasses
+import os
 import sys
+from typing import Optional
 
+from heart_stroke.constant.training_pipeline import TARGET_COLUMN
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.logger import logging
-from heart_stroke.entity.artifact_entity import ModelPusherArtifact, ModelTrainerArtifact 
+from heart_stroke.entity.artifact_entity import DataIngestionArtifact, ModelPusherArtifact, ModelTrainerArtifact
 from heart_stroke.entity.config_entity import ModelPusherConfig
-from heart_stroke.entity.s3_estimator import StrokeEstimator
+from heart_stroke.entity.model_registry import ModelRegistry
+from heart_stroke.entity.portable_model import export_portable_model
+from heart_stroke.utils.artifact_store import ArtifactStore
 
 
 class ModelPusher:
     def __init__(self,model_trainer_artifact: ModelTrainerArtifact,
-                 model_pusher_config: ModelPusherConfig,):
-
+                 model_pusher_config: ModelPusherConfig,
+                 data_ingestion_artifact: Optional[DataIngestionArtifact] = None,
+                 artifact_store: Optional[ArtifactStore] = None):
+        """
+        :param model_trainer_artifact: Output reference of model trainer artifact stage
+        :param model_pusher_config: Configuration for model pusher
+        :param data_ingestion_artifact: Output reference of data ingestion artifact stage, its test set is used
+                                        to check the compiled preprocessor against the sklearn one
+        :param artifact_store: In memory artifacts of the current pipeline run
+        """
         self.model_trainer_artifact = model_trainer_artifact
         self.model_pusher_config = model_pusher_config
-        self.stroke_estimator = StrokeEstimator(
+        self.data_ingestion_artifact = data_ingestion_artifact
+        self.artifact_store = ArtifactStore() if artifact_store is None else artifact_store
+        self.model_registry = ModelRegistry(
             bucket_name=model_pusher_config.bucket_name,
-            model_path=model_pusher_config.s3_model_key_path,
+            registry_key=model_pusher_config.registry_key,
         )
 
+    def compile_model(self) -> None:
+        """
+        Method Name :   compile_model
+        Description :   This function compiles the preprocessor of the trained model into a NumPy kernel for
+                        serving, the model file is only rewritten when the kernel matches the sklearn output
+                        on the test set
+
+        Output      :   Trained model file with the compiled preprocessor
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if not self.model_pusher_config.compile_preprocessor or self.data_ingestion_artifact is None:
+                return
+            trained_model_file_path = self.model_trainer_artifact.trained_model_file_path
+            heart_stroke_model = self.artifact_store.load_object(file_path=trained_model_file_path)
+            test_df = self.artifact_store.read_dataframe(self.data_ingestion_artifact.test_file_path)
+
+            if heart_stroke_model.compile(test_df.drop(TARGET_COLUMN, axis=1)):
+                self.artifact_store.save_object(trained_model_file_path, heart_stroke_model)
+                logging.info("Saved the trained model with the compiled preprocessor")
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def export_portable_model(self) -> Optional[str]:
+        """
+        Method Name :   export_portable_model
+        Description :   This function exports the trained model as a portable model bundle next to the trained
+                        model file, models whose preprocessor or estimator can not be exported are only pushed
+                        as a pickle
+
+        Output      :   Path of the portable model bundle, None if the model was not exported
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if not self.model_pusher_config.export_portable_model:
+                return None
+            trained_model_file_path = self.model_trainer_artifact.trained_model_file_path
+            heart_stroke_model = self.artifact_store.load_object(file_path=trained_model_file_path)
+            portable_model_file_path = os.path.join(os.path.dirname(trained_model_file_path),
+                                                    self.model_pusher_config.portable_model_file_name)
+            metadata = {} if self.data_ingestion_artifact is None else {
+                "data_fingerprint": self.data_ingestion_artifact.data_fingerprint}
+            try:
+                return export_portable_model(heart_stroke_model, portable_model_file_path, metadata=metadata)
+            except ValueError as e:
+                logging.info(f"Model can not be exported as a portable model: {e}")
+                return None
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def get_version_metadata(self) -> dict:
+        """
+        metrics, data fingerprint and model of the pushed version, kept in its metadata.json
+        """
+        heart_stroke_model = self.artifact_store.load_object(
+            file_path=self.model_trainer_artifact.trained_model_file_path)
+        return {
+            "model": str(heart_stroke_model),
+            "metrics": dataclasses.asdict(self.model_trainer_artifact.metric_artifact),
+            "data_fingerprint": None if self.data_ingestion_artifact is None
+            else self.data_ingestion_artifact.data_fingerprint,
+        }
+
     def initiate_model_pusher(self) -> ModelPusherArtifact:
         """
         Method Name :   initiate_model_evaluation
@@ -28,13 +109,28 @@ class ModelPusher:
         """
         logging.info("Entered initiate_model_pusher method of ModelPusher class")
         try:
+            self.compile_model()
+            portable_model_file_path = self.export_portable_model()
+
             logging.info("Uploading artifacts folder to s3 bucket")
-            self.stroke_estimator.save_model(
-                from_file=self.model_trainer_artifact.trained_model_file_path
+            version_metadata = self.model_registry.register(
+                model_file_path=self.model_trainer_artifact.trained_model_file_path,
+                metadata=self.get_version_metadata(),
+                portable_model_file_path=portable_model_file_path,
             )
+            if self.model_pusher_config.promote:
+                update_legacy_key = self.model_pusher_config.update_legacy_key
+                self.model_registry.promote(
+                    version_metadata["version"],
+                    legacy_s3_model_key=self.model_pusher_config.s3_model_key_path if update_legacy_key else None,
+                    legacy_s3_portable_model_key=self.model_pusher_config.s3_portable_model_key_path
+                    if update_legacy_key else None,
+                )
             model_pusher_artifact = ModelPusherArtifact(
                 bucket_name=self.model_pusher_config.bucket_name,
-                s3_model_path=self.model_pusher_config.s3_model_key_path,
+                s3_model_path=version_metadata["model_key"],
+                s3_portable_model_path=version_metadata["portable_model_key"],
+                model_version=version_metadata["version"],
             )
             logging.info("Uploaded artifacts folder to s3 bucket")
             logging.info(f"Model pusher artifact: [{model_pusher_artifact}]")
@@ -1,8 +1,9 @@
 import sys
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from heart_stroke.entity.artifact_entity import (ClassificationMetricArtifact,
                                                  DataTransformationArtifact,
                                                  ModelTrainerArtifact)
@@ -10,8 +11,10 @@ from heart_stroke.entity.config_entity import ModelTrainerConfig
 from heart_stroke.entity.estimator import HeartStrokeModel
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.logger import logging
-from heart_stroke.utils.main_utils import (load_numpy_array_data, load_object,
-                                           read_yaml_file, save_object)
+from heart_stroke.utils.artifact_store import ArtifactStore
+from heart_stroke.utils.main_utils import read_yaml_file
+from heart_stroke.utils.model_factory import (BestModel, ParallelModelFactory,
+                                              fit_model, get_class_weight_params)
 from neuro_mf import ModelFactory
 from pandas import DataFrame
 from sklearn.metrics import (accuracy_score, f1_score, precision_score,
@@ -21,34 +24,112 @@ from sklearn.pipeline import Pipeline
 
 class ModelTrainer:
     def __init__(self, data_transformation_artifact: DataTransformationArtifact,
-                 model_trainer_config: ModelTrainerConfig):
+                 model_trainer_config: ModelTrainerConfig, artifact_store: Optional[ArtifactStore] = None,
+                 base_model: Optional[HeartStrokeModel] = None):
         """
         :param data_ingestion_artifact: Output reference of data ingestion artifact stage
         :param data_transformation_config: Configuration for data transformation
+        :param artifact_store: In memory artifacts of the current pipeline run
+        :param base_model: Production model to continue training from instead of a full model search
         """
         self.data_transformation_artifact = data_transformation_artifact
         self.model_trainer_config = model_trainer_config
+        self.artifact_store = ArtifactStore() if artifact_store is None else artifact_store
+        self.base_model = base_model
+
+    def get_warm_started_model(self, x_train: np.array, y_train: np.array,
+                               x_test: np.array, y_test: np.array) -> BestModel:
+        """
+        Method Name :   get_warm_started_model
+        Description :   This function continues training the production model on the new data, boosted models
+                        add warm_start_iterations trees on top of the production trees through init_model,
+                        other models are refitted with the production hyperparameters
+
+        Output      :   Returns best model report of the warm started model
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            base_model = self.base_model.trained_model_object
+            params = base_model.get_params()
+            if self.data_transformation_artifact.resampling_strategy == "class_weight":
+                params.update(get_class_weight_params(type(base_model)))
+            if type(base_model).__name__ == "CatBoostClassifier":
+                params["iterations"] = self.model_trainer_config.warm_start_iterations
+                model = type(base_model)(**params)
+                logging.info(f"Continuing training of the production model for {params['iterations']} iterations")
+                model.fit(x_train, y_train, init_model=base_model)
+            else:
+                logging.info(f"Refitting {type(base_model).__name__} with the production hyperparameters")
+                model = fit_model(type(base_model)(**params), x_train, y_train)
+
+            return BestModel(model_serial_number="warm_start",
+                             model=type(base_model)(**params),
+                             best_model=model,
+                             best_parameters=params,
+                             best_score=model.score(*self.get_model_input(model, x_test), y_test))
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
             
+    @staticmethod
+    def split_features_and_target(array: np.array) -> Tuple[np.array, np.array]:
+        """
+        split a transformed array, dense or sparse CSR, into its features and its target in the last column
+        """
+        features, target = array[:, :-1], array[:, -1]
+        if sp.issparse(array):
+            target = target.toarray().ravel()
+        return features, np.asarray(target)
+
+    @staticmethod
+    def requires_dense_input(model: object, features: np.array) -> bool:
+        """
+        True if the features are sparse and the fitted model only predicts on dense input
+        """
+        if not sp.issparse(features):
+            return False
+        try:
+            model.predict(features[:1])
+            return False
+        except (TypeError, ValueError):
+            return True
+
+    def get_model_input(self, model: object, features: np.array) -> Tuple[np.array]:
+        return (features.toarray(),) if self.requires_dense_input(model, features) else (features,)
+
     def get_model_object_and_report(self, train: np.array, test: np.array) -> Tuple[object, object]:
         """
         Method Name :   get_model_object_and_report
-        Description :   This function uses neuro_mf to get the best model object and report of the best model
+        Description :   This function uses neuro_mf or the parallel model factory, as selected by grid_search.engine
+                        of model.yaml, to get the best model object and report of the best model
         
         Output      :   Returns metric artifact object and best model object
         On Failure  :   Write an exception log and then raise an exception
         """
         try:
-            logging.info("Using neuro_mf to get best model object and report")
-            model_factory = ModelFactory(model_config_path=self.model_trainer_config.model_config_file_path)
-            
-            x_train, y_train, x_test, y_test = train[:, :-1], train[:, -1], test[:, :-1], test[:, -1]
+            (x_train, y_train), (x_test, y_test) = self.split_features_and_target(train), self.split_features_and_target(test)
 
-            best_model_detail = model_factory.get_best_model(
-                X=x_train,y=y_train,base_accuracy=self.model_trainer_config.expected_accuracy
-            )
+            if self.base_model is not None and self.data_transformation_artifact.warm_started:
+                best_model_detail = self.get_warm_started_model(x_train, y_train, x_test, y_test)
+            else:
+                model_config = read_yaml_file(file_path=self.model_trainer_config.model_config_file_path)
+                engine = model_config["grid_search"].get("engine", "neuro_mf")
+                logging.info(f"Using {engine} to get best model object and report")
+                class_weight = self.data_transformation_artifact.resampling_strategy == "class_weight"
+                if engine == "parallel":
+                    model_factory = ParallelModelFactory(model_config_path=self.model_trainer_config.model_config_file_path,
+                                                         class_weight=class_weight)
+                else:
+                    if class_weight:
+                        logging.info("neuro_mf does not support class weights, training without them")
+                    model_factory = ModelFactory(model_config_path=self.model_trainer_config.model_config_file_path)
+
+                best_model_detail = model_factory.get_best_model(
+                    X=x_train,y=y_train,base_accuracy=self.model_trainer_config.expected_accuracy
+                )
             model_obj = best_model_detail.best_model
 
-            y_pred = model_obj.predict(x_test)
+            y_pred = model_obj.predict(*self.get_model_input(model_obj, x_test))
             
             accuracy = accuracy_score(y_test, y_pred) 
             f1 = f1_score(y_test, y_pred)  
@@ -72,22 +153,26 @@ class ModelTrainer:
         """
         logging.info("Entered initiate_model_trainer method of ModelTrainer class")
         try:
-            train_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_file_path)
-            test_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_file_path)
+            train_arr = self.artifact_store.load_numpy_array_data(
+                file_path=self.data_transformation_artifact.transformed_train_file_path, mmap_mode="r")
+            test_arr = self.artifact_store.load_numpy_array_data(
+                file_path=self.data_transformation_artifact.transformed_test_file_path, mmap_mode="r")
             
             best_model_detail ,metric_artifact = self.get_model_object_and_report(train=train_arr, test=test_arr)
             
-            preprocessing_obj = load_object(file_path=self.data_transformation_artifact.transformed_object_file_path)
+            preprocessing_obj = self.artifact_store.load_object(file_path=self.data_transformation_artifact.transformed_object_file_path)
 
             if best_model_detail.best_score < self.model_trainer_config.expected_accuracy:
                 logging.info("No best model found with score more than base score")
                 raise Exception("No best model found with score more than base score")
 
             heart_stroke_model = HeartStrokeModel(preprocessing_object=preprocessing_obj,
-                                       trained_model_object=best_model_detail.best_model)
+                                       trained_model_object=best_model_detail.best_model,
+                                       dense_input=self.requires_dense_input(
+                                           best_model_detail.best_model, self.split_features_and_target(test_arr)[0]))
             logging.info("Created Heart Stroke object with preprocessor and model")
             logging.info("Created best model file path.")
-            save_object(self.model_trainer_config.trained_model_file_path, heart_stroke_model)
+            self.artifact_store.save_object(self.model_trainer_config.trained_model_file_path, heart_stroke_model)
 
             
             model_trainer_artifact = ModelTrainerArtifact(
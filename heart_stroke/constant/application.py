@@ -1,2 +1,41 @@
 APP_HOST = "0.0.0.0"
 APP_PORT = 8080
+
+# seconds between two freshness checks of the cached production model
+MODEL_CACHE_REFRESH_INTERVAL: int = 60
+
+# pickle serves the pickled HeartStrokeModel, portable the portable model bundle exported by the model pusher
+PREDICTION_MODEL_FORMAT: str = "pickle"
+# follow the current version of the model registry, the single model key is used while the registry is empty
+PREDICTION_USE_MODEL_REGISTRY: bool = True
+
+# background watcher of the served model: seconds between two checks of the model key or registry pointer,
+# a new model is loaded and smoke tested off the request path before it replaces the served one
+MODEL_HOT_RELOAD_ENABLED: bool = True
+MODEL_HOT_RELOAD_INTERVAL: int = 10
+# first record of the stroke dataset, predicted by every newly loaded model before it is served
+MODEL_SMOKE_TEST_RECORD: dict = {
+    "gender": "Male", "age": 67, "hypertension": 0, "heart_disease": 1, "ever_married": "Yes",
+    "work_type": "Private", "Residence_type": "Urban", "avg_glucose_level": 228.69, "bmi": 36.6,
+    "smoking_status": "formerly smoked",
+}
+
+# maximum number of records accepted by a single batch prediction request
+PREDICTION_BATCH_MAX_RECORDS: int = 10000
+
+# micro batching of concurrent single row predictions
+MICRO_BATCH_ENABLED: bool = True
+MICRO_BATCH_WINDOW_MS: int = 5
+MICRO_BATCH_MAX_SIZE: int = 64
+# requests waiting for a batch, further requests are rejected with 503
+MICRO_BATCH_MAX_QUEUE_SIZE: int = 1024
+
+# thread pool running blocking inference off the event loop
+INFERENCE_EXECUTOR_WORKERS: int = 4
+INFERENCE_EXECUTOR_MAX_PENDING: int = 64
+
+# training jobs run in a separate lower priority worker process
+TRAINING_JOB_NICENESS: int = 10
+TRAINING_JOB_MAX_HISTORY: int = 20
+# seconds a running training process gets to exit on server shutdown before it is killed
+TRAINING_JOB_SHUTDOWN_TIMEOUT: int = 10
@@ -1,2 +1,5 @@
 DATABASE_NAME = "ineuron"
 COLLECTION_NAME = "heart_stroke"
+
+# number of documents fetched and converted to a dataframe chunk at a time
+EXPORT_BATCH_SIZE = 10000
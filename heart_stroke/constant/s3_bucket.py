@@ -1 +1,19 @@
+import os
+import tempfile
+
 TRAINING_BUCKET_NAME = "heart-stroke"
+
+# seconds a HEAD result (ETag, size, last modified) of an object is reused before S3 is asked again
+S3_METADATA_CACHE_TTL: float = 5.0
+
+# ranged parallel downloads and multipart uploads: part size in bytes and number of parts in flight,
+# objects smaller than one part are transferred with a single request
+S3_TRANSFER_CHUNK_SIZE: int = 8 * 1024 * 1024
+S3_TRANSFER_MAX_CONCURRENCY: int = 8
+# local directory the models are downloaded to, an interrupted download resumes from its .part file
+S3_DOWNLOAD_DIR: str = os.path.join(tempfile.gettempdir(), "heart_stroke_models")
+
+# downloaded models are kept on the local disk by ETag and shared by all processes of the host
+MODEL_DISK_CACHE_ENABLED: bool = True
+MODEL_DISK_CACHE_DIR: str = os.path.join("artifact", "model_cache")
+MODEL_DISK_CACHE_MAX_SIZE: int = 2 * 1024 * 1024 * 1024
@@ -8,13 +8,22 @@ ARTIFACT_DIR: str = "artifact"
 
 # common file name
 
-FILE_NAME: str = "heart_stroke.csv"
-TRAIN_FILE_NAME: str = "train.csv"
-TEST_FILE_NAME: str = "test.csv"
+# file format of the dataframe artifacts: parquet, feather or csv
+ARTIFACT_FILE_FORMAT: str = "parquet"
+FILE_NAME: str = f"heart_stroke.{ARTIFACT_FILE_FORMAT}"
+TRAIN_FILE_NAME: str = f"train.{ARTIFACT_FILE_FORMAT}"
+TEST_FILE_NAME: str = f"test.{ARTIFACT_FILE_FORMAT}"
+TRANSFORMED_TRAIN_FILE_NAME: str = "train.npy"
+TRANSFORMED_TEST_FILE_NAME: str = "test.npy"
 PREPROCSSING_OBJECT_FILE_NAME = "preprocessing.pkl"
 MODEL_FILE_NAME = "model.pkl"
 SCHEMA_FILE_PATH = os.path.join("config", "schema.yaml")
 
+# content addressed cache of stage outputs shared by all pipeline runs
+STAGE_CACHE_DIR: str = os.path.join(ARTIFACT_DIR, "stage_cache")
+STAGE_CACHE_ENABLED: bool = True
+STAGE_CACHE_MAX_ENTRIES: int = 5
+
 """
 Data Ingestion related constant start with DATA_INGESTION VAR NAME
 """
@@ -23,6 +32,16 @@ DATA_INGESTION_DIR_NAME: str = "data_ingestion"
 DATA_INGESTION_FEATURE_STORE_DIR: str = "feature_store"
 DATA_INGESTION_INGESTED_DIR: str = "ingested"
 DATA_INGESTION_TRAIN_TEST_SPLIT_RATION: float = 0.2
+DATA_INGESTION_INCREMENTAL: bool = False
+DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR: str = os.path.join(ARTIFACT_DIR, "feature_store")
+DATA_INGESTION_PERSISTENT_FEATURE_STORE_FILE_NAME: str = "heart_stroke.csv"
+DATA_INGESTION_WATERMARK_FILE_NAME: str = "watermark.yaml"
+# a row is assigned to the train or test split by the hash of its id, so it keeps its split when rows are added.
+# Without the id column the split falls back to train_test_split with a fixed seed
+DATA_INGESTION_ROW_ID_COLUMN: str = "id"
+DATA_INGESTION_SPLIT_RANDOM_STATE: int = 42
+# train rows of the documents appended since the previous watermark, for the incremental preprocessing statistics
+DATA_INGESTION_NEW_TRAIN_FILE_NAME: str = f"train_new.{ARTIFACT_FILE_FORMAT}"
 
 """
 Data Validation realted contant start with DATA_VALIDATION VAR NAME
@@ -41,6 +60,25 @@ Data Transformation ralated constant start with DATA_TRANSFORMATION VAR NAME
 DATA_TRANSFORMATION_DIR_NAME: str = "data_transformation"
 DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR: str = "transformed"
 DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR: str = "transformed_object"
+# batch fits the preprocessor on the whole train set, streaming accumulates its statistics chunk by chunk
+DATA_TRANSFORMATION_FIT_MODE: str = "batch"
+DATA_TRANSFORMATION_FIT_CHUNK_SIZE: int = 50000
+DATA_TRANSFORMATION_RESERVOIR_SIZE: int = 100000
+# streaming statistics are saved next to the preprocessor and in a persistent copy with the ingestion watermark
+# they cover, the next streaming run of an incremental ingestion reloads the persistent copy and only accumulates
+# the train rows appended after that watermark, any other run accumulates the statistics from scratch
+DATA_TRANSFORMATION_STREAMING_STATS_FILE_NAME: str = "preprocessing_stats.pkl"
+DATA_TRANSFORMATION_PERSISTENT_STATS_DIR: str = os.path.join(ARTIFACT_DIR, "preprocessing_stats")
+DATA_TRANSFORMATION_INCREMENTAL_STATS: bool = False
+# one of heart_stroke.utils.resampling.RESAMPLING_STRATEGIES
+DATA_TRANSFORMATION_RESAMPLING_STRATEGY: str = "smoteenn"
+DATA_TRANSFORMATION_RESAMPLING_N_JOBS: int = -1
+# the test split is only transformed and keeps its real class distribution unless resampling is enabled
+DATA_TRANSFORMATION_RESAMPLE_TEST_SPLIT: bool = False
+# the transformed features are kept as a sparse CSR matrix when their density is below this threshold
+DATA_TRANSFORMATION_SPARSE_THRESHOLD: float = 0.3
+DATA_TRANSFORMATION_TRAIN_ARRAY_DTYPE: str = "float32"
+DATA_TRANSFORMATION_TEST_ARRAY_DTYPE: str = "float32"
 
 """
 MODEL TRAINER related constant start with MODEL_TRAINER var name
@@ -50,6 +88,9 @@ MODEL_TRAINER_TRAINED_MODEL_DIR: str = "trained_model"
 MODEL_TRAINER_TRAINED_MODEL_NAME: str = "model.pkl"
 MODEL_TRAINER_EXPECTED_SCORE: float = 0.6
 MODEL_TRAINER_MODEL_CONFIG_FILE_PATH: str = os.path.join("config", "model.yaml")
+# continue training the production model on the new data instead of a full model search
+MODEL_TRAINER_WARM_START: bool = False
+MODEL_TRAINER_WARM_START_ITERATIONS: int = 100
 """
 MODEL Evauation related constant start with MODEL_EVALUATION var name
 """
@@ -58,3 +99,17 @@ MODEL_EVALUATION_CHANGED_THRESHOLD_SCORE: float = 0.02
 
 MODEL_PUSHER_BUCKET_NAME = TRAINING_BUCKET_NAME
 MODEL_PUSHER_S3_KEY = "model-registry"
+# every push is an immutable version MODEL_PUSHER_S3_KEY/versions/<version>/ and the pointer
+# MODEL_PUSHER_S3_KEY/current.json names the version in production
+MODEL_REGISTRY_VERSIONS_DIR: str = "versions"
+MODEL_REGISTRY_POINTER_FILE_NAME: str = "current.json"
+MODEL_REGISTRY_METADATA_FILE_NAME: str = "metadata.json"
+# promote a pushed version right away, the model evaluation already accepted it
+MODEL_PUSHER_PROMOTE: bool = True
+# also copy a promoted model to the single key heart-stroke-model.pkl read by older servers
+MODEL_PUSHER_UPDATE_LEGACY_KEY: bool = True
+# compile the preprocessor of the pushed model into a NumPy kernel for serving
+MODEL_PUSHER_COMPILE_PREPROCESSOR: bool = True
+# export the pushed model as a portable bundle: compiled preprocessor json and the model in a native format
+MODEL_PUSHER_EXPORT_PORTABLE_MODEL: bool = True
+MODEL_PUSHER_PORTABLE_MODEL_NAME: str = "model.zip"
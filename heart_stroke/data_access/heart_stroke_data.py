@@ -1,12 +1,15 @@
 import os
 import sys
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from heart_stroke.configuration.mongo_db_connection import MongoDBClient
-from heart_stroke.constant.database import DATABASE_NAME
+from heart_stroke.constant.database import DATABASE_NAME, EXPORT_BATCH_SIZE
 from heart_stroke.exception import HeartStrokeException
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+from pymongo.collection import Collection
 
 
 class StrokeData:
@@ -18,25 +21,91 @@ class StrokeData:
         """
         try:
             self.mongo_client = MongoDBClient(database_name=DATABASE_NAME)
-            
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def get_collection(self, collection_name: str, database_name: Optional[str] = None) -> Collection:
+        if database_name is None:
+            return self.mongo_client.database[collection_name]
+        return self.mongo_client.client[database_name][collection_name]
+
+    @staticmethod
+    def records_to_dataframe(records: List[dict]) -> pd.DataFrame:
+        """
+        build one typed columnar chunk from a list of documents:
+        every column is materialized once as a numpy array, numeric columns get a numeric dtype
+        """
+        columns = {}
+        for column in dict.fromkeys(key for record in records for key in record):
+            values = np.empty(len(records), dtype=object)
+            values[:] = [record.get(column) for record in records]
+            try:
+                columns[column] = pd.to_numeric(values)
+            except (ValueError, TypeError):
+                columns[column] = values
+        return pd.DataFrame(columns, copy=False)
+
+    def iter_collection_chunks(self, collection_name: str, database_name: Optional[str] = None,
+                               batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[pd.DataFrame]:
+        try:
+            """
+            stream the collection without the _id field as dataframes of at most batch_size rows,
+            only one chunk of documents is held as python dicts at a time
+            """
+            collection = self.get_collection(collection_name, database_name)
+            cursor = collection.find({}, projection={"_id": 0}, batch_size=batch_size)
+
+            records = []
+            for record in cursor:
+                records.append(record)
+                if len(records) == batch_size:
+                    yield self.records_to_dataframe(records)
+                    records = []
+            if len(records) > 0:
+                yield self.records_to_dataframe(records)
+
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
-    def export_collection_as_dataframe(self, collection_name: str, 
-                                       database_name: Optional[str] = None) -> pd.DataFrame:
+    def iter_new_collection_chunks(self, collection_name: str, watermark: Optional[str] = None,
+                                   database_name: Optional[str] = None,
+                                   batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Tuple[pd.DataFrame, str]]:
+        try:
+            """
+            stream only the documents inserted after the watermark (the last exported _id) in _id order:
+            yields every chunk without the _id column together with the _id of its last document
+            """
+            collection = self.get_collection(collection_name, database_name)
+            query = {} if watermark is None else {"_id": {"$gt": ObjectId(watermark)}}
+            cursor = collection.find(query, batch_size=batch_size).sort("_id", ASCENDING)
+
+            records = []
+            last_id = None
+            for record in cursor:
+                last_id = record.pop("_id")
+                records.append(record)
+                if len(records) == batch_size:
+                    yield self.records_to_dataframe(records), str(last_id)
+                    records = []
+            if len(records) > 0:
+                yield self.records_to_dataframe(records), str(last_id)
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def export_collection_as_dataframe(self, collection_name: str,
+                                       database_name: Optional[str] = None,
+                                       batch_size: int = EXPORT_BATCH_SIZE) -> pd.DataFrame:
         try:
             """
             export entire collection as dataframe:
             return pd.DataFrame of collection
             """
-            if database_name is None:
-                collection = self.mongo_client.database[collection_name]
-            else:
-                collection = self.mongo_client[database_name][collection_name]
-            df = pd.DataFrame(list(collection.find()))
-            if "_id" in df.columns.to_list():
-                df = df.drop(columns=["_id"], axis=1)
-            return df
-        
+            chunks = list(self.iter_collection_chunks(collection_name, database_name, batch_size=batch_size))
+            if len(chunks) == 0:
+                return pd.DataFrame()
+            return pd.concat(chunks, ignore_index=True)
+
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
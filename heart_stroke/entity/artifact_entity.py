@@ -1,10 +1,16 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
 class DataIngestionArtifact:
     trained_file_path: str
     test_file_path: str
+    data_fingerprint: str
+    # incremental ingestion only: last _id exported before and by this run, and the train rows in between
+    previous_watermark: Optional[str] = None
+    watermark: Optional[str] = None
+    new_trained_file_path: Optional[str] = None
 
 
 @dataclass
@@ -19,6 +25,8 @@ class DataTransformationArtifact:
     transformed_object_file_path: str
     transformed_train_file_path: str
     transformed_test_file_path: str
+    warm_started: bool
+    resampling_strategy: str
 
 
 @dataclass
@@ -46,3 +54,5 @@ class ModelEvaluationArtifact:
 class ModelPusherArtifact:
     bucket_name: str
     s3_model_path: str
+    s3_portable_model_path: Optional[str] = None
+    model_version: Optional[str] = None
@@ -0,0 +1,157 @@
+from typing import Dict, List, Union
+
+import numpy as np
+from pandas import DataFrame
+
+# the fitted sklearn steps compile_preprocessor knows how to turn into kernel operations,
+# dispatched by type name so that neither this module nor the compiled kernel import sklearn
+SUPPORTED_STEPS = ("SimpleImputer", "StandardScaler", "OneHotEncoder", "PowerTransformer")
+
+
+def _yeo_johnson(values: np.array, lambdas: np.array) -> np.array:
+    """
+    Yeo-Johnson transform of every column of values with its lambda, same branches as sklearn
+    """
+    out = np.empty_like(values)
+    for column, lmbda in enumerate(lambdas):
+        x = values[:, column]
+        positive = x >= 0
+        if abs(lmbda) < np.spacing(1.0):
+            out[positive, column] = np.log1p(x[positive])
+        else:
+            out[positive, column] = (np.power(x[positive] + 1, lmbda) - 1) / lmbda
+        if abs(lmbda - 2) > np.spacing(1.0):
+            out[~positive, column] = -(np.power(-x[~positive] + 1, 2 - lmbda) - 1) / (2 - lmbda)
+        else:
+            out[~positive, column] = -np.log1p(-x[~positive])
+        out[np.isnan(x), column] = np.nan
+    return out
+
+
+class CompiledPreprocessor:
+    """
+    This class is a flat NumPy kernel of a fitted ColumnTransformer: every transformer is a block of input
+    columns with a list of operations (impute, scale, one_hot, yeo_johnson) applied in one vectorized pass,
+    without the pandas column selection, input validation and Pipeline dispatch of sklearn
+    """
+
+    def __init__(self, blocks: List[dict]):
+        """
+        :param blocks: [{"columns": [...], "steps": [{"op": ..., ...}, ...]}, ...] in output column order
+        """
+        self.blocks = blocks
+        self._lookups = [
+            [{category: index for index, category in enumerate(categories)} for categories in step["categories"]]
+            if step["op"] == "one_hot" else None
+            for block in blocks for step in block["steps"]
+        ]
+
+    @staticmethod
+    def _column(data: Union[DataFrame, List[dict]], column: str) -> np.array:
+        if isinstance(data, DataFrame):
+            return data[column].to_numpy()
+        return np.array([record.get(column) for record in data], dtype=object)
+
+    def transform(self, data: Union[DataFrame, List[dict], dict]) -> np.array:
+        """
+        transform a dataframe, a list of records or a single record into the feature matrix
+        """
+        if isinstance(data, dict):
+            data = [data]
+        outputs = []
+        lookups = iter(self._lookups)
+        for block in self.blocks:
+            values = np.column_stack([self._column(data, column) for column in block["columns"]])
+            if not any(step["op"] == "one_hot" for step in block["steps"]):
+                if values.dtype == object:
+                    values[np.equal(values, None)] = np.nan
+                values = values.astype(np.float64)
+            for step in block["steps"]:
+                values = self._apply(step, values, next(lookups), block["columns"])
+            outputs.append(values)
+        return np.hstack(outputs)
+
+    @staticmethod
+    def _apply(step: dict, values: np.array, lookups: List[Dict], columns: List[str]) -> np.array:
+        op = step["op"]
+        if op == "impute":
+            statistics = np.asarray(step["statistics"], dtype=np.float64)
+            return np.where(np.isnan(values), statistics, values)
+        if op == "scale":
+            if step["mean"] is not None:
+                values = values - np.asarray(step["mean"])
+            if step["scale"] is not None:
+                values = values / np.asarray(step["scale"])
+            return values
+        if op == "yeo_johnson":
+            return _yeo_johnson(values, np.asarray(step["lambdas"], dtype=np.float64))
+        if op == "one_hot":
+            widths = [len(categories) for categories in step["categories"]]
+            offsets = np.concatenate([[0], np.cumsum(widths)[:-1]]).astype(int)
+            encoded = np.zeros((len(values), sum(widths)))
+            for column, (lookup, offset) in enumerate(zip(lookups, offsets)):
+                indexes = np.fromiter((lookup.get(value, -1) for value in values[:, column]),
+                                      dtype=np.int64, count=len(values))
+                known = indexes >= 0
+                if not known.all() and step["handle_unknown"] == "error":
+                    raise ValueError(f"Found unknown categories {set(values[~known, column])} "
+                                     f"in column {columns[column]}")
+                encoded[np.flatnonzero(known), offset + indexes[known]] = 1.0
+            return encoded
+        raise ValueError(f"Unknown operation [{op}]")
+
+    def to_dict(self) -> dict:
+        return {"blocks": self.blocks}
+
+    @classmethod
+    def from_dict(cls, content: dict) -> "CompiledPreprocessor":
+        return cls(blocks=content["blocks"])
+
+
+def _to_list(values) -> list:
+    return np.asarray(values).tolist()
+
+
+def _compile_step(step: object) -> List[dict]:
+    step_type = type(step).__name__
+    if step_type == "SimpleImputer":
+        missing_values = step.missing_values
+        if not (isinstance(missing_values, float) and np.isnan(missing_values)):
+            raise ValueError(f"SimpleImputer with missing_values={missing_values} is not supported")
+        return [{"op": "impute", "statistics": _to_list(np.asarray(step.statistics_, dtype=np.float64))}]
+    if step_type == "StandardScaler":
+        return [{"op": "scale",
+                 "mean": _to_list(step.mean_) if step.with_mean else None,
+                 "scale": _to_list(step.scale_) if step.with_std else None}]
+    if step_type == "OneHotEncoder":
+        if step.drop is not None:
+            raise ValueError("OneHotEncoder with drop is not supported")
+        return [{"op": "one_hot", "categories": [_to_list(categories) for categories in step.categories_],
+                 "handle_unknown": step.handle_unknown}]
+    if step_type == "PowerTransformer":
+        if step.method != "yeo-johnson":
+            raise ValueError(f"PowerTransformer with method={step.method} is not supported")
+        ops = [{"op": "yeo_johnson", "lambdas": _to_list(step.lambdas_)}]
+        if step.standardize:
+            ops.append({"op": "scale", "mean": _to_list(step._scaler.mean_), "scale": _to_list(step._scaler.scale_)})
+        return ops
+    if step_type == "Pipeline":
+        return [op for _, pipeline_step in step.steps for op in _compile_step(pipeline_step)]
+    raise ValueError(f"{step_type} is not supported, supported steps are {SUPPORTED_STEPS}")
+
+
+def compile_preprocessor(preprocessor: object) -> CompiledPreprocessor:
+    """
+    compile a fitted ColumnTransformer built from SUPPORTED_STEPS into a CompiledPreprocessor,
+    raises ValueError for any other step
+    """
+    if type(preprocessor).__name__ != "ColumnTransformer":
+        raise ValueError(f"{type(preprocessor).__name__} is not supported, expected a ColumnTransformer")
+    blocks = []
+    for name, transformer, columns in preprocessor.transformers_:
+        if isinstance(transformer, str) and (transformer == "drop" or len(columns) == 0):
+            continue
+        if isinstance(transformer, str):
+            raise ValueError(f"ColumnTransformer with {transformer} columns is not supported")
+        blocks.append({"columns": list(columns), "steps": _compile_step(transformer)})
+    return CompiledPreprocessor(blocks=blocks)
@@ -1,9 +1,12 @@
 import os
 from heart_stroke.constant.training_pipeline import *
+from heart_stroke.constant.database import EXPORT_BATCH_SIZE
 from heart_stroke.constant.s3_bucket import TRAINING_BUCKET_NAME
+from heart_stroke.constant.application import *
 from pymongo import MongoClient
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Optional
 
 TIMESTAMP: str = datetime.now().strftime("%m_%d_%Y_%H_%M_%S")
 
@@ -13,6 +16,9 @@ class TrainingPipelineConfig:
     pipeline_name: str = PIPELINE_NAME
     artifact_dir: str = os.path.join(ARTIFACT_DIR, TIMESTAMP)
     timestamp: str = TIMESTAMP
+    stage_cache_dir: str = STAGE_CACHE_DIR
+    stage_cache_enabled: bool = STAGE_CACHE_ENABLED
+    stage_cache_max_entries: int = STAGE_CACHE_MAX_ENTRIES
 
 
 training_pipeline_config: TrainingPipelineConfig = TrainingPipelineConfig()
@@ -24,8 +30,18 @@ class DataIngestionConfig:
     feature_store_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_FEATURE_STORE_DIR, FILE_NAME)
     training_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR, TRAIN_FILE_NAME)
     testing_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR, TEST_FILE_NAME)
+    new_training_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR,
+                                               DATA_INGESTION_NEW_TRAIN_FILE_NAME)
     train_test_split_ratio: float = DATA_INGESTION_TRAIN_TEST_SPLIT_RATION
+    row_id_column: str = DATA_INGESTION_ROW_ID_COLUMN
+    split_random_state: int = DATA_INGESTION_SPLIT_RANDOM_STATE
     collection_name:str = DATA_INGESTION_COLLECTION_NAME
+    export_batch_size: int = EXPORT_BATCH_SIZE
+    incremental: bool = DATA_INGESTION_INCREMENTAL
+    persistent_feature_store_file_path: str = os.path.join(DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR,
+                                                           DATA_INGESTION_PERSISTENT_FEATURE_STORE_FILE_NAME)
+    watermark_file_path: str = os.path.join(DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR,
+                                            DATA_INGESTION_WATERMARK_FILE_NAME)
 
 
 @dataclass
@@ -39,12 +55,26 @@ class DataValidationConfig:
 class DataTransformationConfig:
     data_transformation_dir: str = os.path.join(training_pipeline_config.artifact_dir, DATA_TRANSFORMATION_DIR_NAME)
     transformed_train_file_path: str = os.path.join(data_transformation_dir, DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
-                                                    TRAIN_FILE_NAME.replace("csv", "npy"))
+                                                    TRANSFORMED_TRAIN_FILE_NAME)
     transformed_test_file_path: str = os.path.join(data_transformation_dir, DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
-                                                   TEST_FILE_NAME.replace("csv", "npy"))
+                                                   TRANSFORMED_TEST_FILE_NAME)
     transformed_object_file_path: str = os.path.join(data_transformation_dir,
                                                      DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR,
                                                      PREPROCSSING_OBJECT_FILE_NAME)
+    fit_mode: str = DATA_TRANSFORMATION_FIT_MODE
+    fit_chunk_size: int = DATA_TRANSFORMATION_FIT_CHUNK_SIZE
+    reservoir_size: int = DATA_TRANSFORMATION_RESERVOIR_SIZE
+    streaming_stats_file_path: str = os.path.join(data_transformation_dir, DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR,
+                                                  DATA_TRANSFORMATION_STREAMING_STATS_FILE_NAME)
+    persistent_streaming_stats_file_path: str = os.path.join(DATA_TRANSFORMATION_PERSISTENT_STATS_DIR,
+                                                             DATA_TRANSFORMATION_STREAMING_STATS_FILE_NAME)
+    incremental_stats: bool = DATA_TRANSFORMATION_INCREMENTAL_STATS
+    resampling_strategy: str = DATA_TRANSFORMATION_RESAMPLING_STRATEGY
+    resampling_n_jobs: int = DATA_TRANSFORMATION_RESAMPLING_N_JOBS
+    resample_test_split: bool = DATA_TRANSFORMATION_RESAMPLE_TEST_SPLIT
+    sparse_threshold: float = DATA_TRANSFORMATION_SPARSE_THRESHOLD
+    train_array_dtype: str = DATA_TRANSFORMATION_TRAIN_ARRAY_DTYPE
+    test_array_dtype: str = DATA_TRANSFORMATION_TEST_ARRAY_DTYPE
 
 
 @dataclass
@@ -53,6 +83,8 @@ class ModelTrainerConfig:
     trained_model_file_path: str = os.path.join(model_trainer_dir, MODEL_TRAINER_TRAINED_MODEL_DIR, MODEL_FILE_NAME)
     expected_accuracy: float = MODEL_TRAINER_EXPECTED_SCORE
     model_config_file_path: str = MODEL_TRAINER_MODEL_CONFIG_FILE_PATH
+    warm_start: bool = MODEL_TRAINER_WARM_START
+    warm_start_iterations: int = MODEL_TRAINER_WARM_START_ITERATIONS
 
 
 @dataclass
@@ -60,6 +92,9 @@ class ModelEvaluationConfig:
     changed_threshold_score: float = MODEL_EVALUATION_CHANGED_THRESHOLD_SCORE
     bucket_name: str = MODEL_PUSHER_BUCKET_NAME
     s3_model_key_path: str = "heart-stroke-model.pkl"
+    registry_key: str = MODEL_PUSHER_S3_KEY
+    # registry version to compare the trained model with, None for the current version
+    model_version: Optional[str] = None
 
 
 
@@ -67,10 +102,48 @@ class ModelEvaluationConfig:
 class ModelPusherConfig:
     bucket_name: str = MODEL_PUSHER_BUCKET_NAME
     s3_model_key_path: str = "heart-stroke-model.pkl"
+    compile_preprocessor: bool = MODEL_PUSHER_COMPILE_PREPROCESSOR
+    export_portable_model: bool = MODEL_PUSHER_EXPORT_PORTABLE_MODEL
+    portable_model_file_name: str = MODEL_PUSHER_PORTABLE_MODEL_NAME
+    s3_portable_model_key_path: str = "heart-stroke-model.zip"
+    registry_key: str = MODEL_PUSHER_S3_KEY
+    promote: bool = MODEL_PUSHER_PROMOTE
+    update_legacy_key: bool = MODEL_PUSHER_UPDATE_LEGACY_KEY
 
 
 @dataclass
 class StrokePredictorConfig:
     model_file_path: str = "heart-stroke-model.pkl"
+    portable_model_file_path: str = "heart-stroke-model.zip"
+    model_format: str = PREDICTION_MODEL_FORMAT
     model_bucket_name: str = TRAINING_BUCKET_NAME
+    use_model_registry: bool = PREDICTION_USE_MODEL_REGISTRY
+    model_registry_key: str = MODEL_PUSHER_S3_KEY
+    model_refresh_interval: int = MODEL_CACHE_REFRESH_INTERVAL
 
+
+@dataclass
+class MicroBatcherConfig:
+    enabled: bool = MICRO_BATCH_ENABLED
+    window_ms: int = MICRO_BATCH_WINDOW_MS
+    max_batch_size: int = MICRO_BATCH_MAX_SIZE
+    max_queue_size: int = MICRO_BATCH_MAX_QUEUE_SIZE
+
+
+@dataclass
+class ModelReloaderConfig:
+    enabled: bool = MODEL_HOT_RELOAD_ENABLED
+    poll_interval: int = MODEL_HOT_RELOAD_INTERVAL
+
+
+@dataclass
+class ExecutorConfig:
+    inference_workers: int = INFERENCE_EXECUTOR_WORKERS
+    inference_max_pending: int = INFERENCE_EXECUTOR_MAX_PENDING
+
+
+@dataclass
+class TrainingJobConfig:
+    niceness: int = TRAINING_JOB_NICENESS
+    max_job_history: int = TRAINING_JOB_MAX_HISTORY
+    shutdown_timeout: int = TRAINING_JOB_SHUTDOWN_TIMEOUT
@@ -1,21 +1,70 @@
 import os
 import sys
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional, Tuple
 
+import numpy as np
 from pandas import DataFrame
+from heart_stroke.entity.compiled_preprocessor import CompiledPreprocessor, compile_preprocessor
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.logger import logging
-from sklearn.compose import ColumnTransformer
+
+# only needed for the annotations, serving a portable model never imports sklearn
+if TYPE_CHECKING:
+    from sklearn.compose import ColumnTransformer
 
 
 class HeartStrokeModel:
-    def __init__(self, preprocessing_object: ColumnTransformer, trained_model_object: object):
+    def __init__(self, preprocessing_object: "ColumnTransformer", trained_model_object: object,
+                 dense_input: bool = False):
         """
         :param preprocessing_object: Input Object of preprocesser
         :param trained_model_object: Input Object of trained model 
+        :param dense_input: Densify sparse preprocessor output for trained models that only accept dense input
         """
         self.preprocessing_object = preprocessing_object
         self.trained_model_object = trained_model_object
+        self.dense_input = dense_input
+        self.compiled_preprocessor: Optional[CompiledPreprocessor] = None
+
+    def compile(self, dataframe: DataFrame, tolerance: float = 1e-6) -> bool:
+        """
+        Function compiles preprocessing_object into a NumPy kernel used by transform from then on,
+        the kernel is only kept when its output on dataframe matches the sklearn output within tolerance
+        """
+        try:
+            compiled_preprocessor = compile_preprocessor(self.preprocessing_object)
+        except ValueError as e:
+            logging.info(f"Preprocessor can not be compiled: {e}")
+            return False
+
+        expected = self.preprocessing_object.transform(dataframe)
+        expected = expected.toarray() if hasattr(expected, "toarray") else np.asarray(expected)
+        actual = compiled_preprocessor.transform(dataframe)
+        if actual.shape != expected.shape or not np.allclose(actual, expected, rtol=tolerance, atol=tolerance,
+                                                             equal_nan=True):
+            difference = np.abs(actual - expected).max() if actual.shape == expected.shape else actual.shape
+            logging.info(f"Compiled preprocessor does not match the sklearn output: {difference}")
+            return False
+
+        logging.info(f"Compiled preprocessor matches the sklearn output on {len(dataframe)} rows")
+        self.compiled_preprocessor = compiled_preprocessor
+        return True
+
+    def transform(self, dataframe: DataFrame):
+        """
+        Function transforms raw inputs into the features the trained model expects,
+        with the compiled preprocessor when the model has one
+        """
+        # getattr keeps models pickled before compiled_preprocessor was added loadable
+        compiled_preprocessor = getattr(self, "compiled_preprocessor", None)
+        if compiled_preprocessor is not None:
+            return compiled_preprocessor.transform(dataframe)
+        transformed_feature = self.preprocessing_object.transform(dataframe)
+        # getattr keeps models pickled before dense_input was added loadable
+        if getattr(self, "dense_input", False) and hasattr(transformed_feature, "toarray"):
+            transformed_feature = transformed_feature.toarray()
+        return transformed_feature
 
     def predict(self, dataframe: DataFrame) -> DataFrame:
         """
@@ -28,7 +77,7 @@ class HeartStrokeModel:
         try:
             logging.info("Using the trained model to get predictions")
 
-            transformed_feature = self.preprocessing_object.transform(dataframe)
+            transformed_feature = self.transform(dataframe)
 
             logging.info("Used the trained model to get predictions")
             return self.trained_model_object.predict(transformed_feature)
@@ -36,6 +85,49 @@ class HeartStrokeModel:
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
+    def predict_with_proba(self, dataframe: DataFrame) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Function accepts a batch of raw inputs, transforms the whole batch with a single
+        preprocessing_object call and returns the predicted labels with the positive class probabilities.
+        Probabilities are None when the trained model does not support predict_proba
+        """
+        logging.info("Entered predict_with_proba method of HeartStrokeModel class")
+
+        try:
+            transformed_feature = self.transform(dataframe)
+
+            if not hasattr(self.trained_model_object, "predict_proba"):
+                return np.asarray(self.trained_model_object.predict(transformed_feature)), None
+
+            probabilities = np.asarray(self.trained_model_object.predict_proba(transformed_feature))
+            classes = np.asarray(self.trained_model_object.classes_)
+            labels = classes.take(probabilities.argmax(axis=1))
+            positive_class = np.flatnonzero(classes == 1)
+            positive_probabilities = probabilities[:, positive_class[0]] if len(positive_class) else None
+
+            logging.info("Exited predict_with_proba method of HeartStrokeModel class")
+            return labels, positive_probabilities
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def is_compatible_with(self, schema_config: dict) -> bool:
+        """
+        Function checks that the fitted preprocessing_object transforms exactly the columns of the given schema
+        with the same pipelines, so that its output feature space matches the one of a new training run
+        """
+        transformers = getattr(self.preprocessing_object, "transformers_", None)
+        if transformers is None:
+            return False
+
+        fitted_columns = {name: list(columns) for name, _, columns in transformers if name != "remainder"}
+        schema_columns = {
+            "Numeric_Pipeline": list(schema_config["Numerical_columns"]),
+            "Categorical_Pipeline": list(schema_config["Categorical_columns"]),
+            "Power_Transformation": list(schema_config["Transformation_columns"]),
+        }
+        return fitted_columns == schema_columns
+
     def __repr__(self):
         return f"{type(self.trained_model_object).__name__}()"
 
@@ -0,0 +1,175 @@
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from heart_stroke.entity.estimator import HeartStrokeModel
+from heart_stroke.entity.model_registry import ModelRegistry
+from heart_stroke.entity.s3_estimator import StrokeEstimator
+from heart_stroke.exception import HeartStrokeException
+from heart_stroke.logger import logging
+
+
+@dataclass
+class CachedModel:
+    etag: Optional[str]
+    model: HeartStrokeModel
+    loaded_at: float
+    checked_at: float
+    # registry version of the model, None for a model loaded from the single model key
+    version: Optional[str] = None
+
+
+class ModelCache:
+    """
+    This class keeps one loaded production model per (bucket_name, model_path) for the whole process.
+    A cached model is identified by its bucket, key and ETag, once the refresh interval has elapsed
+    a single HEAD request checks the ETag in the background and the model is reloaded only if it changed.
+    With a model registry the ETag of its current version pointer is watched instead, the model key is
+    only read while the registry has no current version. A newly loaded model is passed to warm_up before
+    it replaces the cached one, a model failing it is never served
+    """
+
+    _models: Dict[Tuple[str, str], CachedModel] = {}
+    _lock = threading.Lock()
+    _key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+    _refreshing: set = set()
+
+    def __init__(self, bucket_name: str, model_path: str, refresh_interval: int, model_format: str = "pickle",
+                 model_registry: Optional[ModelRegistry] = None,
+                 warm_up: Optional[Callable[[HeartStrokeModel], None]] = None):
+        """
+        :param bucket_name: Name of your model bucket
+        :param model_path: Location of your model in bucket
+        :param refresh_interval: Seconds between two freshness checks of the cached model
+        :param model_format: pickle for a pickled HeartStrokeModel, portable for a portable model bundle
+        :param model_registry: Model registry whose current version is served
+        :param warm_up: Function run on every newly loaded model before it is served, raises to reject it
+        """
+        self.bucket_name = bucket_name
+        self.model_path = model_path
+        self.model_format = model_format
+        self.model_registry = model_registry
+        self.warm_up = warm_up
+        # get_model refreshes the model in a background thread, turned off while a ModelReloader watches it
+        self.background_refresh = True
+        # ETag of the last model failing warm_up, it is not loaded again until the ETag changes
+        self.rejected_etag: Optional[str] = None
+        self.refresh_interval = refresh_interval
+        self.cache_key = (bucket_name, model_path)
+
+    def _get_key_lock(self) -> threading.Lock:
+        with ModelCache._lock:
+            if self.cache_key not in ModelCache._key_locks:
+                ModelCache._key_locks[self.cache_key] = threading.Lock()
+            return ModelCache._key_locks[self.cache_key]
+
+    def _load_model(self, estimator: StrokeEstimator, etag: Optional[str]) -> HeartStrokeModel:
+        if etag is not None and etag == self.rejected_etag:
+            raise Exception(f"Model with ETag {etag} failed its warm up, waiting for a new model")
+        model = estimator.load_model()
+        if self.warm_up is not None:
+            started_at = time.perf_counter()
+            try:
+                self.warm_up(model)
+            except Exception:
+                self.rejected_etag = etag
+                raise
+            logging.info(f"Warmed up model {model} in {time.perf_counter() - started_at:.3f} seconds")
+        return model
+
+    def _load_from_registry(self) -> Optional[CachedModel]:
+        """
+        Loads the current version of the registry unless it is already cached, None while no version was promoted
+        """
+        pointer_etag = self.model_registry.get_pointer_etag()
+        if pointer_etag is None:
+            return None
+        now = time.monotonic()
+        cached_model = ModelCache._models.get(self.cache_key)
+        if cached_model is not None and cached_model.etag == pointer_etag:
+            cached_model.checked_at = now
+            return cached_model
+
+        pointer = self.model_registry.get_current()
+        if pointer is None:
+            return None
+        if cached_model is not None and cached_model.version == pointer["version"]:
+            cached_model.etag, cached_model.checked_at = pointer_etag, now
+            return cached_model
+
+        logging.info(f"Loading model version {pointer['version']} from {self.bucket_name} bucket")
+        estimator = StrokeEstimator(bucket_name=self.bucket_name,
+                                    model_path=ModelRegistry.get_model_key(pointer, self.model_format),
+                                    model_format=self.model_format)
+        cached_model = CachedModel(etag=pointer_etag, model=self._load_model(estimator, pointer_etag),
+                                   loaded_at=now, checked_at=now, version=pointer["version"])
+        ModelCache._models[self.cache_key] = cached_model
+        return cached_model
+
+    def load(self) -> CachedModel:
+        """
+        Loads the model from s3 bucket unless the cached model already has the current ETag
+        """
+        try:
+            with self._get_key_lock():
+                if self.model_registry is not None:
+                    cached_model = self._load_from_registry()
+                    if cached_model is not None:
+                        return cached_model
+                estimator = StrokeEstimator(bucket_name=self.bucket_name, model_path=self.model_path,
+                                            model_format=self.model_format)
+                etag = estimator.s3.get_object_etag(bucket_name=self.bucket_name, s3_key=self.model_path)
+                now = time.monotonic()
+                cached_model = ModelCache._models.get(self.cache_key)
+
+                if cached_model is not None and etag is not None and cached_model.etag == etag:
+                    cached_model.checked_at = now
+                    return cached_model
+
+                logging.info(f"Loading model {self.model_path} from {self.bucket_name} bucket with ETag {etag}")
+                cached_model = CachedModel(etag=etag, model=self._load_model(estimator, etag), loaded_at=now,
+                                           checked_at=now)
+                ModelCache._models[self.cache_key] = cached_model
+                return cached_model
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def _refresh(self) -> None:
+        try:
+            self.load()
+        except Exception as e:
+            logging.info(f"Background refresh of model {self.model_path} failed: {e}")
+            cached_model = ModelCache._models.get(self.cache_key)
+            if cached_model is not None:
+                cached_model.checked_at = time.monotonic()
+        finally:
+            with ModelCache._lock:
+                ModelCache._refreshing.discard(self.cache_key)
+
+    def _refresh_in_background(self) -> None:
+        with ModelCache._lock:
+            if self.cache_key in ModelCache._refreshing:
+                return
+            ModelCache._refreshing.add(self.cache_key)
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def get_cached_model(self) -> Optional[CachedModel]:
+        return ModelCache._models.get(self.cache_key)
+
+    def get_model(self) -> HeartStrokeModel:
+        """
+        Returns the cached model, the model is loaded synchronously only when it was never loaded before
+        """
+        try:
+            cached_model = ModelCache._models.get(self.cache_key)
+            if cached_model is None:
+                cached_model = self.load()
+            elif self.background_refresh and time.monotonic() - cached_model.checked_at >= self.refresh_interval:
+                self._refresh_in_background()
+            return cached_model.model
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
@@ -0,0 +1,241 @@
+import sys
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from heart_stroke.cloud_storage.aws_storage import ObjectChangedError, SimpleStorageService, get_file_sha256
+from heart_stroke.constant.training_pipeline import (MODEL_PUSHER_S3_KEY, MODEL_REGISTRY_METADATA_FILE_NAME,
+                                                     MODEL_REGISTRY_POINTER_FILE_NAME, MODEL_REGISTRY_VERSIONS_DIR)
+from heart_stroke.entity.s3_estimator import StrokeEstimator
+from heart_stroke.exception import HeartStrokeException
+from heart_stroke.logger import logging
+
+MODEL_FILE_NAME = "model.pkl"
+PORTABLE_MODEL_FILE_NAME = "model.zip"
+# number of previously promoted versions kept in the pointer for rollback
+POINTER_HISTORY_SIZE = 20
+# conditional writes of the pointer before a promotion racing with others gives up
+POINTER_WRITE_ATTEMPTS = 5
+
+
+class ModelRegistry:
+    """
+    This class keeps every pushed model as an immutable version in s3:
+
+        <registry_key>/versions/<version>/model.pkl       pickled HeartStrokeModel
+        <registry_key>/versions/<version>/model.zip       portable model bundle, when exported
+        <registry_key>/versions/<version>/metadata.json   metrics, data fingerprint, timestamp, ETags
+        <registry_key>/current.json                       pointer to the version in production
+
+    metadata.json is written last, a version without it is incomplete and is never promoted. Promotion and
+    rollback only rewrite the small pointer object, conditionally on its ETag so that concurrent promotions
+    never lose each other's history, servers poll its ETag and load a version once
+    """
+
+    def __init__(self, bucket_name: str, registry_key: str = MODEL_PUSHER_S3_KEY):
+        """
+        :param bucket_name: Name of your model bucket
+        :param registry_key: Prefix of the registry in the bucket
+        """
+        self.bucket_name = bucket_name
+        self.registry_key = registry_key.rstrip("/")
+        self._s3: Optional[SimpleStorageService] = None
+
+    @property
+    def s3(self) -> SimpleStorageService:
+        # created on first use, so that a server can be configured with a registry before s3 is reachable
+        if self._s3 is None:
+            self._s3 = SimpleStorageService()
+        return self._s3
+
+    @property
+    def pointer_key(self) -> str:
+        return f"{self.registry_key}/{MODEL_REGISTRY_POINTER_FILE_NAME}"
+
+    def get_version_key(self, version: str, file_name: str) -> str:
+        return f"{self.registry_key}/{MODEL_REGISTRY_VERSIONS_DIR}/{version}/{file_name}"
+
+    @staticmethod
+    def new_version(model_file_path: str) -> str:
+        """
+        sortable version name: UTC push time and the start of the sha256 of the model file
+        """
+        return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{get_file_sha256(model_file_path)[:8]}"
+
+    def register(self, model_file_path: str, metadata: dict,
+                 portable_model_file_path: Optional[str] = None) -> dict:
+        """
+        Method Name :   register
+        Description :   This method uploads the model files as a new immutable version and writes its metadata
+
+        Output      :   Metadata of the registered version
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            version = self.new_version(model_file_path)
+            metadata_key = self.get_version_key(version, MODEL_REGISTRY_METADATA_FILE_NAME)
+            if self.s3.object_exists(self.bucket_name, metadata_key, max_age=0):
+                raise Exception(f"Model version {version} is already registered")
+
+            version_metadata = {"version": version, "created_at": datetime.now(timezone.utc).isoformat(),
+                                "portable_model_key": None, "portable_model_etag": None, **metadata}
+            files = [("model", model_file_path, MODEL_FILE_NAME)]
+            if portable_model_file_path is not None:
+                files.append(("portable_model", portable_model_file_path, PORTABLE_MODEL_FILE_NAME))
+            for name, file_path, file_name in files:
+                s3_key = self.get_version_key(version, file_name)
+                self.s3.upload_file(file_path, to_filename=s3_key, bucket_name=self.bucket_name, remove=False)
+                version_metadata[f"{name}_key"] = s3_key
+                version_metadata[f"{name}_etag"] = self.s3.get_object_etag(self.bucket_name, s3_key, max_age=0)
+
+            self.s3.put_json_object(version_metadata, metadata_key, bucket_name=self.bucket_name)
+            logging.info(f"Registered model version {version}")
+            return version_metadata
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def get_version(self, version: str) -> Optional[dict]:
+        """
+        metadata of the version, None if the version does not exist or is incomplete
+        """
+        return self.s3.get_json_object(self.get_version_key(version, MODEL_REGISTRY_METADATA_FILE_NAME),
+                                       bucket_name=self.bucket_name)
+
+    def list_versions(self) -> List[str]:
+        """
+        all versions of the registry, oldest first
+        """
+        prefix = f"{self.registry_key}/{MODEL_REGISTRY_VERSIONS_DIR}/"
+        return sorted(key[len(prefix):].rstrip("/") for key in self.s3.list_prefixes(prefix, self.bucket_name))
+
+    def get_current(self) -> Optional[dict]:
+        """
+        content of the pointer, None while no version was promoted
+        """
+        return self.s3.get_json_object(self.pointer_key, bucket_name=self.bucket_name)
+
+    def get_pointer_etag(self, max_age: Optional[float] = None) -> Optional[str]:
+        """
+        ETag of the pointer, a single HEAD request telling whether the version in production changed
+        """
+        return self.s3.get_object_etag(self.bucket_name, self.pointer_key, max_age=max_age)
+
+    @staticmethod
+    def _new_pointer(version_metadata: dict, history: List[str]) -> dict:
+        return {
+            "version": version_metadata["version"],
+            "model_key": version_metadata["model_key"],
+            "portable_model_key": version_metadata.get("portable_model_key"),
+            "promoted_at": datetime.now(timezone.utc).isoformat(),
+            "history": history[-POINTER_HISTORY_SIZE:],
+        }
+
+    def _update_pointer(self, get_pointer: Callable[[Optional[dict]], dict]) -> dict:
+        """
+        read, modify and conditionally write the pointer: get_pointer builds the new pointer from the current one
+        and the PUT only succeeds while the pointer still has the ETag it was read with. A concurrent promotion
+        fails the PUT with 412 and the update is retried on the pointer it wrote
+        """
+        for attempt in range(1, POINTER_WRITE_ATTEMPTS + 1):
+            current, etag = self.s3.get_json_object_with_etag(self.pointer_key, bucket_name=self.bucket_name)
+            pointer = get_pointer(current)
+            try:
+                self.s3.put_json_object(pointer, self.pointer_key, bucket_name=self.bucket_name,
+                                        if_match=etag, if_none_match=etag is None)
+                return pointer
+            except ObjectChangedError:
+                logging.info(f"Model registry pointer changed during attempt {attempt} of the update, retrying")
+        raise Exception(f"Model registry pointer changed during each of {POINTER_WRITE_ATTEMPTS} update attempts")
+
+    def _copy_to_legacy_keys(self, pointer: dict, legacy_s3_model_key: Optional[str],
+                             legacy_s3_portable_model_key: Optional[str]) -> None:
+        if legacy_s3_model_key is not None:
+            self.s3.copy_object(pointer["model_key"], legacy_s3_model_key, self.bucket_name)
+        if legacy_s3_portable_model_key is not None and pointer["portable_model_key"] is not None:
+            self.s3.copy_object(pointer["portable_model_key"], legacy_s3_portable_model_key, self.bucket_name)
+
+    def promote(self, version: str, legacy_s3_model_key: Optional[str] = None,
+                legacy_s3_portable_model_key: Optional[str] = None) -> dict:
+        """
+        Method Name :   promote
+        Description :   This method points the registry to the version with a conditional PUT of the pointer, the
+                        previous version is kept in the history of the pointer for rollback. The legacy keys,
+                        when given, get a server side copy of the version for servers reading a single key
+
+        Output      :   New content of the pointer
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            version_metadata = self.get_version(version)
+            if version_metadata is None:
+                raise Exception(f"Model version {version} is not registered")
+
+            def get_pointer(current: Optional[dict]) -> dict:
+                current = current or {}
+                history = current.get("history", [])
+                if current.get("version") not in (None, version):
+                    history = history + [current["version"]]
+                return self._new_pointer(version_metadata, history)
+
+            pointer = self._update_pointer(get_pointer)
+            self._copy_to_legacy_keys(pointer, legacy_s3_model_key, legacy_s3_portable_model_key)
+
+            logging.info(f"Promoted model version {version}")
+            return pointer
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def rollback(self, legacy_s3_model_key: Optional[str] = None,
+                 legacy_s3_portable_model_key: Optional[str] = None) -> dict:
+        """
+        Method Name :   rollback
+        Description :   This method points the registry back to the version promoted before the current one,
+                        with the same conditional PUT of the pointer as promote
+
+        Output      :   New content of the pointer
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            def get_pointer(current: Optional[dict]) -> dict:
+                if current is None or len(current.get("history", [])) == 0:
+                    raise Exception("There is no previously promoted model version to roll back to")
+                version_metadata = self.get_version(current["history"][-1])
+                if version_metadata is None:
+                    raise Exception(f"Model version {current['history'][-1]} is not registered")
+                logging.info(f"Rolling back model version {current['version']} to {current['history'][-1]}")
+                return self._new_pointer(version_metadata, current["history"][:-1])
+
+            pointer = self._update_pointer(get_pointer)
+            self._copy_to_legacy_keys(pointer, legacy_s3_model_key, legacy_s3_portable_model_key)
+            return pointer
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    @staticmethod
+    def get_model_key(version_metadata: dict, model_format: str = "pickle") -> str:
+        """
+        s3 key of the model of a version metadata or pointer in the given format
+        """
+        if model_format != "portable":
+            return version_metadata["model_key"]
+        if version_metadata.get("portable_model_key") is None:
+            raise Exception(f"Model version {version_metadata['version']} has no portable model")
+        return version_metadata["portable_model_key"]
+
+    def get_estimator(self, version: Optional[str] = None, model_format: str = "pickle") -> Optional[StrokeEstimator]:
+        """
+        estimator of the version, of the current version when version is None,
+        None if the registry has no such version
+        """
+        try:
+            version_metadata = self.get_current() if version is None else self.get_version(version)
+            if version_metadata is None:
+                return None
+            return StrokeEstimator(bucket_name=self.bucket_name,
+                                   model_path=self.get_model_key(version_metadata, model_format),
+                                   model_format=model_format)
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
@@ -0,0 +1,219 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import zipfile
+from typing import Optional, Tuple
+
+import numpy as np
+from pandas import DataFrame
+
+from heart_stroke.entity.compiled_preprocessor import CompiledPreprocessor, compile_preprocessor
+from heart_stroke.exception import HeartStrokeException
+from heart_stroke.logger import logging
+
+PORTABLE_FORMAT_VERSION = 1
+MANIFEST_FILE_NAME = "manifest.json"
+PREPROCESSOR_FILE_NAME = "preprocessor.json"
+
+# trained models export_portable_model can write in a version independent format, dispatched by type name
+# so that neither this module nor the loader import the training stack: CatBoost in its native .cbm format,
+# KNeighborsClassifier as its fitted rows in a .npz file scored with NumPy
+SUPPORTED_MODELS = ("CatBoostClassifier", "KNeighborsClassifier")
+KNN_METRICS = {"minkowski": None, "euclidean": 2, "manhattan": 1}
+
+
+class NearestNeighboursKernel:
+    """
+    brute force NumPy scoring of a fitted KNeighborsClassifier, same neighbours, weights and
+    tie breaking towards the first class as sklearn
+    """
+
+    def __init__(self, fit_x: np.array, fit_y: np.array, n_classes: int, n_neighbors: int, weights: str, p: float):
+        self.fit_x = fit_x
+        self.fit_y = fit_y
+        self.n_classes = n_classes
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.p = p
+
+    def _neighbours(self, features: np.array) -> Tuple[np.array, np.array]:
+        distances = np.empty((len(features), self.n_neighbors))
+        indexes = np.empty((len(features), self.n_neighbors), dtype=np.int64)
+        # bounds the rows x fitted rows x features difference tensor to about 64 MB
+        chunk_size = max(1, (1 << 23) // max(1, self.fit_x.size))
+        for start in range(0, len(features), chunk_size):
+            chunk = features[start:start + chunk_size]
+            chunk_distances = (np.abs(chunk[:, None, :] - self.fit_x[None, :, :]) ** self.p).sum(axis=2)
+            nearest = np.argpartition(chunk_distances, self.n_neighbors - 1, axis=1)[:, :self.n_neighbors]
+            nearest_distances = np.take_along_axis(chunk_distances, nearest, axis=1)
+            order = np.argsort(nearest_distances, axis=1, kind="stable")
+            indexes[start:start + chunk_size] = np.take_along_axis(nearest, order, axis=1)
+            distances[start:start + chunk_size] = np.take_along_axis(nearest_distances, order, axis=1) ** (1 / self.p)
+        return distances, indexes
+
+    def predict_proba(self, features: np.array) -> np.array:
+        distances, indexes = self._neighbours(np.asarray(features, dtype=np.float64))
+        if self.weights == "distance":
+            with np.errstate(divide="ignore"):
+                weights = 1.0 / distances
+            exact_match = np.isinf(weights)
+            exact_rows = exact_match.any(axis=1)
+            weights[exact_rows] = exact_match[exact_rows]
+        else:
+            weights = np.ones_like(distances)
+        probabilities = np.zeros((len(features), self.n_classes))
+        np.add.at(probabilities, (np.arange(len(features))[:, None], self.fit_y[indexes]), weights)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez(buffer, fit_x=self.fit_x, fit_y=self.fit_y, n_classes=self.n_classes,
+                 n_neighbors=self.n_neighbors, weights=self.weights, p=self.p)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> "NearestNeighboursKernel":
+        arrays = np.load(io.BytesIO(content))
+        return cls(fit_x=arrays["fit_x"], fit_y=arrays["fit_y"], n_classes=int(arrays["n_classes"]),
+                   n_neighbors=int(arrays["n_neighbors"]), weights=str(arrays["weights"]), p=float(arrays["p"]))
+
+
+class PortableStrokeModel:
+    """
+    This class scores a portable model bundle written by export_portable_model: a zip file holding a manifest,
+    the compiled preprocessor as JSON and the trained model in a version independent format. It has the
+    predict and predict_with_proba interface of HeartStrokeModel without importing sklearn, imblearn or dill,
+    catboost is imported only for bundles holding a CatBoost model
+    """
+
+    def __init__(self, manifest: dict, preprocessor: CompiledPreprocessor, model: object):
+        """
+        :param manifest: Content of the manifest of the bundle
+        :param preprocessor: Compiled preprocessor of the bundle
+        :param model: CatBoost model or NearestNeighboursKernel of the bundle
+        """
+        self.manifest = manifest
+        self.compiled_preprocessor = preprocessor
+        self.model = model
+        self.classes = np.asarray(manifest["classes"])
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> "PortableStrokeModel":
+        """
+        load a portable model bundle from its content
+        """
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as bundle:
+                manifest = json.loads(bundle.read(MANIFEST_FILE_NAME))
+                if manifest["format_version"] > PORTABLE_FORMAT_VERSION:
+                    raise Exception(f"Portable model format version {manifest['format_version']} is newer than "
+                                    f"the supported version {PORTABLE_FORMAT_VERSION}")
+                preprocessor = CompiledPreprocessor.from_dict(json.loads(bundle.read(PREPROCESSOR_FILE_NAME)))
+                model_content = bundle.read(manifest["model_file"])
+
+            if manifest["model_type"] == "CatBoostClassifier":
+                from catboost import CatBoostClassifier
+                model = CatBoostClassifier().load_model(blob=model_content)
+            elif manifest["model_type"] == "KNeighborsClassifier":
+                model = NearestNeighboursKernel.from_bytes(model_content)
+            else:
+                raise Exception(f"Unknown portable model type [{manifest['model_type']}]")
+
+            return cls(manifest=manifest, preprocessor=preprocessor, model=model)
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    @classmethod
+    def load(cls, file_path: str) -> "PortableStrokeModel":
+        with open(file_path, "rb") as file_obj:
+            return cls.from_bytes(file_obj.read())
+
+    def transform(self, dataframe: DataFrame) -> np.array:
+        return self.compiled_preprocessor.transform(dataframe)
+
+    def predict_proba(self, dataframe: DataFrame) -> np.array:
+        return np.asarray(self.model.predict_proba(self.transform(dataframe)))
+
+    def predict(self, dataframe: DataFrame) -> np.array:
+        try:
+            return self.classes.take(self.predict_proba(dataframe).argmax(axis=1))
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def predict_with_proba(self, dataframe: DataFrame) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        predicted labels of a batch of raw inputs with the positive class probabilities
+        """
+        try:
+            probabilities = self.predict_proba(dataframe)
+            labels = self.classes.take(probabilities.argmax(axis=1))
+            positive_class = np.flatnonzero(self.classes == 1)
+            return labels, probabilities[:, positive_class[0]] if len(positive_class) else None
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def __repr__(self):
+        return f"PortableStrokeModel({self.manifest['model_type']})"
+
+    def __str__(self):
+        return f"PortableStrokeModel({self.manifest['model_type']})"
+
+
+def _export_model(trained_model_object: object, temp_dir: str) -> Tuple[str, bytes]:
+    model_type = type(trained_model_object).__name__
+    if model_type == "CatBoostClassifier":
+        model_file_path = os.path.join(temp_dir, "model.cbm")
+        trained_model_object.save_model(model_file_path, format="cbm")
+        with open(model_file_path, "rb") as file_obj:
+            return "model.cbm", file_obj.read()
+    if model_type == "KNeighborsClassifier":
+        if trained_model_object.metric not in KNN_METRICS or trained_model_object.metric_params:
+            raise ValueError(f"KNeighborsClassifier with metric={trained_model_object.metric} is not supported")
+        if callable(trained_model_object.weights):
+            raise ValueError("KNeighborsClassifier with callable weights is not supported")
+        fit_x = trained_model_object._fit_X
+        fit_x = fit_x.toarray() if hasattr(fit_x, "toarray") else np.asarray(fit_x)
+        p = KNN_METRICS[trained_model_object.metric] or trained_model_object.p
+        kernel = NearestNeighboursKernel(fit_x=fit_x.astype(np.float64), fit_y=np.asarray(trained_model_object._y),
+                                         n_classes=len(trained_model_object.classes_),
+                                         n_neighbors=trained_model_object.n_neighbors,
+                                         weights=trained_model_object.weights, p=p)
+        return "model.npz", kernel.to_bytes()
+    raise ValueError(f"{model_type} is not supported, supported models are {SUPPORTED_MODELS}")
+
+
+def export_portable_model(heart_stroke_model: object, file_path: str, metadata: Optional[dict] = None) -> str:
+    """
+    write a HeartStrokeModel as a portable model bundle loadable with PortableStrokeModel,
+    raises ValueError when its preprocessor or trained model can not be exported
+    metadata: extra fields of the manifest
+    return: file_path
+    """
+    compiled_preprocessor = getattr(heart_stroke_model, "compiled_preprocessor", None)
+    if compiled_preprocessor is None:
+        compiled_preprocessor = compile_preprocessor(heart_stroke_model.preprocessing_object)
+
+    trained_model_object = heart_stroke_model.trained_model_object
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_file_name, model_content = _export_model(trained_model_object, temp_dir)
+
+    manifest = {
+        "format_version": PORTABLE_FORMAT_VERSION,
+        "model_type": type(trained_model_object).__name__,
+        "model_file": model_file_name,
+        "classes": np.asarray(trained_model_object.classes_).tolist(),
+        "metadata": metadata or {},
+    }
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_file_path = f"{file_path}.tmp"
+    with zipfile.ZipFile(temp_file_path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr(MANIFEST_FILE_NAME, json.dumps(manifest, indent=2))
+        bundle.writestr(PREPROCESSOR_FILE_NAME, json.dumps(compiled_preprocessor.to_dict()))
+        bundle.writestr(model_file_name, model_content)
+    os.replace(temp_file_path, file_path)
+
+    logging.info(f"Exported {manifest['model_type']} as portable model bundle {file_path}")
+    return file_path
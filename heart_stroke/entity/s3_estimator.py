@@ -1,9 +1,15 @@
 import os
+import pickle
 import sys
+from typing import Optional
 
 from heart_stroke.cloud_storage.aws_storage import SimpleStorageService
+from heart_stroke.constant.s3_bucket import (MODEL_DISK_CACHE_DIR, MODEL_DISK_CACHE_ENABLED,
+                                             MODEL_DISK_CACHE_MAX_SIZE, S3_DOWNLOAD_DIR)
 from heart_stroke.entity.estimator import HeartStrokeModel
+from heart_stroke.entity.portable_model import PortableStrokeModel
 from heart_stroke.exception import HeartStrokeException
+from heart_stroke.utils.model_disk_cache import ModelDiskCache
 from pandas import DataFrame
 
 
@@ -12,20 +18,28 @@ class StrokeEstimator:
     This class is used to save and retrieve heart_stroke model in s3 bucket and to do prediction
     """
 
-    def __init__(self,bucket_name,model_path,):
+    def __init__(self,bucket_name,model_path,model_format: str = "pickle",
+                 disk_cache: Optional[ModelDiskCache] = None):
         """
         :param bucket_name: Name of your model bucket
         :param model_path: Location of your model in bucket
+        :param model_format: pickle for a pickled HeartStrokeModel, portable for a portable model bundle
+        :param disk_cache: Local disk cache of the downloaded models, by default the one of MODEL_DISK_CACHE_DIR
+                           when MODEL_DISK_CACHE_ENABLED is set
         """
         self.bucket_name = bucket_name
         self.s3 = SimpleStorageService()
         self.model_path = model_path
+        self.model_format = model_format
+        if disk_cache is None and MODEL_DISK_CACHE_ENABLED:
+            disk_cache = ModelDiskCache(cache_dir=MODEL_DISK_CACHE_DIR, max_size=MODEL_DISK_CACHE_MAX_SIZE)
+        self.disk_cache = disk_cache
         self.loaded_model:HeartStrokeModel=None
 
 
     def is_model_present(self,model_path):
         try:
-            return self.s3.s3_key_path_available(bucket_name=self.bucket_name, s3_key=model_path)
+            return self.s3.object_exists(bucket_name=self.bucket_name, s3_key=model_path)
         except HeartStrokeException as e:
             print(e)
             return False
@@ -33,9 +47,31 @@ class StrokeEstimator:
     def load_model(self,)->HeartStrokeModel:
         """
         Load the model from the model_path
-        :return:
+        :return: HeartStrokeModel, or PortableStrokeModel for the portable model format
         """
-        return self.s3.load_model(self.model_path,bucket_name=self.bucket_name)
+        try:
+            if self.disk_cache is None:
+                if self.model_format != "portable":
+                    return self.s3.load_model(self.model_path,bucket_name=self.bucket_name)
+                local_file_path = self.s3.download_file(
+                    self.model_path, bucket_name=self.bucket_name,
+                    to_filename=os.path.join(S3_DOWNLOAD_DIR, self.bucket_name, self.model_path))
+            else:
+                etag = self.s3.get_object_etag(bucket_name=self.bucket_name, s3_key=self.model_path)
+                if etag is None:
+                    raise Exception(f"Model {self.model_path} does not exist in {self.bucket_name} bucket")
+                local_file_path = self.disk_cache.fetch(
+                    etag, self.model_path,
+                    download=lambda file_path: self.s3.download_file(self.model_path, bucket_name=self.bucket_name,
+                                                                     to_filename=file_path, if_match=etag))
+
+            if self.model_format == "portable":
+                return PortableStrokeModel.load(local_file_path)
+            with open(local_file_path, "rb") as file_obj:
+                return pickle.load(file_obj)
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
 
     def save_model(self,from_file,remove:bool=False)->None:
         """
@@ -0,0 +1,201 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Set
+
+import pandas as pd
+from pandas import DataFrame
+
+from heart_stroke.entity.config_entity import MicroBatcherConfig
+from heart_stroke.logger import logging
+from heart_stroke.utils.bounded_executor import BoundedExecutor, ExecutorSaturatedError
+
+
+@dataclass
+class MicroBatchMetrics:
+    batches: int = 0
+    requests: int = 0
+    rows: int = 0
+    max_batch_size: int = 0
+    total_queue_wait: float = 0.0
+    max_queue_wait: float = 0.0
+    batch_size_histogram: dict = field(default_factory=dict)
+
+    def record_batch(self, batch_size: int, queue_waits: List[float]) -> None:
+        self.batches += 1
+        self.requests += len(queue_waits)
+        self.rows += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.total_queue_wait += sum(queue_waits)
+        self.max_queue_wait = max([self.max_queue_wait] + queue_waits)
+        self.batch_size_histogram[batch_size] = self.batch_size_histogram.get(batch_size, 0) + 1
+
+    def snapshot(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "mean_queue_wait_ms": 1000 * self.total_queue_wait / self.requests if self.requests else 0.0,
+            "max_queue_wait_ms": 1000 * self.max_queue_wait,
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+        }
+
+
+@dataclass
+class _PendingPrediction:
+    dataframe: DataFrame
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class MicroBatcher:
+    """
+    This class collects concurrent prediction requests for up to window_ms milliseconds or
+    max_batch_size rows, runs one vectorized prediction for the whole batch and resolves
+    the future of every caller with its own rows of the result
+    """
+
+    def __init__(self, predict_fn: Callable[[DataFrame], list], executor: BoundedExecutor,
+                 micro_batcher_config: MicroBatcherConfig = MicroBatcherConfig()):
+        """
+        :param predict_fn: Function returning one prediction per row of the given dataframe
+        :param executor: Executor running predict_fn off the event loop
+        :param micro_batcher_config: Configuration for micro batching
+        """
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.micro_batcher_config = micro_batcher_config
+        self.metrics = MicroBatchMetrics()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._batch_tasks: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.micro_batcher_config.max_queue_size)
+            # one batch per worker of the executor, the next batch is collected while the others run
+            self._in_flight = asyncio.Semaphore(self.executor.max_workers)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+            logging.info(f"Started micro batcher with config: {self.micro_batcher_config}")
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            for task in list(self._batch_tasks):
+                task.cancel()
+            await asyncio.gather(self._worker, *self._batch_tasks, return_exceptions=True)
+            self._batch_tasks.clear()
+            self._worker = None
+
+    async def predict(self, dataframe: DataFrame) -> list:
+        """
+        Queues the dataframe for the next batch and waits for its predictions,
+        raises ExecutorSaturatedError when max_queue_size requests are already waiting
+        """
+        if self._worker is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_PendingPrediction(dataframe=dataframe, future=future,
+                                                      enqueued_at=time.perf_counter()))
+        except asyncio.QueueFull:
+            logging.info("Micro batcher queue is full")
+            raise ExecutorSaturatedError("Micro batcher queue is full, try again later")
+        return await future
+
+    async def _collect_batch(self) -> List[_PendingPrediction]:
+        batch = [await self._queue.get()]
+        rows = len(batch[0].dataframe)
+        deadline = time.perf_counter() + self.micro_batcher_config.window_ms / 1000
+
+        while rows < self.micro_batcher_config.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                pending = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(pending)
+            rows += len(pending.dataframe)
+        return batch
+
+    async def _predict_batch(self, batch: List[_PendingPrediction]) -> None:
+        started_at = time.perf_counter()
+        try:
+            dataframe = pd.concat([pending.dataframe for pending in batch], ignore_index=True)
+            self.metrics.record_batch(batch_size=len(dataframe),
+                                      queue_waits=[started_at - pending.enqueued_at for pending in batch])
+            predictions = await self.executor.run(self.predict_fn, dataframe)
+        except ExecutorSaturatedError as e:
+            self._set_exception(batch, e)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                self._set_exception(batch, e)
+                return
+            # one bad request must not fail the others of its batch, they are predicted one by one in a
+            # single task of the executor, so that the fallback never needs more workers than the batch
+            logging.info(f"Batch of {len(batch)} requests failed, predicting them one by one: {e}")
+            try:
+                results = await self.executor.run(self._predict_each, [pending.dataframe for pending in batch])
+            except Exception as e:
+                self._set_exception(batch, e)
+                return
+            for pending, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    self._set_exception([pending], result)
+                elif not pending.future.done():
+                    pending.future.set_result(result)
+            return
+
+        offset = 0
+        for pending in batch:
+            rows = len(pending.dataframe)
+            if not pending.future.done():
+                pending.future.set_result(predictions[offset:offset + rows])
+            offset += rows
+
+    def _predict_each(self, dataframes: List[DataFrame]) -> list:
+        """
+        Runs on the executor: predictions of each dataframe in turn, or the exception raised for it
+        """
+        results = []
+        for dataframe in dataframes:
+            try:
+                results.append(self.predict_fn(dataframe))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    @staticmethod
+    def _set_exception(batch: List[_PendingPrediction], exception: Exception) -> None:
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(exception)
+
+    async def _run_batch(self, batch: List[_PendingPrediction]) -> None:
+        try:
+            await self._predict_batch(batch)
+        except Exception as e:
+            logging.info(f"Micro batch failed: {e}")
+            self._set_exception(batch, e)
+        finally:
+            self._in_flight.release()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                batch = await self._collect_batch()
+                await self._in_flight.acquire()
+                task = loop.create_task(self._run_batch(batch))
+                self._batch_tasks.add(task)
+                task.add_done_callback(self._batch_tasks.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.info(f"Micro batcher failed to collect a batch: {e}")
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from heart_stroke.entity.config_entity import ModelReloaderConfig
+from heart_stroke.entity.model_cache import ModelCache
+from heart_stroke.logger import logging
+
+
+@dataclass
+class ModelReloadMetrics:
+    checks: int = 0
+    reloads: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+    last_reload_seconds: Optional[float] = None
+    served_version: Optional[str] = None
+    served_etag: Optional[str] = None
+
+    def snapshot(self) -> dict:
+        return dict(self.__dict__)
+
+
+class ModelReloader:
+    """
+    This class watches the served model from the event loop: every poll_interval seconds the model cache checks
+    the model key, or the registry pointer, on a background thread. A changed model is downloaded, warmed up and
+    smoke tested there and only then replaces the cached model with a single reference swap. Requests keep using
+    the model they already got, no request ever waits for a reload and a model failing its smoke test is not served
+    """
+
+    def __init__(self, model_cache: ModelCache, model_reloader_config: ModelReloaderConfig = ModelReloaderConfig()):
+        """
+        :param model_cache: Model cache of the served model
+        :param model_reloader_config: Configuration for the model reloader
+        """
+        self.model_cache = model_cache
+        self.model_reloader_config = model_reloader_config
+        self.metrics = ModelReloadMetrics()
+        self._worker: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._worker is None:
+            self.model_cache.background_refresh = False
+            self._record_served_model()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+            logging.info(f"Started model reloader with config: {self.model_reloader_config}")
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self.model_cache.background_refresh = True
+
+    def _record_served_model(self) -> None:
+        cached_model = self.model_cache.get_cached_model()
+        if cached_model is not None:
+            self.metrics.served_version, self.metrics.served_etag = cached_model.version, cached_model.etag
+
+    async def reload(self) -> bool:
+        """
+        Checks the served model once and loads it again if it changed, returns True if a new model is served
+        """
+        self.metrics.checks += 1
+        previous_model = self.model_cache.get_cached_model()
+        started_at = time.perf_counter()
+        try:
+            # the default executor, a slow download never takes a worker of the inference executor
+            cached_model = await asyncio.get_running_loop().run_in_executor(None, self.model_cache.load)
+        except Exception as e:
+            self.metrics.failures += 1
+            self.metrics.last_error = f"{e}"
+            logging.info(f"Model reload failed, keeping the served model: {e}")
+            return False
+
+        if previous_model is not None and cached_model is previous_model:
+            return False
+        self.metrics.reloads += 1
+        self.metrics.last_reload_seconds = time.perf_counter() - started_at
+        self._record_served_model()
+        logging.info(f"Serving model {cached_model.model} version {cached_model.version} with ETag "
+                     f"{cached_model.etag}, loaded in {self.metrics.last_reload_seconds:.2f} seconds")
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.model_reloader_config.poll_interval)
+            await self.reload()
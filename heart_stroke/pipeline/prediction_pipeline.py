@@ -1,10 +1,14 @@
 import logging
 import os
 import sys
+from typing import List
 
-from heart_stroke.constant.training_pipeline import SCHEMA_FILE_PATH
+from heart_stroke.constant.application import MODEL_SMOKE_TEST_RECORD, PREDICTION_BATCH_MAX_RECORDS
+from heart_stroke.constant.training_pipeline import SCHEMA_FILE_PATH, TARGET_COLUMN
 from heart_stroke.entity.config_entity import StrokePredictorConfig
-from heart_stroke.entity.s3_estimator import StrokeEstimator
+from heart_stroke.entity.estimator import HeartStrokeModel
+from heart_stroke.entity.model_cache import ModelCache
+from heart_stroke.entity.model_registry import ModelRegistry
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.logger import logging
 from heart_stroke.utils.main_utils import read_yaml_file
@@ -86,9 +90,50 @@ class HeartStrokeClassifier:
         try:
             self.schema_config = read_yaml_file(SCHEMA_FILE_PATH)
             self.prediction_pipeline_config = prediction_pipeline_config
+            self.input_columns = [
+                column for column in self.schema_config["columns"]
+                if column != TARGET_COLUMN and column not in self.schema_config["Drop_columns"]
+            ]
+            portable = self.prediction_pipeline_config.model_format == "portable"
+            self.model_cache = ModelCache(
+                bucket_name=self.prediction_pipeline_config.model_bucket_name,
+                model_path=self.prediction_pipeline_config.portable_model_file_path if portable
+                else self.prediction_pipeline_config.model_file_path,
+                refresh_interval=self.prediction_pipeline_config.model_refresh_interval,
+                model_format=self.prediction_pipeline_config.model_format,
+                model_registry=ModelRegistry(
+                    bucket_name=self.prediction_pipeline_config.model_bucket_name,
+                    registry_key=self.prediction_pipeline_config.model_registry_key,
+                ) if self.prediction_pipeline_config.use_model_registry else None,
+                warm_up=self.warm_up,
+            )
         except Exception as e:
             raise HeartStrokeException(e, sys)
 
+    def get_model(self) -> HeartStrokeModel:
+        """
+        This is the method of HeartStrokeClassifier
+        Returns: Production model from the process wide model cache
+        """
+        try:
+            return self.model_cache.get_model()
+        except Exception as e:
+            raise HeartStrokeException(e, sys)
+
+    def warm_up(self, model: HeartStrokeModel) -> None:
+        """
+        This is the method of HeartStrokeClassifier
+        Runs a smoke prediction of MODEL_SMOKE_TEST_RECORD, as a single row and as a batch, with a newly loaded
+        model so that its first request does not pay for lazy initialisation. Raises if the predictions are invalid
+        """
+        for batch_size in (1, 2):
+            dataframe = self.get_batch_input_data_frame([MODEL_SMOKE_TEST_RECORD] * batch_size)
+            labels, probabilities = model.predict_with_proba(dataframe)
+            if len(labels) != batch_size or not set(labels.tolist()) <= {0, 1}:
+                raise Exception(f"Smoke prediction of model {model} returned labels {labels}")
+            if probabilities is not None and not ((probabilities >= 0) & (probabilities <= 1)).all():
+                raise Exception(f"Smoke prediction of model {model} returned probabilities {probabilities}")
+
     def predict(self, dataframe) -> str:
         """
         This is the method of HeartStrokeClassifier
@@ -96,16 +141,86 @@ class HeartStrokeClassifier:
         """
         try:
             logging.info("Entered predict method of HeartStrokeClassifier class")
-            model = StrokeEstimator(
-                bucket_name=self.prediction_pipeline_config.model_bucket_name,
-                model_path=self.prediction_pipeline_config.model_file_path,
-            )
+            model = self.get_model()
             result =  model.predict(dataframe)
-            if result == 1:
-                return "High chance of Heart stroke"
-            
-            else:
-                return "Low chance of Heart stroke"
+            return self.get_prediction_label(result)
         
         except Exception as e:
             raise HeartStrokeException(e, sys)
+
+    def predict_labels(self, dataframe: DataFrame) -> List[str]:
+        """
+        This is the method of HeartStrokeClassifier
+        Returns: Prediction in string format for every row of the dataframe using a single model call
+        """
+        try:
+            model = self.get_model()
+            result = model.predict(dataframe)
+            return [self.get_prediction_label(value) for value in result]
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys)
+
+    @staticmethod
+    def get_prediction_label(value) -> str:
+        """
+        This is the method of HeartStrokeClassifier
+        Returns: Prediction in string format for a single predicted class
+        """
+        if value == 1:
+            return "High chance of Heart stroke"
+
+        else:
+            return "Low chance of Heart stroke"
+
+    def get_batch_input_data_frame(self, records: List[dict]) -> DataFrame:
+        """
+        This is the method of HeartStrokeClassifier
+        Returns: One columnar DataFrame built from a list of input records
+        """
+        try:
+            if not isinstance(records, list) or len(records) == 0:
+                raise Exception("records must be a non empty list of input records")
+
+            if len(records) > PREDICTION_BATCH_MAX_RECORDS:
+                raise Exception(
+                    f"Batch of {len(records)} records exceeds the limit of {PREDICTION_BATCH_MAX_RECORDS} records"
+                )
+
+            columns = {column: [None] * len(records) for column in self.input_columns}
+            for index, record in enumerate(records):
+                missing_columns = [column for column in self.input_columns if column not in record]
+                if len(missing_columns) > 0:
+                    raise Exception(f"Record {index} is missing columns: {missing_columns}")
+                for column in self.input_columns:
+                    columns[column][index] = record[column]
+
+            return DataFrame(columns, columns=self.input_columns)
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys)
+
+    def predict_batch(self, records: List[dict]) -> List[dict]:
+        """
+        This is the method of HeartStrokeClassifier
+        Returns: Prediction label, class and probability of stroke for every input record
+        """
+        try:
+            logging.info("Entered predict_batch method of HeartStrokeClassifier class")
+            dataframe = self.get_batch_input_data_frame(records)
+            model = self.get_model()
+            labels, probabilities = model.predict_with_proba(dataframe)
+
+            predictions = []
+            for index, value in enumerate(labels.tolist()):
+                predictions.append({
+                    "prediction": int(value),
+                    "label": self.get_prediction_label(value),
+                    "probability": None if probabilities is None else float(probabilities[index]),
+                })
+
+            logging.info(f"Predicted {len(predictions)} records in one batch")
+            return predictions
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys)
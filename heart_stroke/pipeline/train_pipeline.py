@@ -1,5 +1,7 @@
+import inspect
 import sys
-from typing import Tuple
+import time
+from typing import Callable, Dict, Optional, Tuple
 
 from heart_stroke.components.data_ingestion import DataIngestion
 from heart_stroke.components.data_transformation import DataTransformation
@@ -7,6 +9,7 @@ from heart_stroke.components.data_validation import DataValidation
 from heart_stroke.components.model_evaluation import ModelEvaluation
 from heart_stroke.components.model_pusher import ModelPusher
 from heart_stroke.components.model_trainer import ModelTrainer
+from heart_stroke.constant.training_pipeline import SCHEMA_FILE_PATH
 from heart_stroke.entity.artifact_entity import (DataIngestionArtifact,
                                                  DataTransformationArtifact,
                                                  DataValidationArtifact,
@@ -18,20 +21,76 @@ from heart_stroke.entity.config_entity import (DataIngestionConfig,
                                                DataValidationConfig,
                                                ModelEvaluationConfig,
                                                ModelPusherConfig,
-                                               ModelTrainerConfig)
+                                               ModelTrainerConfig,
+                                               training_pipeline_config)
+from heart_stroke.entity.estimator import HeartStrokeModel
+from heart_stroke.entity.model_registry import ModelRegistry
+from heart_stroke.entity.s3_estimator import StrokeEstimator
 from heart_stroke.exception import HeartStrokeException
 from heart_stroke.logger import logging
+from heart_stroke.utils.artifact_store import ArtifactStore
+from heart_stroke.utils.main_utils import read_yaml_file
+from heart_stroke.utils.stage_cache import StageCache
 from pandas import DataFrame
 
 
 class TrainPipeline:
-    def __init__(self):
+    def __init__(self, progress_callback: Optional[Callable[[str, str, float], None]] = None):
+        """
+        :param progress_callback: Called with (event, stage_name, timestamp) when a stage starts or finishes
+        """
+        self.progress_callback = progress_callback
         self.data_ingestion_config = DataIngestionConfig()
         self.data_validation_config = DataValidationConfig()
         self.data_transformation_config = DataTransformationConfig()
         self.model_trainer_config = ModelTrainerConfig()
         self.model_evaluation_config = ModelEvaluationConfig()
         self.model_pusher_config = ModelPusherConfig()
+        self.artifact_store = ArtifactStore()
+        self.stage_cache = StageCache(cache_dir=training_pipeline_config.stage_cache_dir,
+                                      enabled=training_pipeline_config.stage_cache_enabled,
+                                      max_entries=training_pipeline_config.stage_cache_max_entries)
+        self.base_model: Optional[HeartStrokeModel] = None
+        self.base_model_etag: Optional[str] = None
+
+    def load_warm_start_model(self) -> None:
+        """
+        This method of TrainPipeline class loads the production model to warm start from when warm start is
+        enabled and the production model was fitted on the same schema
+        """
+        try:
+            if not self.model_trainer_config.warm_start:
+                return
+            estimator = ModelRegistry(bucket_name=self.model_evaluation_config.bucket_name,
+                                      registry_key=self.model_evaluation_config.registry_key).get_estimator()
+            if estimator is None:
+                estimator = StrokeEstimator(bucket_name=self.model_evaluation_config.bucket_name,
+                                            model_path=self.model_evaluation_config.s3_model_key_path)
+            etag = estimator.s3.get_object_etag(estimator.bucket_name, estimator.model_path)
+            if etag is None:
+                logging.info("No production model to warm start from, training from scratch")
+                return
+            base_model = estimator.load_model()
+            if not base_model.is_compatible_with(read_yaml_file(file_path=SCHEMA_FILE_PATH)):
+                logging.info("Production model does not match the schema, training from scratch")
+                return
+            logging.info(f"Warm starting from production model {base_model} with ETag {etag}")
+            self.base_model, self.base_model_etag = base_model, etag
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def run_cached(self, stage_name: str, cache_key: str, file_fields: Dict[str, str], stage: Callable):
+        """
+        This method of TrainPipeline class restores the outputs of an unchanged stage from the stage cache,
+        otherwise it runs the stage and caches its outputs. file_fields maps the artifact fields holding
+        output files to their paths in the current run
+        """
+        artifact = self.stage_cache.restore(stage_name, cache_key, file_fields)
+        if artifact is None:
+            artifact = stage()
+            self.stage_cache.store(stage_name, cache_key, artifact,
+                                   {field_name: getattr(artifact, field_name) for field_name in file_fields})
+        return artifact
 
     def start_data_ingestion(self) -> DataIngestionArtifact:
         """
@@ -43,7 +102,9 @@ class TrainPipeline:
             )
             logging.info("Getting the data from mongodb")
             data_ingestion = DataIngestion(
-                data_ingestion_config=self.data_ingestion_config
+                data_ingestion_config=self.data_ingestion_config,
+                artifact_store=self.artifact_store,
+                stage_cache=self.stage_cache,
             )
             data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
             logging.info("Got the train_set and test_set from mongodb")
@@ -64,9 +125,17 @@ class TrainPipeline:
             data_validation = DataValidation(
                 data_ingestion_artifact=data_ingestion_artifact,
                 data_validation_config=self.data_validation_config,
+                artifact_store=self.artifact_store,
             )
 
-            data_validation_artifact = data_validation.initiate_data_validation()
+            cache_key = StageCache.get_key(data_ingestion_artifact.trained_file_path,
+                                           data_ingestion_artifact.test_file_path, SCHEMA_FILE_PATH,
+                                           inspect.getfile(DataValidation))
+            data_validation_artifact = self.run_cached(
+                "data_validation", cache_key,
+                {"drift_report_file_path": self.data_validation_config.drift_report_file_path},
+                data_validation.initiate_data_validation,
+            )
 
             logging.info("Performed the data validation operation")
 
@@ -88,10 +157,21 @@ class TrainPipeline:
             data_transformation = DataTransformation(
                 data_ingestion_artifact=data_ingestion_artifact,
                 data_transformation_config=self.data_transformation_config,
-                data_validation_artifact=data_validation_artifact
+                data_validation_artifact=data_validation_artifact,
+                artifact_store=self.artifact_store,
+                base_model=self.base_model,
             )
-            data_transformation_artifact = (
-                data_transformation.initiate_data_transformation()
+            cache_key = StageCache.get_key(data_ingestion_artifact.trained_file_path,
+                                           data_ingestion_artifact.test_file_path, SCHEMA_FILE_PATH,
+                                           StageCache.hash_config(self.data_transformation_config),
+                                           self.base_model_etag,
+                                           inspect.getfile(DataTransformation))
+            data_transformation_artifact = self.run_cached(
+                "data_transformation", cache_key,
+                {"transformed_object_file_path": self.data_transformation_config.transformed_object_file_path,
+                 "transformed_train_file_path": self.data_transformation_config.transformed_train_file_path,
+                 "transformed_test_file_path": self.data_transformation_config.transformed_test_file_path},
+                data_transformation.initiate_data_transformation,
             )
             return data_transformation_artifact
         except Exception as e:
@@ -105,8 +185,21 @@ class TrainPipeline:
             model_trainer = ModelTrainer(
                 data_transformation_artifact=data_transformation_artifact,
                 model_trainer_config=self.model_trainer_config,
+                artifact_store=self.artifact_store,
+                base_model=self.base_model,
+            )
+            cache_key = StageCache.get_key(data_transformation_artifact.transformed_object_file_path,
+                                           data_transformation_artifact.transformed_train_file_path,
+                                           data_transformation_artifact.transformed_test_file_path,
+                                           self.model_trainer_config.model_config_file_path,
+                                           StageCache.hash_config(self.model_trainer_config),
+                                           self.base_model_etag,
+                                           inspect.getfile(ModelTrainer))
+            model_trainer_artifact = self.run_cached(
+                "model_trainer", cache_key,
+                {"trained_model_file_path": self.model_trainer_config.trained_model_file_path},
+                model_trainer.initiate_model_trainer,
             )
-            model_trainer_artifact = model_trainer.initiate_model_trainer()
             return model_trainer_artifact
 
         except Exception as e:
@@ -122,13 +215,15 @@ class TrainPipeline:
                 model_eval_config=self.model_evaluation_config,
                 data_ingestion_artifact=data_ingestion_artifact,
                 model_trainer_artifact=model_trainer_artifact,
+                artifact_store=self.artifact_store,
             )
             model_evaluation_artifact = model_evaluation.initiate_model_evaluation()
             return model_evaluation_artifact
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
-    def start_model_pusher(self, model_trainer_artifact: ModelTrainerArtifact,):
+    def start_model_pusher(self, model_trainer_artifact: ModelTrainerArtifact,
+                           data_ingestion_artifact: Optional[DataIngestionArtifact] = None):
         """
         This method of TrainPipeline class is responsible for starting model pusher component
         """
@@ -136,29 +231,50 @@ class TrainPipeline:
             model_pusher = ModelPusher( 
                 model_trainer_artifact=model_trainer_artifact,
                 model_pusher_config=self.model_pusher_config,
+                data_ingestion_artifact=data_ingestion_artifact,
+                artifact_store=self.artifact_store,
             )
             model_pusher_artifact = model_pusher.initiate_model_pusher()
             return model_pusher_artifact
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
 
-    def run_pipeline(self,) -> None:
+    def run_stage(self, stage_name: str, stage: Callable, **kwargs):
+        """
+        This method of TrainPipeline class runs one stage and reports its start and end to the progress callback
+        """
+        if self.progress_callback is not None:
+            self.progress_callback("stage_started", stage_name, time.time())
+        started_at = time.perf_counter()
+        artifact = stage(**kwargs)
+        logging.info(f"Stage {stage_name} took {time.perf_counter() - started_at:.2f} seconds")
+        if self.progress_callback is not None:
+            self.progress_callback("stage_finished", stage_name, time.time())
+        return artifact
+
+    def run_pipeline(self,) -> Optional[ModelPusherArtifact]:
         """
         This method of TrainPipeline class is responsible for running complete pipeline
         """
         try:
-            data_ingestion_artifact = self.start_data_ingestion()
-            data_validation_artifact = self.start_data_validation(data_ingestion_artifact=data_ingestion_artifact)
-            data_transformation_artifact = self.start_data_transformation(data_ingestion_artifact=data_ingestion_artifact, 
-                                                                          data_validation_artifact=data_validation_artifact)
-            model_trainer_artifact = self.start_model_trainer(data_transformation_artifact=data_transformation_artifact)
-            model_evaluation_artifact = self.start_model_evaluation(data_ingestion_artifact=data_ingestion_artifact,
-                                                                    model_trainer_artifact=model_trainer_artifact,)
+            self.load_warm_start_model()
+            data_ingestion_artifact = self.run_stage("data_ingestion", self.start_data_ingestion)
+            data_validation_artifact = self.run_stage("data_validation", self.start_data_validation,
+                                                      data_ingestion_artifact=data_ingestion_artifact)
+            data_transformation_artifact = self.run_stage("data_transformation", self.start_data_transformation,
+                                                          data_ingestion_artifact=data_ingestion_artifact,
+                                                          data_validation_artifact=data_validation_artifact)
+            model_trainer_artifact = self.run_stage("model_trainer", self.start_model_trainer,
+                                                    data_transformation_artifact=data_transformation_artifact)
+            model_evaluation_artifact = self.run_stage("model_evaluation", self.start_model_evaluation,
+                                                       data_ingestion_artifact=data_ingestion_artifact,
+                                                       model_trainer_artifact=model_trainer_artifact,)
             if not model_evaluation_artifact.is_model_accepted:
                 logging.info(f"Model not accepted.")
                 return None
-            model_pusher_artifact = self.start_model_pusher(
-                model_trainer_artifact=model_trainer_artifact
-            )
+            model_pusher_artifact = self.run_stage("model_pusher", self.start_model_pusher,
+                                                   model_trainer_artifact=model_trainer_artifact,
+                                                   data_ingestion_artifact=data_ingestion_artifact)
+            return model_pusher_artifact
         except Exception as e:
             raise HeartStrokeException(e, sys) from e
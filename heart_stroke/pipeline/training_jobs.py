@@ -0,0 +1,189 @@
+import copy
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from heart_stroke.entity.config_entity import TrainingJobConfig
+from heart_stroke.logger import logging
+
+TRAINING_STAGES: List[str] = ["data_ingestion", "data_validation", "data_transformation",
+                              "model_trainer", "model_evaluation", "model_pusher"]
+
+
+class TrainingJobRunningError(Exception):
+    """
+    Raised when a training job is submitted while another one is still running
+    """
+
+
+@dataclass
+class TrainingStage:
+    name: str
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    duration: Optional[float] = None
+
+
+@dataclass
+class TrainingJob:
+    job_id: str
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    current_stage: Optional[str] = None
+    message: Optional[str] = None
+    stages: Dict[str, TrainingStage] = field(default_factory=dict)
+
+    def progress(self) -> dict:
+        finished_stages = [stage for stage in self.stages.values() if stage.finished_at is not None]
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "current_stage": self.current_stage,
+            "completed_stages": len(finished_stages),
+            "total_stages": len(TRAINING_STAGES),
+            "stages": [asdict(stage) for stage in self.stages.values()],
+        }
+
+    def to_dict(self) -> dict:
+        job = asdict(self)
+        job["stages"] = list(job["stages"].values())
+        return job
+
+
+def run_training_job(event_queue, niceness: int) -> None:
+    """
+    Entry point of the training worker process, the training stack is imported here
+    so that the serving process never has to import it
+    """
+    try:
+        if niceness and hasattr(os, "nice"):
+            os.nice(niceness)
+
+        from heart_stroke.pipeline.train_pipeline import TrainPipeline
+
+        def progress_callback(event: str, stage_name: str, timestamp: float) -> None:
+            event_queue.put((event, stage_name, timestamp))
+
+        model_pusher_artifact = TrainPipeline(progress_callback=progress_callback).run_pipeline()
+        message = "Training successful !!" if model_pusher_artifact is not None else "Model not accepted."
+        event_queue.put(("succeeded", message, time.time()))
+
+    except Exception as e:
+        event_queue.put(("failed", f"{e}", time.time()))
+
+
+class TrainingJobManager:
+    """
+    This class runs TrainPipeline in a separate worker process, at most one job at a time,
+    and keeps the status and per stage timings of the most recent jobs
+    """
+
+    def __init__(self, training_job_config: TrainingJobConfig = TrainingJobConfig()):
+        """
+        :param training_job_config: Configuration for training jobs
+        """
+        self.training_job_config = training_job_config
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs: "OrderedDict[str, TrainingJob]" = OrderedDict()
+        self._running_job_id: Optional[str] = None
+        self._process = None
+        self._lock = threading.Lock()
+
+    def submit(self) -> TrainingJob:
+        """
+        Starts a new training job and returns it without waiting for the training to finish
+        """
+        with self._lock:
+            if self._running_job_id is not None:
+                raise TrainingJobRunningError(f"Training job {self._running_job_id} is already running")
+
+            job = TrainingJob(job_id=uuid.uuid4().hex)
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.training_job_config.max_job_history:
+                self._jobs.popitem(last=False)
+
+            event_queue = self._context.Queue()
+            # not a daemon process: daemon processes can not have children and joblib would fall back to
+            # a single worker for the model search, shutdown() stops the process instead
+            process = self._context.Process(
+                target=run_training_job,
+                args=(event_queue, self.training_job_config.niceness),
+                name=f"training-{job.job_id}",
+            )
+            process.start()
+            job.status = "running"
+            job.started_at = time.time()
+            self._running_job_id = job.job_id
+            self._process = process
+
+        logging.info(f"Started training job {job.job_id} in process {process.pid}")
+        threading.Thread(target=self._monitor, args=(job, process, event_queue), daemon=True).start()
+        return job
+
+    def shutdown(self) -> None:
+        """
+        Terminates the running training process, if any, and waits for it to exit,
+        it is killed once it did not exit within shutdown_timeout seconds
+        """
+        with self._lock:
+            process = self._process
+        if process is None or not process.is_alive():
+            return
+        logging.info(f"Terminating training process {process.pid}")
+        process.terminate()
+        process.join(self.training_job_config.shutdown_timeout)
+        if process.is_alive():
+            logging.info(f"Killing training process {process.pid}")
+            process.kill()
+            process.join()
+
+    def get_job(self, job_id: str) -> Optional[TrainingJob]:
+        with self._lock:
+            return copy.deepcopy(self._jobs.get(job_id))
+
+    def list_jobs(self) -> List[TrainingJob]:
+        with self._lock:
+            return copy.deepcopy(list(self._jobs.values()))
+
+    def _apply_event(self, job: TrainingJob, event: str, value: str, timestamp: float) -> None:
+        with self._lock:
+            if event == "stage_started":
+                job.current_stage = value
+                job.stages[value] = TrainingStage(name=value, started_at=timestamp)
+            elif event == "stage_finished":
+                stage = job.stages.setdefault(value, TrainingStage(name=value, started_at=timestamp))
+                stage.finished_at = timestamp
+                stage.duration = stage.finished_at - stage.started_at
+                job.current_stage = None
+            elif event in ("succeeded", "failed"):
+                job.status = event
+                job.message = value
+                job.finished_at = timestamp
+
+    def _monitor(self, job: TrainingJob, process, event_queue) -> None:
+        while True:
+            try:
+                event, value, timestamp = event_queue.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    break
+                continue
+            self._apply_event(job, event, value, timestamp)
+
+        process.join()
+        with self._lock:
+            if job.status == "running":
+                job.status = "failed"
+                job.message = f"Training process exited with code {process.exitcode}"
+                job.finished_at = time.time()
+            self._running_job_id = None
+            self._process = None
+        logging.info(f"Training job {job.job_id} finished with status {job.status}: {job.message}")
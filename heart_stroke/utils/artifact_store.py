@@ -0,0 +1,95 @@
+import os
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+from pandas import DataFrame
+
+from heart_stroke.exception import HeartStrokeException
+from heart_stroke.logger import logging
+from heart_stroke.utils.main_utils import (apply_schema_dtypes,
+                                           load_numpy_array_data, load_object,
+                                           read_dataframe,
+                                           save_features_and_target,
+                                           save_numpy_array_data,
+                                           save_dataframe, save_object)
+
+
+class ArtifactStore:
+    """
+    This class keeps the artifacts written during one pipeline run in memory, keyed by their file path.
+    Every artifact is still persisted to its file, but the stages of the same run read the live
+    dataframe, array or object back instead of parsing the file again
+    """
+
+    def __init__(self):
+        self._artifacts: Dict[str, object] = {}
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        return os.path.abspath(file_path)
+
+    def _get(self, file_path: str) -> Optional[object]:
+        artifact = self._artifacts.get(self._key(file_path))
+        if artifact is not None:
+            logging.info(f"Using in memory artifact of {file_path}")
+        return artifact
+
+    def save_dataframe(self, file_path: str, dataframe: DataFrame, schema_config: Optional[dict] = None) -> None:
+        try:
+            if schema_config is not None:
+                dataframe = apply_schema_dtypes(dataframe, schema_config)
+            save_dataframe(file_path, dataframe)
+            self._artifacts[self._key(file_path)] = dataframe
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def read_dataframe(self, file_path: str, columns: Optional[List[str]] = None,
+                       schema_config: Optional[dict] = None) -> DataFrame:
+        try:
+            dataframe = self._get(file_path)
+            if dataframe is None:
+                return read_dataframe(file_path, columns=columns, schema_config=schema_config)
+            if schema_config is not None:
+                dataframe = apply_schema_dtypes(dataframe, schema_config)
+            return dataframe if columns is None else dataframe[columns]
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def save_numpy_array_data(self, file_path: str, array: np.array) -> None:
+        try:
+            save_numpy_array_data(file_path, array=array)
+            self._artifacts[self._key(file_path)] = array
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def save_features_and_target(self, file_path: str, features: np.array, target: np.array,
+                                 dtype: str = "float32") -> None:
+        try:
+            self._artifacts[self._key(file_path)] = save_features_and_target(file_path, features, target, dtype=dtype)
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def load_numpy_array_data(self, file_path: str, mmap_mode: Optional[str] = None) -> np.array:
+        try:
+            array = self._get(file_path)
+            return load_numpy_array_data(file_path, mmap_mode=mmap_mode) if array is None else array
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def save_object(self, file_path: str, obj: object) -> None:
+        try:
+            save_object(file_path, obj)
+            self._artifacts[self._key(file_path)] = obj
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def load_object(self, file_path: str) -> object:
+        try:
+            obj = self._get(file_path)
+            return load_object(file_path) if obj is None else obj
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def clear(self) -> None:
+        self._artifacts.clear()
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from heart_stroke.logger import logging
+
+
+class ExecutorSaturatedError(Exception):
+    """
+    Raised when a BoundedExecutor already has max_workers running and max_pending queued tasks
+    """
+
+
+class BoundedExecutor:
+    """
+    This class runs blocking work on a fixed size thread pool with a bounded queue, so that
+    callers on the event loop get an ExecutorSaturatedError instead of piling up unbounded work
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, name: str):
+        """
+        :param max_workers: Number of worker threads
+        :param max_pending: Number of tasks allowed to wait for a free worker
+        :param name: Prefix of the worker thread names
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            logging.info(f"{self.name} executor is saturated")
+            raise ExecutorSaturatedError(f"{self.name} executor is saturated, try again later")
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Runs fn on the thread pool and waits for its result without blocking the event loop
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
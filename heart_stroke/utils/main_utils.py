@@ -1,10 +1,12 @@
 import os.path
 import shutil
 import sys
-from typing import Dict, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import dill
 import numpy as np
+import pandas as pd
+import scipy.sparse as sp
 import yaml
 from heart_stroke.constant.training_pipeline import (
     MODEL_TRAINER_MODEL_CONFIG_FILE_PATH, SCHEMA_FILE_PATH)
@@ -13,6 +15,8 @@ from heart_stroke.logger import logging
 from pandas import DataFrame
 from yaml import safe_dump
 
+DATAFRAME_FILE_FORMATS = ("parquet", "feather", "csv")
+
 
 def read_yaml_file(file_path: str) -> dict:
     try:
@@ -23,14 +27,20 @@ def read_yaml_file(file_path: str) -> dict:
         raise HeartStrokeException(e, sys) from e
 
 
-def write_yaml_file(file_path: str, content: object, replace: bool = False) -> None:
+def write_yaml_file(file_path: str, content: object, replace: bool = False, atomic: bool = False) -> None:
+    """
+    atomic: write a temporary file and rename it over file_path, readers never see a partial file
+    """
     try:
         if replace:
             if os.path.exists(file_path):
                 os.remove(file_path)
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, "w") as file:
+        temp_file_path = f"{file_path}.tmp" if atomic else file_path
+        with open(temp_file_path, "w") as file:
             yaml.dump(content, file)
+        if atomic:
+            os.replace(temp_file_path, file_path)
     except Exception as e:
         raise HeartStrokeException(e, sys)
 
@@ -66,28 +76,302 @@ def save_numpy_array_data(file_path: str, array: np.array):
         raise HeartStrokeException(e, sys) from e
 
 
-def load_numpy_array_data(file_path: str) -> np.array:
+def load_numpy_array_data(file_path: str, mmap_mode: Optional[str] = None) -> np.array:
     """
     load numpy array data from file
     file_path: str location of file to load
-    return: np.array data loaded
+    mmap_mode: str when given the array is memory mapped with this mode instead of read into memory,
+               .npz files hold a sparse matrix and are always read into memory
+    return: np.array or scipy sparse CSR matrix data loaded
     """
     try:
+        if file_path.endswith(".npz"):
+            return sp.load_npz(file_path).tocsr()
+        if mmap_mode is not None:
+            return np.load(file_path, mmap_mode=mmap_mode)
         with open(file_path, "rb") as file_obj:
             return np.load(file_obj)
     except Exception as e:
         raise HeartStrokeException(e, sys) from e
 
 
+def get_array_file_path(file_path: str, features: np.array) -> str:
+    """
+    file path of a features array with the extension of its storage format,
+    .npz for scipy sparse matrices and .npy for dense arrays
+    """
+    return os.path.splitext(file_path)[0] + (".npz" if sp.issparse(features) else ".npy")
+
+
+def save_features_and_target(file_path: str, features: np.array, target: np.array,
+                             dtype: str = "float32", chunk_size: int = 65536) -> np.memmap:
+    """
+    Save features and target as one array with the target in the last column.
+    Dense features are written to a preallocated .npy file filled in place in chunks of rows,
+    no concatenated copy is built in memory. Sparse features are kept sparse and saved as a CSR .npz file
+    file_path: str location of file to save, see get_array_file_path
+    features: np.array or scipy sparse matrix of features
+    target: np.array of target values
+    dtype: str dtype of the stored array
+    return: np.memmap read only view of the saved array, or the saved CSR matrix
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if sp.issparse(features):
+            array = sp.hstack([features, np.asarray(target).reshape(-1, 1)], format="csr", dtype=dtype)
+            sp.save_npz(file_path, array, compressed=False)
+            return array
+
+        target = np.asarray(target)
+        chunks = ((features[start:start + chunk_size], target[start:start + chunk_size])
+                  for start in range(0, features.shape[0], chunk_size))
+        return save_feature_chunks_and_target(file_path, chunks, n_rows=features.shape[0], dtype=dtype)
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
+
+
+def save_feature_chunks_and_target(file_path: str, chunks: Iterator[Tuple[np.array, np.array]], n_rows: int,
+                                   dtype: str = "float32") -> np.memmap:
+    """
+    Save chunks of features and target as one dense array with the target in the last column.
+    The .npy file is preallocated from n_rows and the width of the first chunk and every chunk is
+    written in place, so only one chunk of features is ever held in memory
+    file_path: str location of the .npy file to save
+    chunks: iterator of (features, target) tuples, features may be scipy sparse
+    n_rows: int total number of rows of the chunks
+    dtype: str dtype of the stored array
+    return: np.memmap read only view of the saved array
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        array = None
+        start = 0
+        for features, target in chunks:
+            if array is None:
+                array = np.lib.format.open_memmap(file_path, mode="w+", dtype=dtype,
+                                                  shape=(n_rows, features.shape[1] + 1))
+            end = start + features.shape[0]
+            array[start:end, :-1] = features.toarray() if hasattr(features, "toarray") else features
+            array[start:end, -1] = np.asarray(target)
+            start = end
+        if array is None:
+            raise Exception(f"No rows to save in {file_path}")
+        if start != n_rows:
+            raise Exception(f"Saved {start} rows in {file_path}, expected {n_rows}")
+        array.flush()
+        del array
+        return np.load(file_path, mmap_mode="r")
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
+
+
 def save_object(file_path: str, obj: object) -> None:
     logging.info("Entered the save_object method of MainUtils class")
 
     try:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, "wb") as file_obj:
+        # written next to the target and renamed over it, a file hardlinked from the stage cache
+        # is replaced instead of being rewritten in place
+        temp_file_path = f"{file_path}.tmp"
+        with open(temp_file_path, "wb") as file_obj:
             dill.dump(obj, file_obj)
+        os.replace(temp_file_path, file_path)
 
         logging.info("Exited the save_object method of MainUtils class")
 
     except Exception as e:
         raise HeartStrokeException(e, sys) from e
+
+
+def get_file_format(file_path: str) -> str:
+    """
+    get the dataframe file format from the file extension
+    file_path: str location of file
+    return: str one of DATAFRAME_FILE_FORMATS
+    """
+    file_format = os.path.splitext(file_path)[1].lstrip(".").lower()
+    if file_format not in DATAFRAME_FILE_FORMATS:
+        raise Exception(f"Unsupported dataframe file format [{file_format}] of file {file_path}")
+    return file_format
+
+
+def apply_schema_dtypes(dataframe: DataFrame, schema_config: dict) -> DataFrame:
+    """
+    cast the columns of dataframe to the dtypes declared in the columns section of schema.yaml,
+    int columns holding missing or fractional values are kept as float so that no value is changed
+    dataframe: DataFrame to cast
+    schema_config: dict content of schema.yaml
+    return: DataFrame with schema dtypes
+    """
+    try:
+        dtypes = {}
+        for column, dtype in schema_config["columns"].items():
+            if column not in dataframe.columns:
+                continue
+            if dtype == "category":
+                dtypes[column] = "category"
+                continue
+            values = pd.to_numeric(dataframe[column], errors="coerce")
+            if dtype == "int" and values.notna().all() and (values % 1 == 0).all():
+                dtypes[column] = "int64"
+            else:
+                dtypes[column] = "float64"
+            dataframe = dataframe.assign(**{column: values})
+        return dataframe.astype(dtypes)
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
+
+
+def save_dataframe(file_path: str, dataframe: DataFrame, schema_config: Optional[dict] = None) -> None:
+    """
+    save dataframe in the file format given by the file extension
+    file_path: str location of file to save
+    dataframe: DataFrame data to save
+    schema_config: dict content of schema.yaml, when given the schema dtypes are applied before saving
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if schema_config is not None:
+            dataframe = apply_schema_dtypes(dataframe, schema_config)
+
+        file_format = get_file_format(file_path)
+        if file_format == "parquet":
+            dataframe.to_parquet(file_path, index=False)
+        elif file_format == "feather":
+            dataframe.reset_index(drop=True).to_feather(file_path)
+        else:
+            dataframe.to_csv(file_path, index=False, header=True)
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
+
+
+def save_dataframe_chunks(file_path: str, chunks: Iterator[DataFrame], schema_config: Optional[dict] = None) -> int:
+    """
+    save dataframe chunks as one file in the file format given by the file extension, without holding
+    more than one chunk in memory for parquet and csv. Every chunk gets the columns of the first chunk, with
+    schema_config the int columns of parquet files are stored as float64 so that a chunk with missing values
+    has the type of the others, read_dataframe with the same schema_config restores them
+    file_path: str location of file to save
+    chunks: iterator of DataFrame chunks
+    schema_config: dict content of schema.yaml, when given the schema dtypes are applied to every chunk
+    return: int number of rows saved
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        file_format = get_file_format(file_path)
+        temp_file_path = f"{file_path}.tmp"
+        int_columns = [] if schema_config is None else \
+            [column for column, dtype in schema_config["columns"].items() if dtype == "int"]
+
+        rows = 0
+        columns = None
+        writer = None
+        feather_chunks = []
+        for chunk in chunks:
+            if columns is None:
+                columns = chunk.columns
+            chunk = chunk.reindex(columns=columns)
+            if schema_config is not None:
+                chunk = apply_schema_dtypes(chunk, schema_config)
+
+            if file_format == "parquet":
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                chunk = chunk.astype({column: "float64" for column in int_columns if column in chunk.columns})
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(temp_file_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            elif file_format == "feather":
+                # feather files can not be appended to
+                feather_chunks.append(chunk)
+            else:
+                chunk.to_csv(temp_file_path, index=False, header=rows == 0, mode="w" if rows == 0 else "a")
+            rows += len(chunk)
+
+        if columns is None:
+            save_dataframe(file_path, pd.DataFrame())
+            return 0
+        if writer is not None:
+            writer.close()
+        if len(feather_chunks) > 0:
+            pd.concat(feather_chunks, ignore_index=True).to_feather(temp_file_path)
+        os.replace(temp_file_path, file_path)
+        return rows
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
+
+
+def read_dataframe(file_path: str, columns: Optional[List[str]] = None,
+                   schema_config: Optional[dict] = None) -> DataFrame:
+    """
+    read dataframe in the file format given by the file extension
+    file_path: str location of file to read
+    columns: list of columns to read, all columns are read when None
+    schema_config: dict content of schema.yaml, when given the schema dtypes are applied after reading
+    return: DataFrame data loaded
+    """
+    try:
+        file_format = get_file_format(file_path)
+        if file_format == "parquet":
+            dataframe = pd.read_parquet(file_path, columns=columns)
+        elif file_format == "feather":
+            dataframe = pd.read_feather(file_path, columns=columns)
+        else:
+            dataframe = pd.read_csv(file_path, usecols=columns)
+
+        if schema_config is not None:
+            dataframe = apply_schema_dtypes(dataframe, schema_config)
+        return dataframe
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
+
+
+def count_dataframe_rows(file_path: str) -> int:
+    """
+    number of rows of a dataframe file, from the file metadata for parquet
+    and by reading a single column in chunks for feather and csv
+    """
+    try:
+        file_format = get_file_format(file_path)
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+
+            return pq.ParquetFile(file_path).metadata.num_rows
+        if file_format == "feather":
+            import pyarrow.feather as feather
+
+            return feather.read_table(file_path, memory_map=True).num_rows
+        return sum(len(chunk) for chunk in pd.read_csv(file_path, usecols=[0], chunksize=1 << 20))
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
+
+
+def iter_dataframe_chunks(file_path: str, chunk_size: int, columns: Optional[List[str]] = None,
+                          schema_config: Optional[dict] = None) -> Iterator[DataFrame]:
+    """
+    read dataframe file in chunks of at most chunk_size rows without loading the whole file
+    file_path: str location of file to read
+    chunk_size: int maximum number of rows of a chunk
+    columns: list of columns to read, all columns are read when None
+    schema_config: dict content of schema.yaml, when given the schema dtypes are applied to every chunk
+    return: iterator of DataFrame chunks
+    """
+    try:
+        file_format = get_file_format(file_path)
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+
+            batches = (batch.to_pandas() for batch in
+                       pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size, columns=columns))
+        elif file_format == "feather":
+            dataframe = pd.read_feather(file_path, columns=columns)
+            batches = (dataframe.iloc[start:start + chunk_size] for start in range(0, len(dataframe), chunk_size))
+        else:
+            batches = pd.read_csv(file_path, usecols=columns, chunksize=chunk_size)
+
+        for batch in batches:
+            yield batch if schema_config is None else apply_schema_dtypes(batch, schema_config)
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from heart_stroke.exception import HeartStrokeException
+from heart_stroke.logger import logging
+
+try:
+    import fcntl
+except ImportError:  # windows, file_lock falls back to an exclusively created lock file
+    fcntl = None
+
+OBJECTS_DIR_NAME = "objects"
+LOCKS_DIR_NAME = "locks"
+
+
+@contextmanager
+def file_lock(lock_file_path: str, stale_after: float = 600.0, poll_interval: float = 0.1) -> Iterator[None]:
+    """
+    exclusive lock held across the processes of one host, with flock where available and otherwise
+    an exclusively created lock file, which is broken once it is older than stale_after seconds
+    """
+    os.makedirs(os.path.dirname(lock_file_path), exist_ok=True)
+    if fcntl is not None:
+        with open(lock_file_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+
+    while True:
+        try:
+            lock_fd = os.open(lock_file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_file_path) > stale_after:
+                    os.remove(lock_file_path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        os.close(lock_fd)
+        os.remove(lock_file_path)
+
+
+class ModelDiskCache:
+    """
+    This class keeps downloaded models on the local disk, addressed by their s3 ETag, so that every worker
+    process and every restart of a host finds a model that was already downloaded once. A model is downloaded
+    under a per ETag file lock and renamed into place when complete, the least recently used models are
+    removed once the cache grows over max_size bytes
+    """
+
+    def __init__(self, cache_dir: str, max_size: int):
+        """
+        :param cache_dir: Directory holding the cached models
+        :param max_size: Total size in bytes of the cached models, the least recently used are removed above it
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get_file_path(self, etag: str, s3_key: str) -> str:
+        """
+        cache file of the object content with the given ETag, it keeps the extension of the s3 key
+        """
+        return os.path.join(self.cache_dir, OBJECTS_DIR_NAME, etag.strip('"') + os.path.splitext(s3_key)[1])
+
+    def fetch(self, etag: str, s3_key: str, download: Callable[[str], object]) -> str:
+        """
+        Method Name :   fetch
+        Description :   This method returns the cached file of the ETag, it is downloaded with download(file_path)
+                        first if no process of this host has downloaded it yet. Concurrent callers wait for the
+                        one holding the lock of the ETag and then find the file in the cache
+
+        Output      :   Path of the cached file
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            file_path = self.get_file_path(etag, s3_key)
+            if not os.path.exists(file_path):
+                lock_file_path = os.path.join(self.cache_dir, LOCKS_DIR_NAME, os.path.basename(file_path) + ".lock")
+                with file_lock(lock_file_path):
+                    if not os.path.exists(file_path):
+                        started_at = time.perf_counter()
+                        download(file_path)
+                        logging.info(f"Cached {s3_key} with ETag {etag} in "
+                                     f"{time.perf_counter() - started_at:.2f} seconds")
+                self.evict(keep=file_path)
+            else:
+                logging.info(f"Loading {s3_key} with ETag {etag} from the model disk cache")
+            # the modification time orders the entries for eviction
+            os.utime(file_path)
+            return file_path
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def evict(self, keep: str) -> None:
+        """
+        removes the least recently used cached files until the cache fits in max_size, never the keep file
+        """
+        objects_dir = os.path.join(self.cache_dir, OBJECTS_DIR_NAME)
+        with file_lock(os.path.join(self.cache_dir, LOCKS_DIR_NAME, "evict.lock")):
+            entries = []
+            for name in os.listdir(objects_dir):
+                file_path = os.path.join(objects_dir, name)
+                # .part, .part.json and .lock files belong to downloads in progress
+                if name.endswith((".part", ".json", ".tmp", ".lock")):
+                    continue
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file_path))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, file_path in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                if file_path == keep:
+                    continue
+                os.remove(file_path)
+                total_size -= size
+                logging.info(f"Evicted {file_path} from the model disk cache")
@@ -0,0 +1,277 @@
+import importlib
+import inspect
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from typing import List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.model_selection import ParameterGrid, check_cv
+
+from heart_stroke.exception import HeartStrokeException
+from heart_stroke.logger import logging
+from heart_stroke.utils.main_utils import read_yaml_file
+
+GRID_SEARCH_KEY = "grid_search"
+MODEL_SELECTION_KEY = "model_selection"
+CLASS_KEY = "class"
+MODULE_KEY = "module"
+PARAM_KEY = "params"
+SEARCH_PARAM_GRID_KEY = "search_param_grid"
+SEARCH_KEY = "search"
+
+# same fields as the best model report of neuro_mf.ModelFactory
+BestModel = namedtuple("BestModel", ["model_serial_number", "model", "best_model", "best_parameters", "best_score"])
+
+Candidate = namedtuple("Candidate", ["model_serial_number", "module", "class_name", "params"])
+
+
+def get_model_class(module_name: str, class_name: str) -> type:
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def get_single_thread_params(model_class: type) -> dict:
+    """
+    parameters pinning an estimator to one thread, so that the process pool alone decides how many cores are used
+    """
+    parameters = inspect.signature(model_class.__init__).parameters
+    if "thread_count" in parameters:
+        return {"thread_count": 1, "allow_writing_files": False, "verbose": False}
+    if "n_jobs" in parameters:
+        return {"n_jobs": 1}
+    return {}
+
+
+def get_class_weight_params(model_class: type) -> dict:
+    """
+    parameters training an estimator with balanced class weights, empty if the estimator does not support them
+    """
+    parameters = inspect.signature(model_class.__init__).parameters
+    if "auto_class_weights" in parameters:
+        return {"auto_class_weights": "Balanced"}
+    if "class_weight" in parameters:
+        return {"class_weight": "balanced"}
+    return {}
+
+
+def fit_model(model: object, X: np.array, y: np.array) -> object:
+    """
+    fit the model, sparse features are densified for the estimators that only accept dense input
+    """
+    try:
+        return model.fit(X, y)
+    except (TypeError, ValueError):
+        if not sp.issparse(X):
+            raise
+        logging.info(f"{type(model).__name__} does not accept sparse input, fitting on dense features")
+        return model.fit(X.toarray(), y)
+
+
+def load_array(file_path: str) -> np.array:
+    """
+    memory map a dense .npy fold array read only, sparse .npz fold matrices are read into memory
+    """
+    if file_path.endswith(".npz"):
+        return sp.load_npz(file_path).tocsr()
+    return np.load(file_path, mmap_mode="r")
+
+
+def fit_and_score(candidate: Candidate, x_train_path: str, y_train_path: str,
+                  x_test_path: str, y_test_path: str, n_samples: Optional[int] = None) -> float:
+    """
+    Entry point of the worker processes: fits one candidate on one fold and returns its accuracy on the held
+    out part of the fold. The fold arrays are memory mapped read only, workers never receive a copy of them.
+    The train rows of a fold are stored shuffled, so n_samples fits on a random subsample of the fold
+    """
+    model_class = get_model_class(candidate.module, candidate.class_name)
+    model = model_class(**{**candidate.params, **get_single_thread_params(model_class)})
+    model = fit_model(model, load_array(x_train_path)[:n_samples], load_array(y_train_path)[:n_samples])
+    x_test = load_array(x_test_path)
+    try:
+        return model.score(x_test, load_array(y_test_path))
+    except (TypeError, ValueError):
+        if not sp.issparse(x_test):
+            raise
+        return model.score(x_test.toarray(), load_array(y_test_path))
+
+
+class ParallelModelFactory:
+    """
+    This class is a drop in replacement of neuro_mf.ModelFactory for the model search: every
+    (model, parameter set, fold) fit of all model families runs as one task of a single process pool
+    instead of one GridSearchCV per model family, and only the overall best candidate is refitted.
+
+    With grid_search.search.mode: halving of model.yaml the candidates are raced by successive halving:
+    all of them start on a small budget, either a subsample of the training rows or a fraction of a
+    parameter such as the number of boosting iterations, and only the top 1/factor of every round is
+    promoted to a factor times larger budget until the last round runs on the full budget
+    """
+
+    def __init__(self, model_config_path: str, n_jobs: Optional[int] = None, class_weight: bool = False):
+        """
+        :param model_config_path: Path of model.yaml
+        :param n_jobs: Number of worker processes, overrides grid_search.n_jobs of model.yaml, -1 uses all cores
+        :param class_weight: Train the models supporting it with balanced class weights
+        """
+        try:
+            self.config = read_yaml_file(file_path=model_config_path)
+            grid_search_config = self.config[GRID_SEARCH_KEY]
+            self.cv = grid_search_config.get(PARAM_KEY, {}).get("cv", 5)
+            self.n_jobs = grid_search_config.get("n_jobs", -1) if n_jobs is None else n_jobs
+            self.search_config = grid_search_config.get(SEARCH_KEY) or {}
+            self.search_mode = self.search_config.get("mode", "grid")
+            self.class_weight = class_weight
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def get_candidates(self) -> List[Candidate]:
+        candidates = []
+        for model_serial_number, model_config in self.config[MODEL_SELECTION_KEY].items():
+            base_params = model_config.get(PARAM_KEY) or {}
+            if self.class_weight:
+                base_params = {**base_params, **get_class_weight_params(
+                    get_model_class(model_config[MODULE_KEY], model_config[CLASS_KEY]))}
+            for search_params in ParameterGrid(model_config.get(SEARCH_PARAM_GRID_KEY) or {}):
+                candidates.append(Candidate(model_serial_number=model_serial_number,
+                                            module=model_config[MODULE_KEY],
+                                            class_name=model_config[CLASS_KEY],
+                                            params={**base_params, **search_params}))
+        return candidates
+
+    def _save_folds(self, X: np.array, y: np.array, folds_dir: str) -> List[Tuple[str, str, str, str]]:
+        """
+        writes the shuffled train and the held out part of every fold once, the workers memory map these files
+        """
+        random_state = np.random.RandomState(self.search_config.get("random_state", 42))
+        folds = []
+        for fold, (train_index, test_index) in enumerate(check_cv(self.cv, y, classifier=True).split(X, y)):
+            train_index = random_state.permutation(train_index)
+            fold_paths = []
+            for name, array in (("x_train", X[train_index]), ("y_train", y[train_index]),
+                                ("x_test", X[test_index]), ("y_test", y[test_index])):
+                if sp.issparse(array):
+                    file_path = os.path.join(folds_dir, f"fold_{fold}_{name}.npz")
+                    sp.save_npz(file_path, array, compressed=False)
+                else:
+                    file_path = os.path.join(folds_dir, f"fold_{fold}_{name}.npy")
+                    np.save(file_path, array)
+                fold_paths.append(file_path)
+            folds.append(tuple(fold_paths))
+        return folds
+
+    def _with_budget(self, candidate: Candidate, fraction: float, n_train_samples: int) -> Tuple[Candidate, Optional[int]]:
+        """
+        returns the candidate and the number of training rows to use for the given fraction of the full budget
+        """
+        if fraction >= 1:
+            return candidate, None
+        resource = self.search_config.get("resource", "n_samples")
+        model_class = get_model_class(candidate.module, candidate.class_name)
+        if resource != "n_samples" and resource in inspect.signature(model_class.__init__).parameters:
+            max_resources = candidate.params.get(resource, self.search_config.get("max_resources"))
+            if max_resources is not None:
+                params = {**candidate.params, resource: max(1, int(round(max_resources * fraction)))}
+                return candidate._replace(params=params), None
+        return candidate, max(self.search_config.get("min_samples", 50), int(n_train_samples * fraction))
+
+    def _evaluate(self, candidates: List[Candidate], folds: List[Tuple[str, str, str, str]],
+                  fraction: float, n_train_samples: int) -> np.array:
+        """
+        cross validates the candidates on the given fraction of the budget and returns their mean scores
+        """
+        tasks = [self._with_budget(candidate, fraction, n_train_samples) for candidate in candidates]
+        scores = Parallel(n_jobs=self.n_jobs, backend="loky")(
+            delayed(fit_and_score)(candidate, *fold_paths, n_samples=n_samples)
+            for candidate, n_samples in tasks for fold_paths in folds
+        )
+        return np.asarray(scores).reshape(len(candidates), len(folds)).mean(axis=1)
+
+    def grid_search(self, candidates: List[Candidate], folds: List[Tuple[str, str, str, str]],
+                    n_train_samples: int) -> Tuple[Candidate, float]:
+        started_at = time.perf_counter()
+        logging.info(f"Fitting {len(candidates)} candidates on {len(folds)} folds, "
+                     f"{len(candidates) * len(folds)} fits with n_jobs={self.n_jobs}")
+        mean_scores = self._evaluate(candidates, folds, 1.0, n_train_samples)
+        for candidate, score in zip(candidates, mean_scores):
+            logging.info(f"{candidate.class_name} {candidate.params}: mean cv score {score:.4f}")
+        logging.info(f"Time to best: {time.perf_counter() - started_at:.2f} seconds")
+        return candidates[int(np.argmax(mean_scores))], float(mean_scores.max())
+
+    def successive_halving(self, candidates: List[Candidate], folds: List[Tuple[str, str, str, str]],
+                           n_train_samples: int) -> Tuple[Candidate, float]:
+        """
+        Method Name :   successive_halving
+        Description :   This method races the candidates on growing budgets, keeping the top 1/factor of every round
+
+        Output      :   Best candidate and its mean cv score on the full budget
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            factor = self.search_config.get("factor", 3)
+            n_rounds = max(1, math.ceil(math.log(len(candidates)) / math.log(factor)))
+            min_fraction = self.search_config.get("min_fraction", 0.0)
+            started_at = time.perf_counter()
+            leader, best_found_at = None, None
+
+            for round_number in range(n_rounds):
+                fraction = max(min_fraction, factor ** (round_number - n_rounds + 1))
+                mean_scores = self._evaluate(candidates, folds, fraction, n_train_samples)
+                ranking = np.argsort(-mean_scores, kind="stable")
+                if candidates[ranking[0]] != leader:
+                    leader, best_found_at = candidates[ranking[0]], time.perf_counter() - started_at
+                logging.info(f"Halving round {round_number + 1}/{n_rounds}: {len(candidates)} candidates on "
+                             f"{fraction:.3f} of the budget, leader {leader.class_name} {leader.params} "
+                             f"with mean cv score {mean_scores[ranking[0]]:.4f} "
+                             f"after {time.perf_counter() - started_at:.2f} seconds")
+                best_score = float(mean_scores[ranking[0]])
+                candidates = [candidates[index] for index in ranking[:max(1, math.ceil(len(candidates) / factor))]]
+
+            logging.info(f"Time to best: {best_found_at:.2f} seconds, "
+                         f"search took {time.perf_counter() - started_at:.2f} seconds")
+            return leader, best_score
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def get_best_model(self, X: np.array, y: np.array, base_accuracy: float = 0.6) -> BestModel:
+        """
+        Method Name :   get_best_model
+        Description :   This method cross validates the candidates of model.yaml in parallel and refits the best one
+
+        Output      :   Best model report with the refitted best model
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            candidates = self.get_candidates()
+            folds_dir = tempfile.mkdtemp(prefix="model_search_")
+            try:
+                folds = self._save_folds(X, y, folds_dir)
+                n_train_samples = min(len(load_array(fold_paths[1])) for fold_paths in folds)
+                if self.search_mode == "halving":
+                    best_candidate, best_score = self.successive_halving(candidates, folds, n_train_samples)
+                else:
+                    best_candidate, best_score = self.grid_search(candidates, folds, n_train_samples)
+            finally:
+                shutil.rmtree(folds_dir, ignore_errors=True)
+
+            if best_score < base_accuracy:
+                raise Exception(f"None of the models has a score of at least base accuracy {base_accuracy}")
+
+            logging.info(f"Refitting best candidate {best_candidate.class_name} {best_candidate.params}")
+            model_class = get_model_class(best_candidate.module, best_candidate.class_name)
+            best_model = fit_model(model_class(**best_candidate.params), X, y)
+
+            return BestModel(model_serial_number=best_candidate.model_serial_number,
+                             model=model_class(**best_candidate.params),
+                             best_model=best_model,
+                             best_parameters=best_candidate.params,
+                             best_score=best_score)
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
@@ -0,0 +1,66 @@
+import sys
+from typing import Optional, Tuple
+
+import numpy as np
+from imblearn.combine import SMOTEENN
+from imblearn.over_sampling import SMOTE, RandomOverSampler
+from imblearn.under_sampling import EditedNearestNeighbours, RandomUnderSampler
+from sklearn.neighbors import NearestNeighbors
+
+from heart_stroke.exception import HeartStrokeException
+
+# smoteenn: SMOTE followed by ENN cleaning, single threaded neighbour search (previous behaviour)
+# smoteenn_parallel: the same resampling with the neighbour searches spread over n_jobs threads
+# smote: SMOTE with multi threaded neighbour search and no ENN cleaning pass
+# random_oversample / random_undersample: duplicate minority rows / drop majority rows, no neighbour search
+# class_weight: no resampling, the models are trained with balanced class weights instead
+RESAMPLING_STRATEGIES = ("smoteenn", "smoteenn_parallel", "smote", "random_oversample",
+                         "random_undersample", "class_weight", "none")
+
+
+def get_resampler(strategy: str, n_jobs: int = -1, random_state: Optional[int] = None) -> Optional[object]:
+    """
+    create the imblearn resampler of the strategy, None for the strategies that keep the rows unchanged
+    strategy: str one of RESAMPLING_STRATEGIES
+    n_jobs: int number of threads of the neighbour searches, -1 uses all cores
+    return: resampler with a fit_resample method or None
+    """
+    try:
+        if strategy == "smoteenn":
+            return SMOTEENN(sampling_strategy="minority", random_state=random_state)
+        if strategy == "smoteenn_parallel":
+            return SMOTEENN(
+                sampling_strategy="minority",
+                smote=SMOTE(sampling_strategy="minority", random_state=random_state,
+                            k_neighbors=NearestNeighbors(n_neighbors=6, n_jobs=n_jobs)),
+                enn=EditedNearestNeighbours(sampling_strategy="all",
+                                            n_neighbors=NearestNeighbors(n_neighbors=4, n_jobs=n_jobs)),
+                random_state=random_state,
+            )
+        if strategy == "smote":
+            return SMOTE(sampling_strategy="minority", random_state=random_state,
+                         k_neighbors=NearestNeighbors(n_neighbors=6, n_jobs=n_jobs))
+        if strategy == "random_oversample":
+            return RandomOverSampler(sampling_strategy="minority", random_state=random_state)
+        if strategy == "random_undersample":
+            return RandomUnderSampler(sampling_strategy="majority", random_state=random_state)
+        if strategy in ("class_weight", "none"):
+            return None
+        raise Exception(f"Unknown resampling strategy [{strategy}], expected one of {RESAMPLING_STRATEGIES}")
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
+
+
+def resample(features: np.array, target: np.array, strategy: str, n_jobs: int = -1,
+             random_state: Optional[int] = None) -> Tuple[np.array, np.array]:
+    """
+    resample features and target with the given strategy
+    return: resampled features and target, unchanged for class_weight and none
+    """
+    try:
+        resampler = get_resampler(strategy, n_jobs=n_jobs, random_state=random_state)
+        if resampler is None:
+            return features, np.asarray(target)
+        return resampler.fit_resample(features, target)
+    except Exception as e:
+        raise HeartStrokeException(e, sys) from e
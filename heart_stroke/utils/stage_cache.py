@@ -0,0 +1,155 @@
+import dataclasses
+import hashlib
+import os
+import shutil
+import sys
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from heart_stroke.exception import HeartStrokeException
+from heart_stroke.logger import logging
+from heart_stroke.utils.main_utils import load_object, save_object
+
+ARTIFACT_OBJECT_NAME = "artifact.pkl"
+
+
+class StageCache:
+    """
+    This class memoizes pipeline stages by a content hash of their inputs and configuration.
+    The output files of a stage are kept in cache_dir/<stage>/<key>/ together with its artifact,
+    a stage whose key is found is skipped and its cached files are copied into the current run
+    """
+
+    def __init__(self, cache_dir: str, enabled: bool = True, max_entries: int = 5):
+        """
+        :param cache_dir: Directory holding the cached stage outputs
+        :param enabled: When False every lookup is a miss and nothing is stored
+        :param max_entries: Number of cached entries kept per stage, the least recently used are removed
+        """
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.max_entries = max_entries
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file_obj:
+            for block in iter(lambda: file_obj.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_dataframe(dataframe: DataFrame) -> str:
+        digest = hashlib.sha256()
+        digest.update(repr(list(zip(dataframe.columns, map(str, dataframe.dtypes)))).encode())
+        digest.update(pd.util.hash_pandas_object(dataframe, index=False).values.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_config(config: object) -> str:
+        """
+        hash of the configuration dataclass without its file and directory fields,
+        which change with the timestamped artifact directory of every run
+        """
+        values = {
+            name: value for name, value in sorted(dataclasses.asdict(config).items())
+            if not name.endswith("_path") and not name.endswith("_dir")
+        }
+        return hashlib.sha256(repr(values).encode()).hexdigest()
+
+    @staticmethod
+    def get_key(*parts: object) -> str:
+        """
+        combine the hashes of all stage inputs, existing file paths are hashed by content
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str) and os.path.isfile(part):
+                part = StageCache.hash_file(part)
+            elif isinstance(part, np.ndarray):
+                part = hashlib.sha256(np.ascontiguousarray(part).tobytes()).hexdigest()
+            digest.update(repr(part).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _entry_dir(self, stage: str, key: str) -> str:
+        return os.path.join(self.cache_dir, stage, key)
+
+    @staticmethod
+    def _copy(from_file: str, to_file: str, link: bool = False) -> None:
+        os.makedirs(os.path.dirname(to_file), exist_ok=True)
+        if os.path.exists(to_file):
+            os.remove(to_file)
+        if link:
+            try:
+                os.link(from_file, to_file)
+                return
+            except OSError:
+                pass
+        shutil.copy2(from_file, to_file)
+
+    def restore(self, stage: str, key: str, file_fields: Dict[str, str]) -> Optional[object]:
+        """
+        Method Name :   restore
+        Description :   This method copies the cached output files of the stage to the paths of the current run
+
+        Output      :   The cached artifact pointing to the current run paths, None if the key is not cached.
+                        A restored file keeps the extension of the cached one, which depends on its storage format
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            entry_dir = self._entry_dir(stage, key)
+            artifact_file = os.path.join(entry_dir, ARTIFACT_OBJECT_NAME)
+            if not self.enabled or not os.path.exists(artifact_file):
+                return None
+
+            artifact = load_object(artifact_file)
+            file_fields = {
+                field_name: os.path.splitext(file_path)[0] + os.path.splitext(getattr(artifact, field_name))[1]
+                for field_name, file_path in file_fields.items()
+            }
+            for field_name, file_path in file_fields.items():
+                self._copy(os.path.join(entry_dir, field_name), file_path, link=True)
+            os.utime(artifact_file)
+
+            logging.info(f"Stage {stage} is unchanged, reusing cached outputs of key {key}")
+            return dataclasses.replace(artifact, **file_fields)
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def store(self, stage: str, key: str, artifact: object, file_fields: Dict[str, str]) -> None:
+        """
+        Method Name :   store
+        Description :   This method saves the output files and the artifact of the stage under its key,
+                        the artifact is written last so that an interrupted store is never restored
+
+        Output      :   Cached stage outputs
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            if not self.enabled:
+                return
+            missing_files = [file_path for file_path in file_fields.values() if not os.path.exists(file_path)]
+            if len(missing_files) > 0:
+                logging.info(f"Not caching stage {stage}, output files {missing_files} were not written")
+                return
+            entry_dir = self._entry_dir(stage, key)
+            for field_name, file_path in file_fields.items():
+                self._copy(file_path, os.path.join(entry_dir, field_name))
+            save_object(os.path.join(entry_dir, ARTIFACT_OBJECT_NAME), artifact)
+            self._evict(stage)
+
+        except Exception as e:
+            raise HeartStrokeException(e, sys) from e
+
+    def _evict(self, stage: str) -> None:
+        stage_dir = os.path.join(self.cache_dir, stage)
+        entries = [os.path.join(stage_dir, name) for name in os.listdir(stage_dir)]
+        entries.sort(key=lambda entry: os.path.getmtime(os.path.join(entry, ARTIFACT_OBJECT_NAME))
+                     if os.path.exists(os.path.join(entry, ARTIFACT_OBJECT_NAME)) else 0)
+        for entry in entries[:max(0, len(entries) - self.max_entries)]:
+            shutil.rmtree(entry, ignore_errors=True)
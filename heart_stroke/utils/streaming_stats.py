@@ -0,0 +1,185 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+
+class RunningMoments:
+    """
+    count, mean and sum of squared deviations of a column, updated chunk by chunk with the
+    parallel variance formula of Chan et al. so that no chunk is kept in memory
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def combine(self, count: int, mean: float, m2: float) -> None:
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def update(self, values: np.array) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) > 0:
+            self.combine(len(values), values.mean(), ((values - values.mean()) ** 2).sum())
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count else 0.0
+
+
+class QuantileSketch:
+    """
+    KLL style approximate quantile sketch: level h holds items of weight 2**h, a level over its
+    capacity is sorted and every other item is promoted to the next level, so the sketch keeps
+    O(k log(n / k)) items for n values while the rank error stays around 1 / k
+    """
+
+    def __init__(self, k: int = 200, seed: int = 42):
+        self.k = k
+        self.count = 0
+        self.levels: List[np.array] = [np.empty(0)]
+        self._random_state = np.random.RandomState(seed)
+
+    def _capacity(self, level: int) -> int:
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))))
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[level])
+                self.levels[level] = items[len(items) - len(items) % 2:]
+                items = items[:len(items) - len(items) % 2]
+                promoted = items[self._random_state.randint(2)::2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def update(self, values: np.array) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return np.nan
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level) for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cumulative_weights = np.cumsum(weights[order])
+        index = np.searchsorted(cumulative_weights, q * cumulative_weights[-1])
+        return float(items[order][min(index, len(items) - 1)])
+
+
+class ReservoirSample:
+    """
+    uniform random sample of at most size rows of all the chunks seen so far (algorithm R)
+    """
+
+    def __init__(self, size: int, seed: int = 42):
+        self.size = size
+        self.seen = 0
+        self.sample: DataFrame = DataFrame()
+        self._random_state = np.random.RandomState(seed)
+
+    def update(self, chunk: DataFrame) -> None:
+        chunk = chunk.reset_index(drop=True)
+        n_fill = max(0, min(self.size - len(self.sample), len(chunk)))
+        if n_fill > 0:
+            self.sample = pd.concat([self.sample, chunk.iloc[:n_fill]], ignore_index=True)
+
+        positions = self.seen + np.arange(n_fill, len(chunk))
+        slots = self._random_state.randint(0, positions + 1) if len(positions) else positions
+        replaced = slots < self.size
+        if replaced.any():
+            # a slot drawn more than once keeps the row seen last
+            slots, rows = slots[replaced][::-1], np.arange(n_fill, len(chunk))[replaced][::-1]
+            slots, first = np.unique(slots, return_index=True)
+            self.sample = pd.concat([self.sample.drop(index=slots), chunk.iloc[rows[first]]], ignore_index=True)
+        self.seen += len(chunk)
+
+
+class StreamingPreprocessorStats:
+    """
+    This class accumulates, chunk by chunk, the statistics the preprocessor of DataTransformation is fitted on:
+    medians from quantile sketches, running mean and variance of the numerical columns, the vocabulary and
+    frequencies of the categorical columns and a reservoir sample for the Yeo-Johnson lambdas.
+    partial_fit can be called again with new rows at any time, the statistics are pickled between runs
+    together with the ingestion watermark of the last row they accumulated
+    """
+
+    def __init__(self, numerical_columns: List[str], categorical_columns: List[str],
+                 transformation_columns: List[str], reservoir_size: int = 100000, sketch_k: int = 200):
+        self.numerical_columns = numerical_columns
+        self.categorical_columns = categorical_columns
+        self.transformation_columns = transformation_columns
+        self.n_rows = 0
+        self.moments: Dict[str, RunningMoments] = {column: RunningMoments() for column in numerical_columns}
+        self.sketches: Dict[str, QuantileSketch] = {
+            column: QuantileSketch(k=sketch_k) for column in numerical_columns + transformation_columns
+        }
+        self.category_counts: Dict[str, Counter] = {column: Counter() for column in categorical_columns}
+        self.reservoir = ReservoirSample(size=reservoir_size)
+        self.watermark: Optional[str] = None
+
+    @property
+    def columns(self) -> List[str]:
+        return self.numerical_columns + self.categorical_columns + self.transformation_columns
+
+    def partial_fit(self, chunk: DataFrame) -> "StreamingPreprocessorStats":
+        self.n_rows += len(chunk)
+        for column, moments in self.moments.items():
+            moments.update(chunk[column].to_numpy(dtype=np.float64, na_value=np.nan))
+        for column, sketch in self.sketches.items():
+            sketch.update(chunk[column].to_numpy(dtype=np.float64, na_value=np.nan))
+        for column, counts in self.category_counts.items():
+            value_counts = chunk[column].value_counts()
+            counts.update(value_counts[value_counts > 0].to_dict())
+        self.reservoir.update(chunk[self.columns])
+        return self
+
+    def median(self, column: str) -> float:
+        return self.sketches[column].quantile(0.5)
+
+    def categories(self) -> List[List[str]]:
+        return [sorted(self.category_counts[column]) for column in self.categorical_columns]
+
+    def imputed_mean_var(self, column: str) -> Tuple[float, float]:
+        """
+        mean and variance of the column after its missing values are imputed with the median
+        """
+        moments = RunningMoments()
+        moments.combine(self.moments[column].count, self.moments[column].mean, self.moments[column].m2)
+        moments.combine(self.n_rows - self.moments[column].count, self.median(column), 0.0)
+        return moments.mean, moments.variance
+
+    def one_hot_variances(self) -> np.array:
+        """
+        variance p * (1 - p) of every one hot encoded column, in the order of categories()
+        """
+        variances = []
+        for column, categories in zip(self.categorical_columns, self.categories()):
+            frequencies = np.array([self.category_counts[column][category] for category in categories]) / self.n_rows
+            variances.append(frequencies * (1 - frequencies))
+        return np.concatenate(variances) if variances else np.empty(0)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from heart_stroke.components.data_transformation import DataTransformation
+from heart_stroke.entity.compiled_preprocessor import CompiledPreprocessor, compile_preprocessor
+from heart_stroke.entity.config_entity import DataTransformationConfig
+
+
+def make_dataframe(n_samples: int, seed: int = 42) -> pd.DataFrame:
+    random_state = np.random.RandomState(seed)
+    dataframe = pd.DataFrame({
+        "gender": random_state.choice(["Male", "Female"], n_samples),
+        "age": random_state.uniform(1, 90, n_samples),
+        "hypertension": random_state.randint(0, 2, n_samples),
+        "heart_disease": random_state.randint(0, 2, n_samples),
+        "ever_married": random_state.choice(["Yes", "No"], n_samples),
+        "work_type": random_state.choice(["Private", "Self-employed", "Govt_job", "children"], n_samples),
+        "Residence_type": random_state.choice(["Urban", "Rural"], n_samples),
+        "avg_glucose_level": random_state.lognormal(4.6, 0.35, n_samples),
+        "bmi": random_state.normal(28.0, 7.0, n_samples),
+        "smoking_status": random_state.choice(["formerly smoked", "never smoked", "smokes", "Unknown"], n_samples),
+    })
+    # missing values in the impute + scale and the impute + yeo_johnson blocks
+    for column in ("age", "avg_glucose_level", "bmi"):
+        dataframe.loc[random_state.rand(n_samples) < 0.1, column] = np.nan
+    return dataframe
+
+
+def fit_preprocessor(dataframe: pd.DataFrame, handle_unknown: str = "error"):
+    preprocessor = DataTransformation(data_ingestion_artifact=None,
+                                      data_transformation_config=DataTransformationConfig(),
+                                      data_validation_artifact=None).get_data_transformer_object()
+    preprocessor.set_params(Categorical_Pipeline__one_hot_encoder__handle_unknown=handle_unknown)
+    return preprocessor.fit(dataframe)
+
+
+def to_dense(array) -> np.array:
+    return array.toarray() if hasattr(array, "toarray") else np.asarray(array)
+
+
+def with_unseen_categories(dataframe: pd.DataFrame) -> pd.DataFrame:
+    dataframe = dataframe.copy()
+    dataframe.loc[dataframe.index[:5], "work_type"] = "Never_worked"
+    dataframe.loc[dataframe.index[5:10], "smoking_status"] = "quit recently"
+    return dataframe
+
+
+def test_compiled_preprocessor_matches_column_transformer():
+    dataframe = make_dataframe(500)
+    preprocessor = fit_preprocessor(dataframe)
+    compiled_preprocessor = compile_preprocessor(preprocessor)
+
+    expected = to_dense(preprocessor.transform(dataframe))
+    assert [step["op"] for block in compiled_preprocessor.blocks for step in block["steps"]] == \
+        ["impute", "scale", "one_hot", "scale", "impute", "yeo_johnson", "scale"]
+    assert np.allclose(compiled_preprocessor.transform(dataframe), expected)
+    assert np.allclose(compiled_preprocessor.transform(dataframe.to_dict(orient="records")), expected)
+
+
+def test_compiled_preprocessor_ignores_unseen_categories_like_column_transformer():
+    preprocessor = fit_preprocessor(make_dataframe(500), handle_unknown="ignore")
+    compiled_preprocessor = compile_preprocessor(preprocessor)
+
+    dataframe = with_unseen_categories(make_dataframe(200, seed=7))
+    assert np.allclose(compiled_preprocessor.transform(dataframe), to_dense(preprocessor.transform(dataframe)))
+
+
+def test_compiled_preprocessor_rejects_unseen_categories_like_column_transformer():
+    preprocessor = fit_preprocessor(make_dataframe(500))
+    compiled_preprocessor = compile_preprocessor(preprocessor)
+
+    dataframe = with_unseen_categories(make_dataframe(200, seed=7))
+    with pytest.raises(ValueError):
+        preprocessor.transform(dataframe)
+    with pytest.raises(ValueError):
+        compiled_preprocessor.transform(dataframe)
+
+
+def test_compiled_preprocessor_survives_serialization():
+    dataframe = make_dataframe(200)
+    compiled_preprocessor = compile_preprocessor(fit_preprocessor(dataframe))
+
+    restored = CompiledPreprocessor.from_dict(compiled_preprocessor.to_dict())
+    assert np.allclose(restored.transform(dataframe), compiled_preprocessor.transform(dataframe))
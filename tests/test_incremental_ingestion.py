@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from heart_stroke.components.data_ingestion import DataIngestion
+from heart_stroke.components.data_transformation import DataTransformation
+from heart_stroke.entity.artifact_entity import DataIngestionArtifact
+from heart_stroke.entity.config_entity import DataIngestionConfig, DataTransformationConfig
+from heart_stroke.utils.main_utils import read_dataframe
+from tests.test_compiled_preprocessor import make_dataframe
+
+
+def make_feature_store(n_samples: int) -> pd.DataFrame:
+    # rows are appended to the feature store, the rows of a smaller store are the first rows of a larger one
+    dataframe = make_dataframe(2000).iloc[:n_samples]
+    # bmi doubles as the row id in the saved splits, which drop the id column
+    return dataframe.assign(id=np.arange(n_samples), bmi=np.arange(n_samples, dtype=np.float64),
+                            stroke=np.arange(n_samples) % 2)
+
+
+def make_data_ingestion(tmp_path, run: str) -> DataIngestion:
+    ingested_dir = os.path.join(str(tmp_path), run)
+    return DataIngestion(DataIngestionConfig(training_file_path=os.path.join(ingested_dir, "train.parquet"),
+                                             testing_file_path=os.path.join(ingested_dir, "test.parquet"),
+                                             new_training_file_path=os.path.join(ingested_dir, "train_new.parquet")))
+
+
+def split_ids(data_ingestion: DataIngestion):
+    config = data_ingestion.data_ingestion_config
+    return (set(read_dataframe(config.training_file_path)["bmi"]),
+            set(read_dataframe(config.testing_file_path)["bmi"]))
+
+
+def test_split_keeps_the_split_of_every_row_when_rows_are_appended(tmp_path):
+    first_run = make_data_ingestion(tmp_path, "first")
+    assert first_run.split_data_as_train_test(make_feature_store(1000)) is None
+    first_train, first_test = split_ids(first_run)
+
+    second_run = make_data_ingestion(tmp_path, "second")
+    new_trained_file_path = second_run.split_data_as_train_test(make_feature_store(1500), new_rows_start=1000)
+    second_train, second_test = split_ids(second_run)
+
+    assert first_train <= second_train and first_test <= second_test
+    assert 0.15 < len(second_test) / 1500 < 0.25
+    assert set(read_dataframe(new_trained_file_path)["bmi"]) == second_train - first_train
+    assert "id" not in read_dataframe(new_trained_file_path).columns
+
+
+def make_data_transformation(tmp_path, data_ingestion_artifact: DataIngestionArtifact) -> DataTransformation:
+    return DataTransformation(data_ingestion_artifact=data_ingestion_artifact,
+                              data_transformation_config=DataTransformationConfig(
+                                  streaming_stats_file_path=os.path.join(str(tmp_path), "stats.pkl"),
+                                  persistent_streaming_stats_file_path=os.path.join(str(tmp_path), "stats",
+                                                                                    "stats.pkl"),
+                                  incremental_stats=True, fit_chunk_size=300),
+                              data_validation_artifact=None)
+
+
+def ingest(tmp_path, run: str, n_samples: int, previous_watermark, watermark, new_rows_start) -> DataIngestionArtifact:
+    data_ingestion = make_data_ingestion(tmp_path, run)
+    config = data_ingestion.data_ingestion_config
+    new_trained_file_path = data_ingestion.split_data_as_train_test(make_feature_store(n_samples),
+                                                                    new_rows_start=new_rows_start)
+    return DataIngestionArtifact(trained_file_path=config.training_file_path, test_file_path=config.testing_file_path,
+                                 data_fingerprint=run, previous_watermark=previous_watermark, watermark=watermark,
+                                 new_trained_file_path=new_trained_file_path)
+
+
+def accumulate(tmp_path, data_ingestion_artifact: DataIngestionArtifact):
+    data_transformation = make_data_transformation(tmp_path, data_ingestion_artifact)
+    stats = data_transformation.accumulate_streaming_stats(data_ingestion_artifact.trained_file_path)
+    data_transformation.save_streaming_stats(stats)
+    return stats
+
+
+def test_incremental_stats_only_add_the_train_rows_ingested_since_their_watermark(tmp_path):
+    accumulate(tmp_path, ingest(tmp_path, "first", 1000, None, "w1", None))
+    second_artifact = ingest(tmp_path, "second", 1500, "w1", "w2", 1000)
+    stats = accumulate(tmp_path, second_artifact)
+
+    expected = make_data_transformation(tmp_path / "scratch", second_artifact).accumulate_streaming_stats(
+        second_artifact.trained_file_path)
+    train_rows = len(read_dataframe(second_artifact.trained_file_path))
+    assert stats.watermark == "w2"
+    assert stats.n_rows == expected.n_rows == train_rows
+    assert np.isclose(stats.moments["age"].mean, expected.moments["age"].mean)
+    assert stats.category_counts == expected.category_counts
+
+
+def test_incremental_stats_start_from_scratch_when_their_watermark_does_not_match(tmp_path):
+    accumulate(tmp_path, ingest(tmp_path, "first", 1000, None, "w1", None))
+    # the run that ingested up to w2 failed before saving its statistics
+    third_artifact = ingest(tmp_path, "third", 1500, "w2", "w3", 1200)
+    stats = accumulate(tmp_path, third_artifact)
+
+    assert stats.watermark == "w3"
+    assert stats.n_rows == len(read_dataframe(third_artifact.trained_file_path))
@@ -0,0 +1,48 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from heart_stroke.entity.config_entity import MicroBatcherConfig
+from heart_stroke.pipeline.micro_batcher import MicroBatcher
+from heart_stroke.utils.bounded_executor import BoundedExecutor
+
+
+def predict_fn(dataframe: pd.DataFrame) -> list:
+    # fails the whole batch when any of its rows is malformed, like the model does
+    return [float(age) * 2 for age in dataframe["age"]]
+
+
+async def predict_all(micro_batcher: MicroBatcher, ages: list) -> list:
+    try:
+        return await asyncio.gather(*(micro_batcher.predict(pd.DataFrame({"age": [age]})) for age in ages),
+                                    return_exceptions=True)
+    finally:
+        await micro_batcher.stop()
+
+
+def test_malformed_request_fails_alone_in_a_full_batch_under_a_saturated_executor():
+    # a single worker and no queue: every slot of the executor is taken by the batch itself
+    executor = BoundedExecutor(max_workers=1, max_pending=0, name="test-predict")
+    micro_batcher = MicroBatcher(predict_fn, executor,
+                                 MicroBatcherConfig(enabled=True, window_ms=1000, max_batch_size=8,
+                                                    max_queue_size=8))
+    ages = [10, 20, 30, "malformed", 50, 60, 70, 80]
+    try:
+        results = asyncio.run(predict_all(micro_batcher, ages))
+    finally:
+        executor.shutdown()
+
+    assert micro_batcher.metrics.batches == 1
+    assert isinstance(results[3], ValueError)
+    assert [result for index, result in enumerate(results) if index != 3] == \
+        [[2.0 * age] for age in ages if age != "malformed"]
+
+
+def test_predict_each_returns_the_exception_of_each_failed_dataframe():
+    micro_batcher = MicroBatcher(predict_fn, executor=None)
+    results = micro_batcher._predict_each([pd.DataFrame({"age": [1]}), pd.DataFrame({"age": ["malformed"]})])
+
+    assert results[0] == [2.0]
+    with pytest.raises(ValueError):
+        raise results[1]
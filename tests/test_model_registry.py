@@ -0,0 +1,106 @@
+import io
+import json
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+
+from heart_stroke.cloud_storage.aws_storage import ObjectChangedError
+from heart_stroke.entity.model_registry import ModelRegistry
+
+BUCKET_NAME = "bkt-test"
+VERSION = "20240101T000000Z-abcdef12"
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    return ModelRegistry(bucket_name=BUCKET_NAME)
+
+
+def get_object_response(content: dict, etag: str) -> dict:
+    body = json.dumps(content).encode()
+    return {"Body": StreamingBody(io.BytesIO(body), len(body)), "ETag": etag}
+
+
+def version_metadata(version: str) -> dict:
+    return {"version": version,
+            "model_key": f"model-registry/versions/{version}/model.pkl",
+            "portable_model_key": None}
+
+
+def test_put_json_object_sends_conditional_put_parameters(registry):
+    # the stubber validates the parameters against the service model of the installed botocore,
+    # releases without conditional writes reject IfMatch and IfNoneMatch
+    with Stubber(registry.s3.s3_client) as stubber:
+        stubber.add_response("put_object", {"ETag": '"e1"'},
+                             {"Bucket": BUCKET_NAME, "Key": "a.json", "ContentType": "application/json",
+                              "Body": ANY, "IfNoneMatch": "*"})
+        stubber.add_response("put_object", {"ETag": '"e2"'},
+                             {"Bucket": BUCKET_NAME, "Key": "a.json", "ContentType": "application/json",
+                              "Body": ANY, "IfMatch": '"e1"'})
+
+        assert registry.s3.put_json_object({"a": 1}, "a.json", BUCKET_NAME, if_none_match=True) == '"e1"'
+        assert registry.s3.put_json_object({"a": 2}, "a.json", BUCKET_NAME, if_match='"e1"') == '"e2"'
+        stubber.assert_no_pending_responses()
+
+
+@pytest.mark.parametrize("error_code, http_status_code",
+                         [("PreconditionFailed", 412), ("ConditionalRequestConflict", 409)])
+def test_put_json_object_raises_object_changed_on_failed_condition(registry, error_code, http_status_code):
+    with Stubber(registry.s3.s3_client) as stubber:
+        stubber.add_client_error("put_object", service_error_code=error_code, http_status_code=http_status_code,
+                                 expected_params={"Bucket": BUCKET_NAME, "Key": "a.json",
+                                                  "ContentType": "application/json", "Body": ANY,
+                                                  "IfMatch": '"e1"'})
+        with pytest.raises(ObjectChangedError):
+            registry.s3.put_json_object({"a": 1}, "a.json", BUCKET_NAME, if_match='"e1"')
+
+
+def test_promote_creates_the_pointer_only_if_it_does_not_exist(registry):
+    metadata_key = registry.get_version_key(VERSION, "metadata.json")
+    with Stubber(registry.s3.s3_resource.meta.client) as get_stubber, \
+            Stubber(registry.s3.s3_client) as put_stubber:
+        get_stubber.add_response("get_object", get_object_response(version_metadata(VERSION), '"m1"'),
+                                 {"Bucket": BUCKET_NAME, "Key": metadata_key})
+        get_stubber.add_client_error("get_object", service_error_code="NoSuchKey", http_status_code=404,
+                                     expected_params={"Bucket": BUCKET_NAME, "Key": registry.pointer_key})
+        put_stubber.add_response("put_object", {"ETag": '"p1"'},
+                                 {"Bucket": BUCKET_NAME, "Key": registry.pointer_key,
+                                  "ContentType": "application/json", "Body": ANY, "IfNoneMatch": "*"})
+
+        pointer = registry.promote(VERSION)
+        get_stubber.assert_no_pending_responses()
+        put_stubber.assert_no_pending_responses()
+
+    assert pointer["version"] == VERSION
+    assert pointer["history"] == []
+
+
+def test_promote_retries_on_the_pointer_written_by_a_concurrent_promotion(registry):
+    metadata_key = registry.get_version_key(VERSION, "metadata.json")
+    with Stubber(registry.s3.s3_resource.meta.client) as get_stubber, \
+            Stubber(registry.s3.s3_client) as put_stubber:
+        get_stubber.add_response("get_object", get_object_response(version_metadata(VERSION), '"m1"'),
+                                 {"Bucket": BUCKET_NAME, "Key": metadata_key})
+        get_stubber.add_response("get_object", get_object_response({"version": "v1", "history": []}, '"p1"'),
+                                 {"Bucket": BUCKET_NAME, "Key": registry.pointer_key})
+        put_stubber.add_client_error("put_object", service_error_code="PreconditionFailed", http_status_code=412,
+                                     expected_params={"Bucket": BUCKET_NAME, "Key": registry.pointer_key,
+                                                      "ContentType": "application/json", "Body": ANY,
+                                                      "IfMatch": '"p1"'})
+        # a concurrent promotion of v2 won the race, the retry keeps it in the history
+        get_stubber.add_response("get_object",
+                                 get_object_response({"version": "v2", "history": ["v1"]}, '"p2"'),
+                                 {"Bucket": BUCKET_NAME, "Key": registry.pointer_key})
+        put_stubber.add_response("put_object", {"ETag": '"p3"'},
+                                 {"Bucket": BUCKET_NAME, "Key": registry.pointer_key,
+                                  "ContentType": "application/json", "Body": ANY, "IfMatch": '"p2"'})
+
+        pointer = registry.promote(VERSION)
+        get_stubber.assert_no_pending_responses()
+        put_stubber.assert_no_pending_responses()
+
+    assert pointer["version"] == VERSION
+    assert pointer["history"] == ["v1", "v2"]